@@ -0,0 +1,367 @@
+"""
+Response cache for the dashboard and analytics endpoints.
+
+The frontend polls /dashboard/stats and /analytics/* far more often than
+records change, so their results are cached per (endpoint, doctor_id) and
+tagged with the data generation: a counter that every write path bumps right
+after it commits (/predict, batch and bulk import, rescoring, /patients,
+/reset and wipe_data; the group-commit writer bumps it once per committed
+group, before any caller of the group gets its result). A bump is a
+single-row update, and rows of superseded generations are pruned lazily. An entry is only served while its generation is
+current, so a poll never misses a committed write. ANALYTICS_CACHE_TTL also
+bounds an entry's age. That covers writes made behind the app's back and
+date-relative figures that move at midnight.
+
+The generation and the entries live in a small SQLite file shared by every
+uvicorn worker on the host (one file per database, under the temp directory
+unless ANALYTICS_CACHE_PATH is set). A write in one worker invalidates every
+worker's entries, and a result computed by one worker is served by all of
+them. Each worker also keeps the entries it has seen in memory, so a hit costs
+a single read of the generation. Store calls from coroutines run on a worker
+thread (they can wait up to the 5 s busy timeout for another worker's write
+lock), so the event loop never blocks on the cache file.
+
+Concurrent misses for the same key are coalesced. Within a worker they await
+one computation. Across workers the first takes a short lease, and the others
+wait for its entry (or compute themselves if the lease is given up or expires).
+Cache failures never fail a request; the result is just computed uncached.
+
+    python -m backend.analytics_cache stats
+    python -m backend.analytics_cache invalidate    # after editing the database by hand
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+
+from backend.metrics import ANALYTICS_CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL", "300")) # Seconds; 0 disables the cache
+ANALYTICS_CACHE_LEASE_SECONDS = float(os.getenv("ANALYTICS_CACHE_LEASE_SECONDS", "10"))
+ANALYTICS_CACHE_LOCAL_ENTRIES = int(os.getenv("ANALYTICS_CACHE_LOCAL_ENTRIES", "1024"))
+POLL_SECONDS = 0.02
+
+_MISSING = object()
+
+
+def default_path() -> str:
+    """One cache file per database target, shared by the workers of this host."""
+    from backend.database import DB_NAME
+
+    target = os.getenv("DATABASE_URL") or os.path.abspath(DB_NAME)
+    return os.path.join(tempfile.gettempdir(), f"cardioai-analytics-{hashlib.sha1(target.encode()).hexdigest()[:12]}.db")
+
+
+def _encode(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot cache a {type(value).__name__}")
+
+
+class SharedStore:
+    """The generation counter, entries and computing leases in one SQLite file (a connection per thread)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL") # Disposable data: no fsync per commit
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS generation (id INTEGER PRIMARY KEY CHECK (id = 1), value INTEGER NOT NULL);
+                INSERT OR IGNORE INTO generation VALUES (1, 0);
+                CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, generation INTEGER NOT NULL,
+                                                    stored_at REAL NOT NULL, value TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, generation INTEGER NOT NULL,
+                                                   expires_at REAL NOT NULL);
+            """)
+            self._local.conn = conn
+        return conn
+
+    def generation(self) -> int:
+        return self._conn().execute("SELECT value FROM generation WHERE id = 1").fetchone()[0]
+
+    def bump(self) -> int:
+        """
+        Start a new generation. A single-row update: entries and leases of older
+        generations are never served and are pruned by the next save().
+        """
+        return self._conn().execute("UPDATE generation SET value = value + 1 WHERE id = 1 RETURNING value").fetchone()[0]
+
+    def load(self, key: str):
+        """(generation, stored_at, JSON text) of a stored entry, or None."""
+        return self._conn().execute("SELECT generation, stored_at, value FROM entries WHERE key = ?", (key,)).fetchone()
+
+    def save(self, key: str, generation: int, text: str, max_age: float):
+        """Store an entry unless its generation has already been superseded; prune expired and superseded rows."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("""INSERT OR REPLACE INTO entries (key, generation, stored_at, value)
+                            SELECT ?, ?, ?, ? FROM generation WHERE id = 1 AND value = ?""",
+                         (key, generation, now, text, generation))
+            conn.execute("DELETE FROM entries WHERE stored_at < ? OR generation < ?", (now - max_age, generation))
+            conn.execute("DELETE FROM leases WHERE generation < ?", (generation,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def claim(self, key: str, generation: int, lease_seconds: float):
+        """
+        Entry row if another worker stored one meanwhile, else True when this
+        caller now holds the lease to compute (key, generation), False while
+        another worker holds it.
+        """
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT generation, stored_at, value FROM entries WHERE key = ? AND generation = ?",
+                               (key, generation)).fetchone()
+            if row is not None:
+                claimed = row
+            else:
+                conn.execute("DELETE FROM leases WHERE key = ? AND (expires_at < ? OR generation != ?)",
+                             (key, now, generation))
+                claimed = conn.execute("INSERT OR IGNORE INTO leases (key, generation, expires_at) VALUES (?, ?, ?)",
+                                       (key, generation, now + lease_seconds)).rowcount == 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return claimed
+
+    def release(self, key: str, generation: int):
+        self._conn().execute("DELETE FROM leases WHERE key = ? AND generation = ?", (key, generation))
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class AnalyticsCache:
+    """Generation-checked result cache with single-flight misses and per-endpoint hit counters."""
+
+    def __init__(self, path: str = None, ttl_seconds: float = ANALYTICS_CACHE_TTL,
+                 lease_seconds: float = ANALYTICS_CACHE_LEASE_SECONDS, local_entries: int = ANALYTICS_CACHE_LOCAL_ENTRIES):
+        self.path = path
+        self.ttl = float(ttl_seconds)
+        self.lease_seconds = float(lease_seconds)
+        self.local_entries = max(0, int(local_entries))
+        self._store = None
+        self._store_lock = threading.Lock()
+        self._local = OrderedDict() # key -> (generation, stored_at, value); the values are shared, treat them as read-only
+        self._local_lock = threading.Lock()
+        self._inflight = {} # (event loop, key, generation) -> Future of the computation
+        self._counts = {} # endpoint -> {"hit": n, "coalesced": n, "miss": n}
+        self.errors = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    @property
+    def store(self) -> SharedStore:
+        if self._store is None:
+            with self._store_lock:
+                if self._store is None:
+                    self._store = SharedStore(self.path or default_path())
+        return self._store
+
+    @staticmethod
+    def key(endpoint: str, doctor_id=None) -> str:
+        return f"{endpoint}?doctor_id={doctor_id}" if doctor_id is not None else endpoint
+
+    def _try(self, fn, *args):
+        """Run a store operation; on failure log it and return _MISSING (the caller computes uncached)."""
+        try:
+            return fn(*args)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Analytics cache unavailable ({self.store.path}): {e}")
+            return _MISSING
+
+    async def _try_async(self, fn, *args):
+        """_try on a worker thread, so SQLite locking never stalls the event loop."""
+        return await asyncio.to_thread(self._try, fn, *args)
+
+    def _record(self, endpoint: str, result: str):
+        counts = self._counts.setdefault(endpoint, {"hit": 0, "coalesced": 0, "miss": 0})
+        counts[result] += 1
+        ANALYTICS_CACHE_LOOKUPS.inc(endpoint, result)
+
+    def _fresh(self, stored_at: float) -> bool:
+        return time.time() - stored_at < self.ttl
+
+    def _remember(self, key: str, generation: int, stored_at: float, value):
+        if not self.local_entries:
+            return
+        with self._local_lock:
+            self._local[key] = (generation, stored_at, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_entries:
+                self._local.popitem(last=False)
+
+    def _from_row(self, key: str, generation: int, row):
+        """Value of a shared entry row if it belongs to generation and is fresh, else _MISSING."""
+        if row is None or row is _MISSING or row[0] != generation or not self._fresh(row[1]):
+            return _MISSING
+        value = json.loads(row[2])
+        self._remember(key, generation, row[1], value)
+        return value
+
+    async def _lookup(self, key: str, generation: int):
+        with self._local_lock:
+            entry = self._local.get(key)
+        if entry is not None and entry[0] == generation and self._fresh(entry[1]):
+            return entry[2]
+        return self._from_row(key, generation, await self._try_async(self.store.load, key))
+
+    async def get_or_compute(self, endpoint: str, compute, doctor_id=None):
+        """
+        Cached result of `await compute()` for (endpoint, doctor_id). compute must
+        raise on failure (error payloads must not be cached); the result must be
+        JSON-serializable and is returned the same way on a miss and on a hit.
+        """
+        if not self.enabled:
+            return await compute()
+        generation = await self._try_async(self.store.generation)
+        if generation is _MISSING:
+            return await compute()
+        key = self.key(endpoint, doctor_id)
+        value = await self._lookup(key, generation)
+        if value is not _MISSING:
+            self._record(endpoint, "hit")
+            return value
+
+        loop = asyncio.get_running_loop()
+        flight = (loop, key, generation)
+        pending = self._inflight.get(flight)
+        if pending is not None:
+            self._record(endpoint, "coalesced")
+            return await asyncio.shield(pending)
+        future = loop.create_future()
+        future.add_done_callback(lambda f: f.cancelled() or f.exception()) # No "exception never retrieved" noise
+        self._inflight[flight] = future
+        try:
+            value = await self._fill(endpoint, key, generation, compute)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            del self._inflight[flight]
+
+    async def _fill(self, endpoint: str, key: str, generation: int, compute):
+        """Compute a missed key, or wait for the worker that holds its lease to store it."""
+        deadline = time.monotonic() + self.lease_seconds
+        while True:
+            claimed = await self._try_async(self.store.claim, key, generation, self.lease_seconds)
+            if claimed is True or claimed is _MISSING or time.monotonic() > deadline:
+                break
+            if claimed is not False:
+                value = self._from_row(key, generation, claimed)
+                if value is not _MISSING:
+                    self._record(endpoint, "coalesced")
+                    return value
+                break
+            await asyncio.sleep(POLL_SECONDS)
+
+        self._record(endpoint, "miss")
+        try:
+            # Round-trip through JSON so a miss returns exactly what later hits will
+            text = json.dumps(await compute(), default=_encode)
+            value = json.loads(text)
+            await self._try_async(self.store.save, key, generation, text, self.ttl)
+            self._remember(key, generation, time.time(), value)
+            return value
+        finally:
+            if claimed is True:
+                await self._try_async(self.store.release, key, generation)
+
+    def invalidate(self):
+        """Start a new data generation. Call after a write that changes analytics has committed."""
+        if not self.enabled:
+            return
+        with self._local_lock:
+            self._local.clear()
+        if self._try(self.store.bump) is not _MISSING:
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        counts = {endpoint: dict(c) for endpoint, c in list(self._counts.items())}
+        totals = {result: sum(c[result] for c in counts.values()) for result in ("hit", "coalesced", "miss")}
+        lookups = sum(totals.values())
+        for c in counts.values():
+            n = sum(c.values())
+            c["hit_ratio"] = round((c["hit"] + c["coalesced"]) / n, 4) if n else 0.0
+        generation = self._try(self.store.generation) if self.enabled else None
+        return {
+            "enabled": self.enabled,
+            "path": self.store.path if self.enabled else None,
+            "ttl_seconds": self.ttl,
+            "generation": None if generation is _MISSING else generation,
+            "local_entries": len(self._local),
+            **totals,
+            "hit_ratio": round((totals["hit"] + totals["coalesced"]) / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+            "endpoints": counts,
+        }
+
+
+CACHE = AnalyticsCache(os.getenv("ANALYTICS_CACHE_PATH"))
+
+
+def invalidate():
+    """Bump the shared data generation (used by every write path, in and out of the API process)."""
+    CACHE.invalidate()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the shared analytics response cache")
+    parser.add_argument("command", choices=("stats", "invalidate"))
+    args = parser.parse_args(argv)
+
+    store = CACHE.store
+    if args.command == "invalidate":
+        print(f"Analytics cache {store.path}: now at generation {store.bump()}")
+        return 0
+    entries = store._conn().execute("SELECT key, generation, stored_at FROM entries ORDER BY key").fetchall()
+    print(f"Analytics cache {store.path}: generation {store.generation()}, {len(entries)} entries")
+    for key, generation, stored_at in entries:
+        print(f"  {key:<45} generation {generation}, {time.time() - stored_at:.0f}s old")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Async access to the pooled database for `async def` endpoints.
+
+sqlite3 and psycopg2 block, so calling them from a coroutine freezes the
+event loop (and every other request on the worker) for the length of the
+query. Here each query runs on a dedicated DB executor thread with its own
+pooled connection, and the coroutine awaits the result:
+
+    total = await fetchval("SELECT COUNT(*) FROM records WHERE doctor_id = ?", (doctor_id,))
+    patients, records = await asyncio.gather(fetchval(q1), fetchall(q2, params))
+
+Statements go through the same connections (and so the same ? -> %s
+translation and prepared-statement handling) as the synchronous code.
+Independent queries awaited together run concurrently on separate
+connections; under SQLite's WAL mode readers do not block each other.
+The executor is sized like the connection pool, so its threads never queue
+on the pool.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from backend.database import DB_POOL_MAX_SIZE, db_connection
+
+DB_EXECUTOR_THREADS = int(os.getenv("DB_EXECUTOR_THREADS", str(DB_POOL_MAX_SIZE if DB_POOL_MAX_SIZE > 0 else 4)))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max(1, DB_EXECUTOR_THREADS), thread_name_prefix="cardioai-db")
+    return _executor
+
+
+async def run_db(fn, *args, **kwargs):
+    """Run a blocking fn(*args, **kwargs) on the DB executor and await its result."""
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), partial(fn, *args, **kwargs))
+
+
+def _query(sql, params, mode):
+    with db_connection() as conn:
+        cursor = conn.execute(sql, params) if params is not None else conn.execute(sql)
+        if mode == "all":
+            return cursor.fetchall()
+        row = cursor.fetchone()
+        if mode == "one" or row is None:
+            return row
+        return row[0] if not isinstance(row, dict) else next(iter(row.values())) # RealDictCursor rows on Postgres
+
+
+async def fetchall(sql, params=None) -> list:
+    return await run_db(_query, sql, params, "all")
+
+
+async def fetchone(sql, params=None):
+    return await run_db(_query, sql, params, "one")
+
+
+async def fetchval(sql, params=None):
+    """First column of the first row (None if there is no row), e.g. a COUNT(*)."""
+    return await run_db(_query, sql, params, "value")
+
+
+def shutdown():
+    """Stop the executor threads (a later query starts a new executor)."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
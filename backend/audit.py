@@ -4,7 +4,9 @@ Phase 4.5: Compliance & Audit Trail
 """
 import json
 import logging
-from backend.database import get_db_connection
+import time
+from backend.database import db_connection, prepared
+from backend.metrics import AUDIT_LATENCY, AUDIT_ERRORS
 
 logger = logging.getLogger(__name__)
 
@@ -19,14 +21,17 @@ def log_audit(doctor_id: int, action: str, entity: str, entity_id: int = None, d
         entity_id: ID of the entity affected
         details: Additional context as a dictionary
     """
+    started = time.perf_counter()
     try:
-        conn = get_db_connection()
-        conn.execute(
-            "INSERT INTO audit_logs (doctor_id, action, entity, entity_id, details) VALUES (?, ?, ?, ?, ?)",
-            (doctor_id, action, entity, entity_id, json.dumps(details) if details else None)
-        )
-        conn.commit()
-        conn.close()
+        with db_connection() as conn:
+            conn.execute(
+                prepared("INSERT INTO audit_logs (doctor_id, action, entity, entity_id, details) VALUES (?, ?, ?, ?, ?)"),
+                (doctor_id, action, entity, entity_id, json.dumps(details) if details else None)
+            )
+            conn.commit()
         logger.info(f"Audit: {action} on {entity}#{entity_id} by doctor#{doctor_id}")
     except Exception as e:
+        AUDIT_ERRORS.inc()
         logger.error(f"Audit logging failed: {e}")
+    finally:
+        AUDIT_LATENCY.observe(time.perf_counter() - started)
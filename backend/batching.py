@@ -0,0 +1,179 @@
+"""
+Adaptive micro-batching scheduler for single-row model calls.
+
+Concurrent /predict requests (each running in FastAPI's threadpool) hand their
+feature vector to a scheduler thread, which stacks whatever arrived within a
+short window into a matrix, runs a single vectorized model call and fans the
+results back out through futures. Outside start()..stop() (and for requests
+caught in a shutdown) rows are scored inline on the caller's thread, so a
+request never waits on a scheduler that is gone.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the batch-size histogram buckets
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    Collects concurrent scoring requests and evaluates them as one batch.
+
+    The window is adaptive: when the previous batch held a single request and
+    nothing else is queued, a request is dispatched immediately (no added
+    latency when idle). Once concurrency shows up, the scheduler waits up to
+    window_ms for more requests, or until max_batch_size is reached.
+
+    score_fn(matrix) must return a tuple of per-row sequences (e.g. predictions,
+    probabilities); each request's future resolves to the tuple of its row's entries.
+    With threads > 1, that many batches can be in flight at once (used when
+    score_fn hands the work to an out-of-process worker pool).
+    """
+
+    def __init__(self, score_fn, window_ms: float = 2.0, max_batch_size: int = 64, threads: int = 1):
+        self.score_fn = score_fn
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.threads = max(1, int(threads))
+        self._queue = queue.Queue()
+        self._threads = []
+        self._accepting = False # Set by start(), cleared by stop(); guarded by _state_lock
+        self._state_lock = threading.Lock()
+        self._last_batch_size = 1
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+        self._max_batch_seen = 0
+        self._queue_wait_total = 0.0
+        self._size_histogram = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self):
+        if self.running:
+            return
+        with self._state_lock:
+            self._accepting = True
+        self._threads = [
+            threading.Thread(target=self._run, name=f"predict-batcher-{i}", daemon=True)
+            for i in range(self.threads)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Micro-batcher started (window {self.window * 1000:.1f} ms, max batch {self.max_batch_size}, "
+                    f"{self.threads} thread(s))")
+
+    def stop(self, timeout: float = 5.0):
+        """Stop accepting rows, let the scheduler threads finish what is queued, then score any leftovers inline."""
+        with self._state_lock:
+            self._accepting = False # From here on submit() scores inline, so nothing new is queued
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+        alive = sum(thread.is_alive() for thread in self._threads)
+        self._threads = []
+        leftovers = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftovers.append(item)
+        for _ in range(alive):
+            self._queue.put(_STOP) # Threads stuck past the timeout still exit once their batch returns
+        if leftovers:
+            logger.info(f"Micro-batcher stopped with {len(leftovers)} queued requests; scoring them inline")
+            self._evaluate(leftovers)
+
+    def submit(self, features) -> Future:
+        """Queue one feature vector; the future resolves to that row's score_fn outputs."""
+        future = Future()
+        item = (np.asarray(features, dtype=np.float64), future, time.perf_counter())
+        with self._state_lock:
+            if self._accepting:
+                self._queue.put(item)
+                return future
+        self._evaluate([item]) # Not running (or shutting down): score on the caller's thread
+        return future
+
+    def score(self, features, timeout: float = 30.0):
+        return self.submit(features).result(timeout)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            buckets = {f"le_{bound}": count for bound, count in zip(BATCH_SIZE_BUCKETS, self._size_histogram)}
+            buckets["gt_%d" % BATCH_SIZE_BUCKETS[-1]] = self._size_histogram[-1]
+            return {
+                "running": self.running,
+                "window_ms": self.window * 1000,
+                "max_batch_size": self.max_batch_size,
+                "threads": self.threads,
+                "queue_depth": self._queue.qsize(),
+                "requests": self._requests,
+                "batches": self._batches,
+                "avg_batch_size": round(self._requests / self._batches, 2) if self._batches else 0.0,
+                "max_batch_seen": self._max_batch_seen,
+                "avg_queue_wait_ms": round(self._queue_wait_total / self._requests * 1000, 3) if self._requests else 0.0,
+                "batch_size_histogram": buckets,
+            }
+
+    def _collect(self, first):
+        batch = [first]
+        wait = self._last_batch_size > 1 or not self._queue.empty()
+        deadline = time.perf_counter() + (self.window if wait else 0.0)
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP) # Finish this batch, stop on the next loop
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            self._evaluate(self._collect(first))
+
+    def _evaluate(self, batch):
+        """Score a batch and resolve its futures (with the error if score_fn fails)."""
+        started = time.perf_counter()
+        try:
+            outputs = self.score_fn(np.vstack([features for features, _, _ in batch]))
+            for i, (_, future, _) in enumerate(batch):
+                future.set_result(tuple(output[i] for output in outputs))
+        except Exception as e:
+            logger.error(f"Micro-batch scoring failed ({len(batch)} requests): {e}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        self._record(batch, started)
+
+    def _record(self, batch, started: float):
+        size = len(batch)
+        self._last_batch_size = size
+        bucket = next((i for i, bound in enumerate(BATCH_SIZE_BUCKETS) if size <= bound), len(BATCH_SIZE_BUCKETS))
+        with self._stats_lock:
+            self._requests += size
+            self._batches += 1
+            self._max_batch_seen = max(self._max_batch_seen, size)
+            self._queue_wait_total += sum(started - enqueued for _, _, enqueued in batch)
+            self._size_histogram[bucket] += 1
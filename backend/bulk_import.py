@@ -0,0 +1,270 @@
+"""
+Streaming bulk import: score a CSV / NDJSON file of patients and bulk-insert the results.
+
+The upload is consumed as a byte stream and parsed line by line; rows are
+validated, scored and written in fixed-size chunks (one vectorized model call
+and one transaction per chunk), so memory stays flat regardless of file size.
+Progress, per-row errors and a final summary are yielded as events that the
+endpoint streams back as NDJSON.
+"""
+import codecs
+import csv
+import json
+import logging
+import time
+from datetime import datetime
+
+import numpy as np
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+
+from backend import rollups
+from backend.config import FEATURE_COLUMNS, classify_risk_batch
+from backend.database import PostgresCursor
+from backend.utils import generate_system_notes, patient_identity_key, top_contributors
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "ndjson")
+MAX_LINE_BYTES = 64 * 1024 # A single patient row; longer lines are reported, not buffered
+
+RECORD_COLUMNS = ("patient_id", "input_data", "prediction_result", "risk_score", "risk_level",
+                  "doctor_name", "doctor_id", "model_probability", "model_version")
+
+# Find-or-create a patient by identity key; an existing row gets the latest details (shared with /predict)
+UPSERT_PATIENT = """
+    INSERT INTO patients (identity_key, name, age, sex, contact, risk_level, system_notes, last_updated, doctor_name, doctor_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?, ?)
+    ON CONFLICT (identity_key) DO UPDATE SET
+        risk_level = excluded.risk_level, system_notes = excluded.system_notes, last_updated = CURRENT_TIMESTAMP,
+        age = excluded.age, sex = excluded.sex, contact = excluded.contact, doctor_name = excluded.doctor_name
+"""
+
+
+def detect_format(content_type: str, filename: str = None) -> str:
+    content_type = (content_type or "").lower()
+    filename = (filename or "").lower()
+    if "csv" in content_type or filename.endswith(".csv"):
+        return "csv"
+    if "ndjson" in content_type or "jsonlines" in content_type or filename.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    raise ValueError("Unsupported file type: send text/csv or application/x-ndjson (or pass ?format=csv|ndjson)")
+
+
+async def iter_lines(byte_chunks):
+    """Decode an async stream of byte chunks into text lines (UTF-8, BOM tolerated), without buffering the whole body."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in byte_chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+        if len(pending) > MAX_LINE_BYTES:
+            yield pending # Surfaces as a per-row parse error instead of growing without bound
+            pending = ""
+    pending += decoder.decode(b"", final=True)
+    if pending.strip():
+        yield pending.rstrip("\r")
+
+
+def _clean(value):
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+async def iter_records(lines, fmt: str):
+    """Yield (row_number, dict | None, parse_error | None) for every data row (1-based, header excluded)."""
+    header = None
+    row_number = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        if fmt == "csv" and header is None:
+            header = [name.strip() for name in next(csv.reader([line]))]
+            missing = [name for name in FEATURE_COLUMNS + ["name"] if name not in header]
+            if missing:
+                raise ValueError(f"CSV header is missing required columns: {', '.join(missing)}")
+            continue
+        row_number += 1
+        try:
+            if fmt == "csv":
+                values = next(csv.reader([line]))
+                if len(values) != len(header):
+                    raise ValueError(f"expected {len(header)} fields, got {len(values)}")
+                record = dict(zip(header, values))
+            else:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("each line must be a JSON object")
+            yield row_number, {key: _clean(value) for key, value in record.items()}, None
+        except (ValueError, csv.Error) as e:
+            yield row_number, None, f"Could not parse row: {e}"
+
+
+def validation_detail(error: ValidationError) -> str:
+    """One-line summary of a pydantic ValidationError (field: message; ...)"""
+    return "; ".join(f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" if err['loc'] else err['msg']
+                     for err in error.errors())
+
+
+class BulkImporter:
+    """
+    Drives one import: parse -> validate (row_model) -> score (score_fn) -> persist (persist_fn).
+
+    score_fn(matrix) returns (predictions, probabilities, versions, contributions)
+    like the /predict/batch path; persist_fn(write_fn) runs write_fn(cursor) in one
+    committed transaction.
+    """
+
+    def __init__(self, row_model, score_fn, persist_fn, chunk_size: int = 500):
+        self.row_model = row_model
+        self.score_fn = score_fn
+        self.persist_fn = persist_fn
+        self.chunk_size = max(1, int(chunk_size))
+
+    async def run(self, byte_chunks, fmt: str):
+        started = time.perf_counter()
+        totals = {"rows": 0, "scored": 0, "failed": 0, "chunks": 0}
+        chunk = []
+        try:
+            async for row_number, record, parse_error in iter_records(iter_lines(byte_chunks), fmt):
+                totals["rows"] += 1
+                if parse_error is not None:
+                    totals["failed"] += 1
+                    yield {"type": "error", "row": row_number, "detail": parse_error}
+                    continue
+                chunk.append((row_number, record))
+                if len(chunk) >= self.chunk_size:
+                    async for event in self._process(chunk, totals):
+                        yield event
+                    chunk = []
+            if chunk:
+                async for event in self._process(chunk, totals):
+                    yield event
+        except Exception as e:
+            logger.error(f"Bulk import aborted after {totals['rows']} rows: {e}")
+            yield {"type": "fatal", "detail": str(e), **totals}
+            return
+        elapsed = time.perf_counter() - started
+        logger.info(f"Bulk import complete: {totals['scored']} scored, {totals['failed']} failed in {elapsed:.1f}s")
+        yield {"type": "summary", **totals, "elapsed_s": round(elapsed, 3),
+               "rows_per_second": round(totals["rows"] / elapsed, 1) if elapsed > 0 else None}
+
+    async def _process(self, chunk, totals):
+        rows, errors = self._validate(chunk)
+        totals["chunks"] += 1
+        totals["failed"] += len(errors)
+        for row_number, detail in errors:
+            yield {"type": "error", "row": row_number, "detail": detail}
+        if rows:
+            written = await run_in_threadpool(self._score_and_write, rows)
+            totals["scored"] += written
+        yield {"type": "progress", **totals}
+
+    def _validate(self, chunk):
+        rows, errors = [], []
+        for row_number, record in chunk:
+            try:
+                data = self.row_model(**record)
+                features = [float(getattr(data, col)) for col in FEATURE_COLUMNS]
+            except ValidationError as e:
+                errors.append((row_number, f"Invalid input: {validation_detail(e)}"))
+                continue
+            except (ValueError, TypeError) as e:
+                errors.append((row_number, f"Invalid input: {e}"))
+                continue
+            if not np.isfinite(features).all():
+                errors.append((row_number, "NaN or infinite values detected. Please fill all fields."))
+                continue
+            created_at = record.get("created_at")
+            if created_at is not None:
+                try:
+                    created_at = datetime.fromisoformat(str(created_at)).strftime("%Y-%m-%d %H:%M:%S")
+                except ValueError:
+                    errors.append((row_number, f"Invalid created_at '{created_at}' (expected ISO 8601)"))
+                    continue
+            rows.append((data, features, created_at))
+        return rows, errors
+
+    def _score_and_write(self, rows) -> int:
+        matrix = np.asarray([features for _, features, _ in rows], dtype=np.float64)
+        predictions, probabilities, versions, contributions = self.score_fn(matrix)
+        risk_levels = classify_risk_batch(probabilities)
+        scored = [
+            (data, int(predictions[i]), float(probabilities[i]), risk_levels[i],
+             generate_system_notes(risk_levels[i], probabilities[i], data.dict(), top_contributors(contributions[i], features)),
+             versions[i], created_at)
+            for i, (data, features, created_at) in enumerate(rows)
+        ]
+        self.persist_fn(lambda c: insert_scored(c, scored))
+        return len(scored)
+
+
+def insert_scored(c, scored) -> int:
+    """
+    Bulk find-or-create patients (by identity key, like /predict) and insert one
+    record per scored row on an open cursor; the caller owns the transaction.
+    """
+    doctor_ids = {data.doctor_id for data, *_ in scored if data.doctor_id is not None}
+    doctor_names = {}
+    if doctor_ids:
+        placeholders = ",".join("?" * len(doctor_ids))
+        for row in c.execute(f"SELECT id, name FROM doctors WHERE id IN ({placeholders})", tuple(doctor_ids)).fetchall():
+            doctor_names[row["id"]] = row["name"]
+
+    # Latest row per patient wins, as with sequential /predict calls
+    keys = [patient_identity_key(data.name, data.contact) for data, *_ in scored]
+    latest = {}
+    for key, (data, prediction, probability, level, notes, version, created_at) in zip(keys, scored):
+        latest[key] = (data, level, notes)
+    # executemany returns no rows, so ids come from one indexed lookup afterwards
+    c.executemany(
+        UPSERT_PATIENT,
+        [
+            (key, data.name, data.age, data.sex, data.contact, level, notes,
+             doctor_names.get(data.doctor_id, "Dr. Sarah Chen"), data.doctor_id)
+            for key, (data, level, notes) in latest.items()
+        ],
+    )
+    existing = _patient_ids(c, list(latest))
+
+    # Rows without created_at get the column default (the database clock) and land in today's rollup row
+    # (CURRENT_DATE, like /predict); backdated rows carry their own timestamp and day
+    current, backdated = [], []
+    deltas = {}
+    for patient_key, (data, prediction, probability, level, notes, version, created_at) in zip(keys, scored):
+        record_data = data.dict()
+        for key in ("name", "contact", "doctor_id", "created_at"):
+            record_data.pop(key, None)
+        record = (existing[patient_key], json.dumps(record_data), prediction, probability, level,
+                  doctor_names.get(data.doctor_id, "Dr. Sarah Chen"), data.doctor_id, probability, version)
+        if created_at is None:
+            current.append(record)
+        else:
+            backdated.append((*record, created_at))
+        rollups.accumulate(deltas, created_at, data.doctor_id, level, probability)
+
+    for columns, rows in ((RECORD_COLUMNS, current), (RECORD_COLUMNS + ("created_at",), backdated)):
+        if not rows:
+            continue
+        if isinstance(c, PostgresCursor):
+            c.copy_rows("records", columns, rows)
+        else:
+            c.executemany(f"INSERT INTO records ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows)
+    rollups.apply_deltas(c, deltas)
+    return len(scored)
+
+
+def _patient_ids(c, keys) -> dict:
+    """identity key -> patient id"""
+    ids = {}
+    for start in range(0, len(keys), 500): # Stay under SQLite's bound-parameter limit
+        batch = keys[start:start + 500]
+        placeholders = ",".join("?" * len(batch))
+        rows = c.execute(f"SELECT id, identity_key FROM patients WHERE identity_key IN ({placeholders})",
+                         tuple(batch)).fetchall()
+        ids.update((row["identity_key"], row["id"]) for row in rows)
+    return ids
@@ -0,0 +1,137 @@
+"""
+Checksummed model bundle: the compiled forest as raw .npy arrays plus a manifest.
+
+Layout (one directory per model version, registry/<version>/bundle):
+
+    bundle.json      manifest: format, version, feature schema, classes, risk
+                     thresholds, training metrics, per-array SHA-256, checksum
+    meta.json        CompiledForest.save() metadata (max_depth, sizes)
+    feature.npy, threshold.npy, children.npy, values.npy, roots.npy, classes.npy
+    node_delta.npy, bias.npy, paths.npy     attribution arrays (older bundles omit
+                                            them; they are derived on load then)
+
+The arrays are the scaler-folded node arrays of backend.forest, so loading
+needs neither pickle nor scikit-learn and the arrays are memory-mapped
+(workers loading the same bundle share one copy in the page cache). Every
+array is hashed on load and the manifest's feature schema must equal
+FEATURE_COLUMNS, otherwise loading fails with a BundleError. Pickled model
+versions get the same schema check from verify_estimators.
+"""
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+
+from backend.config import FEATURE_COLUMNS, RISK_THRESHOLDS
+from backend.forest import ARRAY_NAMES, DERIVED_ARRAY_NAMES, CompiledForest
+
+FORMAT = "cardioai-forest-bundle"
+FORMAT_VERSION = 1
+MANIFEST_FILE = "bundle.json"
+BUNDLE_DIR = "bundle" # Subdirectory of a registry version
+
+
+class BundleError(Exception):
+    """The bundle is missing, corrupt or incompatible with this server."""
+
+
+class BundleSchemaError(BundleError):
+    """The bundle (or pickled model/scaler pair) was trained on a different feature schema than FEATURE_COLUMNS."""
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _bundle_checksum(manifest: dict) -> str:
+    """Checksum over the array hashes and every field that changes how the arrays are interpreted."""
+    covered = {key: manifest[key] for key in ("format_version", "feature_schema", "classes", "arrays", "max_depth")}
+    return hashlib.sha256(json.dumps(covered, sort_keys=True).encode()).hexdigest()
+
+
+def write_bundle(directory: str, engine: CompiledForest, version: str, metrics: dict = None,
+                 feature_schema=None) -> dict:
+    """Write engine as a bundle into directory (atomically replaced); returns the manifest."""
+    staging_dir = f"{directory}.tmp-{os.getpid()}"
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    engine.save(staging_dir)
+    manifest = {
+        "format": FORMAT,
+        "format_version": FORMAT_VERSION,
+        "version": version,
+        "created_at": datetime.utcnow().isoformat(),
+        "feature_schema": list(feature_schema or FEATURE_COLUMNS),
+        "classes": [int(c) for c in engine.classes],
+        "thresholds": dict(RISK_THRESHOLDS),
+        "n_trees": engine.n_trees,
+        "n_nodes": engine.n_nodes,
+        "max_depth": engine.max_depth,
+        "metrics": metrics or {},
+        "arrays": {name: _file_sha256(os.path.join(staging_dir, f"{name}.npy"))
+                   for name in ARRAY_NAMES + DERIVED_ARRAY_NAMES},
+    }
+    manifest["checksum"] = _bundle_checksum(manifest)
+    with open(os.path.join(staging_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
+    os.rename(staging_dir, directory)
+    return manifest
+
+
+def read_manifest(directory: str) -> dict:
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        raise BundleError(f"No bundle manifest at {path}")
+    with open(path) as f:
+        return json.load(f)
+
+
+def verify_bundle(directory: str) -> dict:
+    """Check format, feature schema and checksums; returns the manifest or raises BundleError."""
+    manifest = read_manifest(directory)
+    if manifest.get("format") != FORMAT or manifest.get("format_version") != FORMAT_VERSION:
+        raise BundleError(f"Unsupported bundle format {manifest.get('format')} v{manifest.get('format_version')} in {directory}")
+    if manifest.get("feature_schema") != FEATURE_COLUMNS:
+        raise BundleSchemaError(
+            f"Bundle {manifest.get('version')} expects features {manifest.get('feature_schema')}, "
+            f"the server sends {FEATURE_COLUMNS}"
+        )
+    for name in ARRAY_NAMES + DERIVED_ARRAY_NAMES:
+        path = os.path.join(directory, f"{name}.npy")
+        if name in DERIVED_ARRAY_NAMES and name not in manifest["arrays"] and not os.path.exists(path):
+            continue # Bundle written before the attribution arrays were persisted
+        if not os.path.exists(path) or _file_sha256(path) != manifest["arrays"].get(name):
+            raise BundleError(f"Bundle {manifest.get('version')}: {name}.npy is missing or does not match its checksum")
+    if _bundle_checksum(manifest) != manifest.get("checksum"):
+        raise BundleError(f"Bundle {manifest.get('version')}: manifest checksum mismatch")
+    return manifest
+
+
+def verify_estimators(model, scaler, source: str = "model"):
+    """
+    The schema check of verify_bundle for pickled model/scaler pairs: both must take
+    len(FEATURE_COLUMNS) features, and feature names recorded at fit time must equal them.
+    """
+    for name, estimator in (("model", model), ("scaler", scaler)):
+        if estimator is None:
+            continue
+        n_features = getattr(estimator, "n_features_in_", None)
+        if n_features is not None and n_features != len(FEATURE_COLUMNS):
+            raise BundleSchemaError(f"{source}: {name} expects {n_features} features, "
+                                    f"the server sends {len(FEATURE_COLUMNS)} ({FEATURE_COLUMNS})")
+        names = getattr(estimator, "feature_names_in_", None)
+        if names is not None and list(names) != FEATURE_COLUMNS:
+            raise BundleSchemaError(f"{source}: {name} expects features {list(names)}, the server sends {FEATURE_COLUMNS}")
+
+
+def load_bundle(directory: str, mmap: bool = True):
+    """Verify and load a bundle; returns (CompiledForest, manifest)."""
+    manifest = verify_bundle(directory)
+    engine = CompiledForest.load(directory, mmap=mmap)
+    return engine, manifest
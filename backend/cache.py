@@ -0,0 +1,97 @@
+"""
+Bounded in-process cache for model predictions.
+
+Entries are keyed by the model version plus the canonicalized 13-feature
+vector, so a different model can never be answered from another model's
+entries. LRU eviction with an optional TTL.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+def canonical_features(features, decimals: int = 6) -> tuple:
+    """Canonical, hashable form of a feature vector (rounded, -0.0 folded into 0.0)."""
+    return tuple(round(float(value), decimals) + 0.0 for value in features)
+
+
+class PredictionCache:
+    """Thread-safe LRU cache with optional per-entry TTL and hit/miss counters."""
+
+    def __init__(self, max_size: int = 4096, ttl_seconds: float = 0.0):
+        self.max_size = max(0, int(max_size))
+        self.ttl = float(ttl_seconds)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def key(self, model_version: str, features) -> tuple:
+        return (model_version,) + canonical_features(features)
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl > 0 else None
+        with self._lock:
+            # Never keep entries for a model that is no longer the active one
+            if self._version is not None and key[0] != self._version:
+                return
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def set_model_version(self, model_version: str):
+        """Drop every entry when the active model changes."""
+        with self._lock:
+            if model_version != self._version:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._version = model_version
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "model_version": self._version,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
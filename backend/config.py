@@ -1,3 +1,5 @@
+import numpy as np
+
 # Risk Classification Configuration
 # Evidence-Based Thresholds for Clinical Decision Support
 
@@ -14,6 +16,29 @@ RISK_THRESHOLDS = {
 # - Based on ROC curve analysis with maximized F1 score
 # - Calibrated for cardiovascular disease prediction models
 
+# Model Feature Schema (column order used at training time)
+FEATURE_COLUMNS = [
+    "age", "sex", "cp", "trestbps", "chol", "fbs", "restecg",
+    "thalach", "exang", "oldpeak", "slope", "ca", "thal"
+]
+
+# Human-readable names used when explaining which features drove a score
+FEATURE_LABELS = {
+    "age": "Age",
+    "sex": "Sex",
+    "cp": "Chest pain type",
+    "trestbps": "Resting blood pressure",
+    "chol": "Serum cholesterol",
+    "fbs": "Fasting blood sugar > 120 mg/dl",
+    "restecg": "Resting ECG",
+    "thalach": "Max heart rate",
+    "exang": "Exercise-induced angina",
+    "oldpeak": "ST depression (oldpeak)",
+    "slope": "ST segment slope",
+    "ca": "Major vessels (fluoroscopy)",
+    "thal": "Thalassemia"
+}
+
 # Risk Level Labels
 RISK_LEVELS = {
     "high": "High",
@@ -44,3 +69,20 @@ def classify_risk(probability: float) -> str:
         return RISK_LEVELS["medium"]
     else:
         return RISK_LEVELS["low"]
+
+def classify_risk_batch(probabilities) -> np.ndarray:
+    """
+    Vectorized version of classify_risk for a batch of model probabilities.
+    
+    Args:
+        probabilities: Array-like of model output probabilities (0.0 - 1.0)
+    
+    Returns:
+        Array of risk levels ("High", "Medium" or "Low"), one per probability
+    """
+    probabilities = np.asarray(probabilities, dtype=float)
+    return np.select(
+        [probabilities > RISK_THRESHOLDS["high"], probabilities > RISK_THRESHOLDS["medium"]],
+        [RISK_LEVELS["high"], RISK_LEVELS["medium"]],
+        default=RISK_LEVELS["low"]
+    ).astype(object)
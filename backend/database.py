@@ -1,30 +1,90 @@
 import sqlite3
 import os
+import io
+import csv
 import json
 import logging
+import threading
+import re
+import time
+from contextlib import contextmanager
+from functools import lru_cache
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_batch
+from backend.metrics import DB_CONNECT_LATENCY
+from backend.pool import ConnectionPool
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_NAME = os.path.join(BASE_DIR, "cardioai.db")
+DB_NAME = os.getenv("CARDIOAI_DB_PATH", os.path.join(BASE_DIR, "cardioai.db")) # Override for benchmarks / scratch databases
+
+# --- SQL Translation ---
+# String literals are copied verbatim, so a '?' inside quotes is not mistaken for a placeholder
+_SQL_TOKENS = re.compile(r"'(?:[^']|'')*'|\?|%")
+
+class PreparedStatement(str):
+    """
+    SQL text that the Postgres adapter runs as a server-side prepared statement
+    (PREPARE once per connection, then EXECUTE). SQLite treats it as plain text;
+    sqlite3 already keeps compiled statements in a per-connection cache.
+    """
+
+_UNPREPARABLE = set() # Statements the server could not prepare (e.g. untyped parameters)
+
+def prepared(sql: str) -> PreparedStatement:
+    """Mark a hot, fully parameterized statement for server-side preparation."""
+    return PreparedStatement(sql)
+
+@lru_cache(maxsize=1024)
+def translate_sql(sql: str, has_params: bool = True) -> str:
+    """SQLite dialect -> psycopg2 text: ? becomes %s and, when parameters are bound, % becomes %%."""
+    def replace(match):
+        token = match.group(0)
+        if token == "?":
+            return "%s"
+        if token == "%":
+            return "%%" if has_params else "%"
+        return token.replace("%", "%%") if has_params else token
+    sql = _SQL_TOKENS.sub(replace, sql)
+    # Handle simple SQLite to Postgres syntax replacements if needed
+    # (Most ANSI SQL is compatible, simple substitutions here)
+    return sql.replace('INTEGER PRIMARY KEY AUTOINCREMENT', 'SERIAL PRIMARY KEY')
+
+@lru_cache(maxsize=256)
+def translate_prepared(sql: str):
+    """SQLite dialect -> PREPARE body: ? becomes $1, $2, ...; returns (body, parameter count)."""
+    count = 0
+    def replace(match):
+        nonlocal count
+        if match.group(0) != "?":
+            return match.group(0)
+        count += 1
+        return f"${count}"
+    return _SQL_TOKENS.sub(replace, sql), count
 
 # --- PostgreSQL Adapter Classes ---
 class PostgresCursor:
-    def __init__(self, cursor):
+    def __init__(self, cursor, connection=None):
         self.cursor = cursor
+        self.connection = connection
 
     def execute(self, sql, params=None):
-        # Convert SQLite ? placeholder to PostgreSQL %s
-        sql = sql.replace('?', '%s')
-        
-        # Handle simple SQLite to Postgres syntax replacements if needed
-        # (Most ANSI SQL is compatible, simple substitutions here)
-        sql = sql.replace('INTEGER PRIMARY KEY AUTOINCREMENT', 'SERIAL PRIMARY KEY')
-        
+        if isinstance(sql, PreparedStatement) and self.connection is not None:
+            statement = self.connection.prepare(self.cursor, sql)
+            if statement is not None:
+                name, placeholders = statement
+                try:
+                    self.cursor.execute(f"EXECUTE {name}{placeholders}", params or None)
+                    return self
+                except Exception as e:
+                    logger.error(f"Postgres Query Error: {e} | Prepared {name}: {sql}")
+                    raise
+
+        # Convert SQLite ? placeholder to PostgreSQL %s (translated once per distinct statement)
+        sql = translate_sql(sql, params is not None)
         try:
             self.cursor.execute(sql, params)
             return self
@@ -32,6 +92,27 @@ class PostgresCursor:
             logger.error(f"Postgres Query Error: {e} | SQL: {sql}")
             raise
 
+    def executemany(self, sql, seq_of_params):
+        sql = translate_sql(sql)
+        try:
+            execute_batch(self.cursor, sql, seq_of_params, page_size=500)
+            return self
+        except Exception as e:
+            logger.error(f"Postgres Query Error: {e} | SQL: {sql}")
+            raise
+
+    def copy_rows(self, table, columns, rows):
+        """Bulk load rows with COPY ... FROM STDIN (CSV); None becomes NULL."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(["\\N" if value is None else value for value in row])
+        buffer.seek(0)
+        self.cursor.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer
+        )
+        return self
+
     def fetchone(self):
         return self.cursor.fetchone()
 
@@ -46,17 +127,40 @@ class PostgresConnection:
         try:
             self.conn = psycopg2.connect(dsn, cursor_factory=RealDictCursor)
             self.row_factory = None # Compatibility marker
+            self.prepared = {} # PreparedStatement text -> (server-side name, EXECUTE argument list)
             logger.info("Connected to PostgreSQL successfully.")
         except Exception as e:
             logger.error(f"Failed to connect to PostgreSQL: {e}")
             raise
 
     def cursor(self):
-        return PostgresCursor(self.conn.cursor())
+        return PostgresCursor(self.conn.cursor(), self)
+
+    def prepare(self, cursor, sql):
+        """PREPARE sql on this session once; returns (name, placeholders), or None if the server refused it."""
+        statement = self.prepared.get(sql)
+        if statement is not None or sql in _UNPREPARABLE:
+            return statement
+        body, count = translate_prepared(sql)
+        name = f"cardioai_stmt_{len(self.prepared) + 1}"
+        # Prepared statements outlive transactions; the savepoint only keeps a failed PREPARE
+        # from aborting the caller's transaction
+        try:
+            cursor.execute(f"SAVEPOINT cardioai_prepare; PREPARE {name} AS {body}; RELEASE SAVEPOINT cardioai_prepare")
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT cardioai_prepare; RELEASE SAVEPOINT cardioai_prepare")
+            logger.warning(f"Could not prepare statement, running it unprepared: {e} | SQL: {body}")
+            _UNPREPARABLE.add(str(sql))
+            return None
+        statement = self.prepared[sql] = (name, f" ({', '.join(['%s'] * count)})" if count else "")
+        return statement
 
     def commit(self):
         self.conn.commit()
 
+    def rollback(self):
+        self.conn.rollback()
+
     def close(self):
         self.conn.close()
 
@@ -67,13 +171,18 @@ class PostgresConnection:
         return cursor
 
 # --- Main Connection Factory ---
-def get_db_connection():
+def open_connection():
+    """Open a new, unpooled connection (Postgres when DATABASE_URL is set, else the local SQLite file)."""
     # Check for Render/Production Database URL
     database_url = os.getenv("DATABASE_URL")
     
+    started = time.perf_counter()
+    
     if database_url:
         try:
-            return PostgresConnection(database_url)
+            conn = PostgresConnection(database_url)
+            DB_CONNECT_LATENCY.observe(time.perf_counter() - started, "postgres")
+            return conn
         except Exception:
             logger.warning("PostgreSQL connection failed, attempting fallback (or raising error if critical)...")
             raise 
@@ -82,252 +191,90 @@ def get_db_connection():
     conn = sqlite3.connect(DB_NAME, timeout=30.0, check_same_thread=False)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA journal_mode=WAL;")
+    DB_CONNECT_LATENCY.observe(time.perf_counter() - started, "sqlite")
     return conn
 
-# --- Initialization Logic ---
-def init_db():
-    conn = get_db_connection()
-    
-    # Check if we are using our Postgres Adapter
-    is_postgres = isinstance(conn, PostgresConnection)
-    
-    if is_postgres:
-        init_postgres_db(conn)
-    else:
-        init_sqlite_db(conn)
+# --- Connection Pool ---
+# DB_POOL_MAX_SIZE=0 disables pooling (every get_db_connection() opens a new connection)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+DB_POOL_MAX_LIFETIME_SECONDS = float(os.getenv("DB_POOL_MAX_LIFETIME_SECONDS", "1800"))
+DB_POOL_HEALTH_CHECK_SECONDS = float(os.getenv("DB_POOL_HEALTH_CHECK_SECONDS", "30")) # Probe connections idle longer than this
 
-def init_postgres_db(conn):
-    logger.info("Initializing PostgreSQL Schema...")
-    c = conn.cursor()
-    
-    # 1. Users
-    c.execute('''CREATE TABLE IF NOT EXISTS users (
-                    id SERIAL PRIMARY KEY,
-                    username VARCHAR(255) UNIQUE NOT NULL,
-                    password_hash VARCHAR(255) NOT NULL,
-                    role VARCHAR(50) DEFAULT 'doctor',
-                    email VARCHAR(255),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )''')
-
-    # 2. Doctors
-    c.execute('''CREATE TABLE IF NOT EXISTS doctors (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(255) NOT NULL,
-                    email VARCHAR(255) UNIQUE,
-                    specialization VARCHAR(255) DEFAULT 'Cardiology',
-                    signature_path TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )''')
-
-    # 3. Patients (Note: Foreign Key syntax)
-    c.execute('''CREATE TABLE IF NOT EXISTS patients (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(255) NOT NULL,
-                    age INTEGER,
-                    sex INTEGER,
-                    contact VARCHAR(255),
-                    status VARCHAR(50) DEFAULT 'Active',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    doctor_name VARCHAR(255) DEFAULT 'Dr. Sarah Chen',
-                    doctor_notes TEXT,
-                    system_notes TEXT,
-                    risk_level VARCHAR(50) DEFAULT 'Unknown',
-                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    doctor_signature TEXT,
-                    doctor_id INTEGER REFERENCES users(id),
-                    is_deleted BOOLEAN DEFAULT FALSE
-                )''')
-
-    # 4. Records
-    c.execute('''CREATE TABLE IF NOT EXISTS records (
-                    id SERIAL PRIMARY KEY,
-                    patient_id INTEGER REFERENCES patients(id),
-                    input_data TEXT,
-                    prediction_result INTEGER,
-                    risk_score REAL,
-                    risk_level VARCHAR(50),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    doctor_name VARCHAR(255) DEFAULT 'Dr. Sarah Chen',
-                    doctor_id INTEGER REFERENCES users(id),
-                    is_deleted BOOLEAN DEFAULT FALSE,
-                    model_probability REAL DEFAULT 0.0
-                )''')
-
-    # 5. Feedbacks
-    c.execute('''CREATE TABLE IF NOT EXISTS feedbacks (
-                    id SERIAL PRIMARY KEY,
-                    patient_id INTEGER REFERENCES patients(id),
-                    name VARCHAR(255),
-                    rating INTEGER,
-                    comment TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )''')
-
-    # 6. Audit Logs
-    c.execute('''CREATE TABLE IF NOT EXISTS audit_logs (
-                    id SERIAL PRIMARY KEY,
-                    doctor_id INTEGER REFERENCES users(id),
-                    action VARCHAR(255) NOT NULL,
-                    entity VARCHAR(255) NOT NULL,
-                    entity_id INTEGER,
-                    details TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )''')
-
-    # Indexes
-    c.execute("CREATE INDEX IF NOT EXISTS idx_patients_doctor_id ON patients(doctor_id)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_records_patient_id ON records(patient_id)")
-    
-    # Seeding Logic (Check if empty then insert)
-    # Using specific count query to avoid errors
-    c.execute("SELECT COUNT(*) as count FROM doctors")
-    result = c.fetchone()
-    if result['count'] == 0:
-        logger.info("Seeding default doctors...")
-        c.execute("INSERT INTO doctors (name, email, specialization) VALUES (?, ?, ?)", 
-                  ('Dr. Sarah Chen', 'sarah.chen@cardioai.com', 'Cardiology'))
-        c.execute("INSERT INTO doctors (name, email, specialization) VALUES (?, ?, ?)", 
-                  ('Dr. Emily Ross', 'emily.ross@cardioai.com', 'Internal Medicine'))
-        c.execute("INSERT INTO doctors (name, email, specialization) VALUES (?, ?, ?)", 
-                  ('Dr. Michael Torres', 'michael.torres@cardioai.com', 'Cardiology'))
-                  
-    # Seed Admin User if not exists
-    c.execute("SELECT COUNT(*) as count FROM users")
-    if c.fetchone()['count'] == 0:
-         logger.info("Seeding default admin user...")
-         # Assuming a hashed password or placeholder logic exists elsewhere, inserting dummy for now or skipping
-         # Skipping user seed to rely on registration or manual setup, or inserting placeholders if strictly needed.
-         pass
+_pools = {}
+_pools_lock = threading.Lock()
 
-    conn.commit()
-    conn.close()
-    logger.info("PostgreSQL Initialization Complete.")
+def _ping(conn):
+    conn.execute("SELECT 1").fetchone()
 
-def init_sqlite_db(conn):
-    c = conn.cursor()
-    
-    # Patients Table
-    c.execute('''CREATE TABLE IF NOT EXISTS patients (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    age INTEGER,
-                    sex INTEGER,
-                    contact TEXT,
-                    status TEXT DEFAULT 'Active',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )''')
-    
-    # Apply Updates/Migrations manually for SQLite (as per original file)
-    migrations = [
-        ("ALTER TABLE patients ADD COLUMN doctor_name TEXT DEFAULT 'Dr. Sarah Chen'", "doctor_name"),
-        ("ALTER TABLE patients ADD COLUMN doctor_notes TEXT", "doctor_notes"),
-        ("ALTER TABLE patients ADD COLUMN system_notes TEXT", "system_notes"),
-        ("ALTER TABLE patients ADD COLUMN risk_level TEXT DEFAULT 'Unknown'", "risk_level"),
-        ("ALTER TABLE patients ADD COLUMN last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP", "last_updated"),
-        ("ALTER TABLE patients ADD COLUMN doctor_signature TEXT", "doctor_signature"),
-        ("ALTER TABLE patients ADD COLUMN doctor_id INTEGER REFERENCES users(id)", "doctor_id"),
-        ("ALTER TABLE patients ADD COLUMN is_deleted BOOLEAN DEFAULT FALSE", "is_deleted"),
-    ]
-    
-    for sql, col_check in migrations:
-        try:
-            c.execute(f"SELECT {col_check} FROM patients LIMIT 1")
-        except sqlite3.OperationalError:
-            c.execute(sql)
-
-    # Records Table
-    c.execute('''CREATE TABLE IF NOT EXISTS records (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    patient_id INTEGER,
-                    input_data TEXT,
-                    prediction_result INTEGER,
-                    risk_score REAL,
-                    risk_level TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (patient_id) REFERENCES patients (id)
-                )''')
-
-    record_migrations = [
-        ("ALTER TABLE records ADD COLUMN doctor_name TEXT DEFAULT 'Dr. Sarah Chen'", "doctor_name"),
-        ("ALTER TABLE records ADD COLUMN doctor_id INTEGER REFERENCES users(id)", "doctor_id"),
-        ("ALTER TABLE records ADD COLUMN is_deleted BOOLEAN DEFAULT FALSE", "is_deleted"),
-        ("ALTER TABLE records ADD COLUMN model_probability REAL DEFAULT 0.0", "model_probability"),
-    ]
-    
-    for sql, col_check in record_migrations:
-        try:
-            c.execute(f"SELECT {col_check} FROM records LIMIT 1")
-        except sqlite3.OperationalError:
-            c.execute(sql)
-
-    # Feedbacks Table
-    c.execute('''CREATE TABLE IF NOT EXISTS feedbacks (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    patient_id INTEGER,
-                    name TEXT,
-                    rating INTEGER,
-                    comment TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )''')
-
-    # Users Table
-    c.execute('''CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    role TEXT DEFAULT 'doctor',
-                    email TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )''')
-    
-    # Doctors Table
-    c.execute('''CREATE TABLE IF NOT EXISTS doctors (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    email TEXT UNIQUE,
-                    specialization TEXT DEFAULT 'Cardiology',
-                    signature_path TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )''')
-    
-    # Seeding Doctors
-    existing_docs = c.execute("SELECT COUNT(*) FROM doctors").fetchone()[0]
-    if existing_docs == 0:
-        c.execute("INSERT INTO doctors (name, email, specialization) VALUES (?, ?, ?)", ('Dr. Sarah Chen', 'sarah.chen@cardioai.com', 'Cardiology'))
-        c.execute("INSERT INTO doctors (name, email, specialization) VALUES (?, ?, ?)", ('Dr. Emily Ross', 'emily.ross@cardioai.com', 'Internal Medicine'))
-        c.execute("INSERT INTO doctors (name, email, specialization) VALUES (?, ?, ?)", ('Dr. Michael Torres', 'michael.torres@cardioai.com', 'Cardiology'))
-
-    # Audit Logs
-    c.execute('''CREATE TABLE IF NOT EXISTS audit_logs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    doctor_id INTEGER NOT NULL,
-                    action TEXT NOT NULL,
-                    entity TEXT NOT NULL,
-                    entity_id INTEGER,
-                    details TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (doctor_id) REFERENCES users(id)
-                )''')
+def get_pool():
+    """The connection pool for the configured database, created on first use (one per process and target)."""
+    target = os.getenv("DATABASE_URL") or DB_NAME
+    key = (os.getpid(), target) # A forked worker must not share its parent's sockets
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool(
+                    open_connection, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE,
+                    timeout=DB_POOL_TIMEOUT_SECONDS, max_lifetime=DB_POOL_MAX_LIFETIME_SECONDS,
+                    health_check_after=DB_POOL_HEALTH_CHECK_SECONDS, check=_ping,
+                    name="postgres" if os.getenv("DATABASE_URL") else "sqlite",
+                )
+    return pool
 
-    conn.commit()
-    conn.close()
-    logger.info("SQLite Database Initialized.")
+def get_db_connection():
+    """Borrow a pooled connection; close() returns it. Prefer `with db_connection() as conn:`."""
+    if DB_POOL_MAX_SIZE <= 0:
+        return open_connection()
+    return get_pool().acquire()
+
+@contextmanager
+def db_connection():
+    """Borrowed connection that goes back to the pool when the block exits, even on an exception."""
+    conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+def pool_stats() -> dict:
+    if DB_POOL_MAX_SIZE <= 0:
+        return {"enabled": False}
+    return {"enabled": True, **get_pool().stats()}
+
+def is_postgres(conn) -> bool:
+    """True for a (pooled or plain) PostgresConnection."""
+    return isinstance(getattr(conn, "raw", conn), PostgresConnection)
+
+# --- Initialization Logic ---
+def init_db():
+    """Bring the schema up to date (backend.migrations); a no-op once it is current."""
+    from backend.migrations import migrate # Lazy: migrations imports this module
+    conn = get_db_connection()
+    try:
+        migrate(conn)
+    finally:
+        conn.close()
 
 def wipe_data():
     conn = get_db_connection()
-    is_postgres = isinstance(conn, PostgresConnection)
     
-    if is_postgres:
+    if is_postgres(conn):
          with conn.conn.cursor() as c:
-            c.execute("TRUNCATE TABLE patients, records, feedbacks RESTART IDENTITY CASCADE")
+            c.execute("TRUNCATE TABLE patients, records, feedbacks, record_daily_stats RESTART IDENTITY CASCADE")
     else:
         c = conn.cursor()
         tables = ['patients', 'records', 'feedbacks']
         for table in tables:
             c.execute(f"DELETE FROM {table}")
             c.execute(f"DELETE FROM sqlite_sequence WHERE name='{table}'")
+        c.execute("DELETE FROM record_daily_stats")
     
     conn.commit()
     conn.close()
+    from backend.analytics_cache import invalidate # Lazy: analytics_cache imports this module
+    invalidate()
     print("All data wiped and counters reset.")
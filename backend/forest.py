@@ -0,0 +1,332 @@
+"""
+Compiled, array-backed inference engine for the trained RandomForest.
+
+The sklearn forest is flattened into contiguous NumPy node arrays (one global
+node index space for all trees) and the StandardScaler is folded into the split
+thresholds, so raw patient features can be scored without a transform step.
+All trees are walked together, one tree level per NumPy step, and class and
+probability come out of the same pass.
+
+Per-feature attributions (Saabas-style): every step from a node to its child
+adds the child's value delta to the parent's split feature, so bias +
+sum(contributions) equals the predicted probability. The sums along every
+root-to-node path are precomputed, so a row's contributions are a gather over
+the leaves it reached, with no extra work per tree level.
+"""
+import json
+import os
+
+import numpy as np
+
+# Node arrays persisted as raw .npy files (memory-mappable)
+ARRAY_NAMES = ["feature", "threshold", "children", "values", "roots", "classes"]
+# Attribution arrays derived from them, persisted too so loading processes map them instead of
+# rebuilding private copies (directories written without them still load; they are derived then)
+DERIVED_ARRAY_NAMES = ["node_delta", "bias", "paths"]
+
+
+class CompiledForest:
+    """
+    Flattened tree ensemble.
+
+    Node arrays (length n_nodes, all trees concatenated):
+        feature:   split feature index (0 for leaves)
+        threshold: split threshold in *raw* feature units (+inf for leaves)
+        children:  length 2 * n_nodes, children[2*i] = left, children[2*i+1] = right
+                   (leaves point back to themselves so extra steps are no-ops)
+        values:    (n_nodes, n_classes) normalized class distribution of each node
+    roots:     index of each tree's root node
+
+    Derived from the node arrays (passed in when loaded from disk, else built here):
+        node_delta: values[node] - values[parent] (zero for roots), credited to the parent's feature
+        paths:      (n_classes, n_features, n_nodes) node_delta summed along each root-to-node path
+        bias:       mean root distribution, the expected value before any split
+    """
+
+    def __init__(self, feature, threshold, children, values, roots, classes, max_depth,
+                 node_delta=None, bias=None, paths=None):
+        self.feature = np.ascontiguousarray(feature, dtype=np.intp)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.children = np.ascontiguousarray(children, dtype=np.intp)
+        self.values = np.ascontiguousarray(values, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.intp)
+        self.classes = np.asarray(classes)
+        self.max_depth = int(max_depth)
+        if node_delta is None or bias is None or paths is None:
+            self._build_deltas()
+        else:
+            # Used as given (no copy), so memory-mapped arrays stay shared
+            self.node_delta, self.bias, self.paths = np.asarray(node_delta), np.asarray(bias), np.asarray(paths)
+
+    def _build_deltas(self):
+        node_ids = np.arange(self.n_nodes)
+        parent = np.full(self.n_nodes, -1, dtype=np.intp)
+        for side in (0, 1):
+            child = self.children[side::2]
+            internal = child != node_ids
+            parent[child[internal]] = node_ids[internal]
+        self.node_delta = np.where((parent >= 0)[:, None], self.values - self.values[parent], 0.0)
+        self.bias = self.values[self.roots].mean(axis=0)
+        # Children inherit their parent's path, plus their own delta on the parent's split feature
+        self.paths = np.zeros((self.values.shape[1], int(self.feature.max(initial=0)) + 1, self.n_nodes))
+        frontier = self.roots
+        while len(frontier):
+            frontier = frontier[self.children[2 * frontier] != frontier]
+            for side in (0, 1):
+                child = self.children[2 * frontier + side]
+                self.paths[:, :, child] = self.paths[:, :, frontier]
+                self.paths[:, self.feature[frontier], child] += self.node_delta[child].T
+            frontier = self.children[np.concatenate([2 * frontier, 2 * frontier + 1])]
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    def apply(self, X) -> np.ndarray:
+        """Return the leaf index reached in every tree, shape (n_rows, n_trees)."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        flat = np.ascontiguousarray(X).ravel()
+        row_offsets = (np.arange(X.shape[0]) * X.shape[1])[:, None]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], self.n_trees))
+        for _ in range(self.max_depth):
+            go_right = flat[row_offsets + self.feature[nodes]] > self.threshold[nodes]
+            nodes = self.children[2 * nodes + go_right]
+        return nodes
+
+    def leaf_probabilities(self, leaves) -> np.ndarray:
+        """Mean class distribution of the leaves reached (apply() output), shape (n_rows, n_classes)."""
+        # One (n_rows, n_trees) gather per class; reducing a gathered (n_rows, n_trees, n_classes)
+        # block over its middle axis is several times slower
+        return np.column_stack([self.values[:, c][leaves].mean(axis=1) for c in range(self.values.shape[1])])
+
+    def predict(self, X):
+        """Return (predicted classes, class probabilities) in a single traversal."""
+        probabilities = self.leaf_probabilities(self.apply(X))
+        return self.classes[probabilities.argmax(axis=1)], probabilities
+
+    def predict_proba(self, X) -> np.ndarray:
+        return self.predict(X)[1]
+
+    def explain(self, X, class_index: int = 1):
+        """
+        Return (predicted classes, class probabilities, contributions) in a single traversal.
+        contributions has shape (n_rows, n_features): each feature's share of the
+        class_index probability, so bias[class_index] + contributions.sum(axis=1)
+        equals probabilities[:, class_index].
+        """
+        leaves, contributions = self.explain_leaves(X, class_index)
+        probabilities = self.leaf_probabilities(leaves)
+        return self.classes[probabilities.argmax(axis=1)], probabilities, contributions
+
+    def explain_leaves(self, X, class_index: int = 1):
+        """explain() before aggregation: (leaf index per row and tree, contributions)."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        leaves = self.apply(X)
+        paths = self.paths[class_index]
+        contributions = np.zeros(X.shape) # Features never split on contribute nothing
+        if len(X) < 64:
+            # Small batches: one gather, the per-call overhead dominates
+            contributions[:, :len(paths)] = paths[:, leaves].mean(axis=2).T
+        else:
+            # Large batches: one contiguous gather per feature reduces far faster
+            for f, path in enumerate(paths):
+                contributions[:, f] = path[leaves].mean(axis=1)
+        return leaves, contributions
+
+    def tree_range(self, start: int, stop: int) -> "CompiledForest":
+        """
+        Trees start..stop-1 as a forest of their own. Trees occupy contiguous node ranges,
+        so the node arrays are sliced; child and root indices are shifted to the slice.
+        """
+        start, stop = max(0, int(start)), min(int(stop), self.n_trees)
+        if start >= stop:
+            raise ValueError(f"Empty tree range {start}..{stop} of {self.n_trees} trees")
+        first = self.roots[start]
+        end = self.roots[stop] if stop < self.n_trees else self.n_nodes
+        children = self.children[2 * first:2 * end] - first
+        roots = self.roots[start:stop] - first
+        # Depth of the subset: follow internal nodes level by level until only leaves remain
+        frontier, depth = roots, 0
+        while True:
+            frontier = frontier[children[2 * frontier] != frontier]
+            if not len(frontier):
+                break
+            frontier = np.concatenate([children[2 * frontier], children[2 * frontier + 1]])
+            depth += 1
+        # Deltas and paths never cross a tree boundary, so they slice too (views, no copies)
+        return CompiledForest(self.feature[first:end], self.threshold[first:end], children, self.values[first:end],
+                              roots, self.classes, depth, node_delta=self.node_delta[first:end],
+                              bias=self.values[first + roots].mean(axis=0), paths=self.paths[:, :, first:end])
+
+    def save(self, directory: str):
+        """Write the node and attribution arrays as .npy files plus a small meta.json."""
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAY_NAMES + DERIVED_ARRAY_NAMES:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name), allow_pickle=False)
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({"max_depth": self.max_depth, "n_trees": self.n_trees, "n_nodes": self.n_nodes}, f)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "CompiledForest":
+        """
+        Load arrays written by save(). With mmap=True the arrays are read-only views
+        of the files, so every process loading the same directory shares one copy
+        through the OS page cache.
+        """
+        mode = "r" if mmap else None
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode, allow_pickle=False)
+            for name in ARRAY_NAMES + DERIVED_ARRAY_NAMES
+            if name in ARRAY_NAMES or os.path.exists(os.path.join(directory, f"{name}.npy"))
+        }
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        return cls(max_depth=meta["max_depth"], **arrays)
+
+
+def compile_forest(model, scaler=None) -> CompiledForest:
+    """
+    Flatten a fitted RandomForestClassifier (single output) into a CompiledForest.
+
+    If a fitted StandardScaler is given, its mean/scale are folded into the
+    thresholds: (x - mean) / scale <= t  <=>  x <= t * scale + mean  (scale > 0),
+    adjusted to the exact raw boundary (see fold_thresholds).
+    """
+    n_features = model.n_features_in_
+    mean = np.zeros(n_features)
+    scale = np.ones(n_features)
+    if scaler is not None:
+        if getattr(scaler, "mean_", None) is not None and getattr(scaler, "with_mean", True):
+            mean = np.asarray(scaler.mean_, dtype=np.float64)
+        if getattr(scaler, "scale_", None) is not None and getattr(scaler, "with_std", True):
+            scale = np.asarray(scaler.scale_, dtype=np.float64)
+
+    features, thresholds, children, values, roots = [], [], [], [], []
+    max_depth = 0
+    offset = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n = tree.node_count
+        is_leaf = tree.children_left == -1
+        node_ids = np.arange(n) + offset
+
+        feature = np.where(is_leaf, 0, tree.feature)
+        threshold = np.where(is_leaf, np.inf, tree.threshold) # Scaled units until folded below
+        left = np.where(is_leaf, node_ids, tree.children_left + offset)
+        right = np.where(is_leaf, node_ids, tree.children_right + offset)
+
+        value = tree.value[:, 0, :].astype(np.float64)
+        totals = value.sum(axis=1, keepdims=True)
+        value = np.divide(value, totals, out=np.zeros_like(value), where=totals > 0)
+
+        features.append(feature)
+        thresholds.append(threshold)
+        children.append(np.column_stack([left, right]).ravel())
+        values.append(value)
+        roots.append(offset)
+        max_depth = max(max_depth, tree.max_depth)
+        offset += n
+
+    feature = np.concatenate(features)
+    threshold = np.concatenate(thresholds)
+    split = np.isfinite(threshold)
+    threshold[split] = fold_thresholds(threshold[split], mean[feature[split]], scale[feature[split]])
+    return CompiledForest(
+        feature=feature,
+        threshold=threshold,
+        children=np.concatenate(children),
+        values=np.concatenate(values),
+        roots=np.array(roots),
+        classes=model.classes_,
+        max_depth=max_depth,
+    )
+
+
+def _float_key(x: np.ndarray) -> np.ndarray:
+    """Map float64 values to int64 keys in the same order (adjacent floats get adjacent keys)."""
+    bits = np.asarray(x, dtype=np.float64).view(np.int64)
+    return bits ^ ((bits >> 63) & np.int64(0x7FFFFFFFFFFFFFFF))
+
+
+def _key_float(key: np.ndarray) -> np.ndarray:
+    key = np.asarray(key, dtype=np.int64)
+    return (key ^ ((key >> 63) & np.int64(0x7FFFFFFFFFFFFFFF))).view(np.float64)
+
+
+def fold_thresholds(threshold, mean, scale) -> np.ndarray:
+    """
+    Raw-unit thresholds T with  x <= T  <=>  float32((x - mean) / scale) <= threshold
+    for every float64 x, which is the comparison sklearn makes after the scaler.
+
+    t * scale + mean is within a few ulps of T, but raw inputs are often integers that
+    land exactly on it (37.0 for a split between 36.5 and 37.5 scaled back), and there
+    the rounding of the two sides decides the branch. The scaled-and-cast value is
+    monotone in x, so T is found by bisecting float64 bit patterns around the estimate.
+    """
+    threshold = np.asarray(threshold, dtype=np.float64)
+    mean = np.broadcast_to(np.asarray(mean, dtype=np.float64), threshold.shape)
+    scale = np.broadcast_to(np.asarray(scale, dtype=np.float64), threshold.shape)
+
+    def goes_left(x):
+        return ((x - mean) / scale).astype(np.float32) <= threshold
+
+    estimate = threshold * scale + mean
+    slack = (np.abs(estimate) + scale) * 1e-5
+    lo, hi = _float_key(estimate - slack), _float_key(estimate + slack)
+    if not (goes_left(_key_float(lo)).all() and not goes_left(_key_float(hi)).any()):
+        raise ValueError("Split threshold could not be folded into raw feature units")
+    # Invariant: lo goes left, hi goes right
+    while (hi - lo > 1).any():
+        mid = lo + (hi - lo) // 2
+        left = goes_left(_key_float(mid))
+        lo = np.where(left, mid, lo)
+        hi = np.where(left, hi, mid)
+    return _key_float(lo)
+
+
+def max_probability_error(engine: CompiledForest, model, scaler, X) -> float:
+    """Largest absolute difference between engine and sklearn probabilities on X."""
+    X = np.asarray(X, dtype=np.float64)
+    scaled = scaler.transform(X) if scaler is not None else X
+    return float(np.abs(engine.predict_proba(X) - model.predict_proba(scaled)).max())
+
+
+def probe_matrix(scaler, n_features: int, n_rows: int = 256, seed: int = 0) -> np.ndarray:
+    """Synthetic continuous feature rows spread around the training distribution."""
+    rng = np.random.default_rng(seed)
+    mean = getattr(scaler, "mean_", None)
+    scale = getattr(scaler, "scale_", None)
+    mean = np.zeros(n_features) if mean is None else mean
+    scale = np.ones(n_features) if scale is None else scale
+    return mean + rng.normal(size=(n_rows, n_features)) * scale * 1.5
+
+
+def verification_matrix(engine: CompiledForest, scaler, n_features: int, seed: int = 0) -> np.ndarray:
+    """
+    Probe rows for checking a compiled forest against sklearn: continuous rows, the same
+    rows on the integer and one-decimal grids raw inputs actually use, and for every split
+    a row exactly at the folded threshold, one just above it and one at the naive
+    t * scale + mean estimate, where float32 rounding decides the branch.
+    """
+    continuous = probe_matrix(scaler, n_features, seed=seed)
+    split = np.isfinite(engine.threshold)
+    pairs = np.unique(np.column_stack([engine.feature[split], engine.threshold[split]]), axis=0)
+    features = pairs[:, 0].astype(np.intp)
+    at = pairs[:, 1]
+    above = np.nextafter(at, np.inf)
+    naive = np.round(at, 6) # Raw thresholds are midpoints of few-decimal training values
+    rows = np.arange(len(pairs))
+    boundary = []
+    for values in (at, above, naive):
+        block = probe_matrix(scaler, n_features, n_rows=len(pairs), seed=seed + 1)
+        block[rows, features] = values
+        boundary.append(block)
+    return np.vstack([continuous, np.round(continuous), np.round(continuous, 1), *boundary])
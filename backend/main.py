@@ -1,27 +1,45 @@
-from fastapi import FastAPI, HTTPException, Depends, Query, Request
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, BackgroundTasks, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr
-import pickle
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, EmailStr, ValidationError
 import numpy as np
 import os
 import json
+import hmac
 import logging
-from typing import List, Optional
+from typing import Any, List, Optional
 import traceback
 import threading
 import time
+import asyncio
 import sqlite3
-from backend.database import init_db, wipe_data, get_db_connection
+import shutil
+import tempfile
+from backend.database import init_db, wipe_data, get_db_connection, db_connection, is_postgres, pool_stats, prepared
+from backend.pool import PoolTimeoutError
 from backend.audit import log_audit
+from backend import analytics_cache, async_db, rollups
 
 # Global Database Lock for SQLite Concurrency
 db_lock = threading.Lock()
-from backend.utils import generate_system_notes
+from backend.utils import generate_system_notes, patient_identity_key, top_contributors
+from backend.registry import ModelRegistry
+from backend.batching import MicroBatcher
+from backend.cache import PredictionCache
+from backend.workers import InferencePool
+from backend.persistence import GroupCommitWriter, DatabaseBusyError, write_with_retry
+from backend.bulk_import import BulkImporter, FORMATS, UPSERT_PATIENT, detect_format, validation_detail
+from backend.rescore import Rescorer
+from backend.cascade import DEFAULT_FIRST_TREES, DEFAULT_MARGIN, DEFAULT_MIN_ROWS, DEFAULT_Z, record_tiers
+from backend.bundle import BundleError
+from backend.metrics import (REGISTRY as METRICS, REQUESTS, REQUEST_ERRORS, REQUEST_LATENCY,
+                             PREDICT_STAGE_LATENCY)
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from backend.config import RISK_THRESHOLDS, classify_risk
+from backend.config import RISK_THRESHOLDS, FEATURE_COLUMNS, classify_risk, classify_risk_batch
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
@@ -44,6 +62,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request Metrics (route template labels keep cardinality bounded: /patients/{patient_id}/records)
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        REQUEST_LATENCY.observe(time.perf_counter() - started, path, request.method)
+        REQUESTS.inc(path, request.method, str(status))
+        if status >= 500:
+            REQUEST_ERRORS.inc(path, request.method)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
 # Health Check & DB Diagnostic
 @app.get("/health")
 def health_check():
@@ -52,24 +92,66 @@ def health_check():
 @app.get("/health/db")
 def db_diagnostic():
     """Diagnostic endpoint to verify active database type"""
-    conn = get_db_connection()
-    db_type = "PostgreSQL" if hasattr(conn, 'conn') else "SQLite" # PostgresConnection has 'conn' attr
-    if hasattr(conn, 'close'):
-        conn.close()
+    with db_connection() as conn:
+        db_type = "PostgreSQL" if is_postgres(conn) else "SQLite"
     return {
         "database_type": db_type,
         "locking_mode": "Row-Level (No Locking)" if db_type == "PostgreSQL" else "File-Based (Locked)",
-        "worker_process": os.getpid()
+        "worker_process": os.getpid(),
+        "pool": pool_stats()
     }
 
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    logger.warning(f"{request.url.path}: {exc}")
+    return JSONResponse(status_code=503, content={"detail": "Database busy. Please try again."})
+
 # Load Model and Scaler (Absolute Paths)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODELS_DIR = os.path.join(BASE_DIR, 'models')
 MODEL_PATH = os.path.join(MODELS_DIR, "heart_model.pkl")
 SCALER_PATH = os.path.join(MODELS_DIR, "scaler.pkl")
 
-model = None
-scaler = None
+# Compiled inference is verified against sklearn at load time; disable with COMPILED_INFERENCE=false
+COMPILED_INFERENCE = os.getenv("COMPILED_INFERENCE", "true").lower() == "true"
+
+# Cascade inference (off by default): the first CASCADE_TREES trees answer rows that are clearly away from
+# the risk thresholds, only the rest run the full forest. Check agreement first with `python -m backend.cascade`.
+CASCADE_INFERENCE = os.getenv("CASCADE_INFERENCE", "false").lower() == "true"
+CASCADE_SETTINGS = {
+    "first_trees": int(os.getenv("CASCADE_TREES", str(DEFAULT_FIRST_TREES))),
+    "margin": float(os.getenv("CASCADE_MARGIN", str(DEFAULT_MARGIN))),
+    "z": float(os.getenv("CASCADE_Z", str(DEFAULT_Z))),
+    "min_rows": int(os.getenv("CASCADE_MIN_ROWS", str(DEFAULT_MIN_ROWS))) # Smaller batches use the full forest
+} if CASCADE_INFERENCE else None
+
+# Versioned model registry; the active LoadedModel is swapped atomically on activation/rollback.
+# MODEL_REGISTRY_WATCH_SECONDS > 0 also follows manifest changes made by other processes / the CLI.
+registry = ModelRegistry(legacy_model_path=MODEL_PATH, legacy_scaler_path=SCALER_PATH, compiled=COMPILED_INFERENCE,
+                         cascade=CASCADE_SETTINGS)
+MODEL_REGISTRY_WATCH_SECONDS = float(os.getenv("MODEL_REGISTRY_WATCH_SECONDS", "0"))
+
+# Micro-batching of concurrent /predict calls (PREDICT_BATCH_WINDOW_MS=0 disables it)
+PREDICT_BATCH_WINDOW_MS = float(os.getenv("PREDICT_BATCH_WINDOW_MS", "2"))
+PREDICT_MAX_BATCH = int(os.getenv("PREDICT_MAX_BATCH", "64"))
+
+# Optional out-of-process scoring: N workers memory-map the compiled forest (0 = score in-process)
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "0"))
+INFERENCE_ARTIFACT_DIR = os.getenv("INFERENCE_ARTIFACT_DIR", os.path.join(MODELS_DIR, "compiled"))
+inference_pool = None
+
+# Group commit of prediction writes (WRITE_GROUP_DELAY_MS=0 writes synchronously per request)
+WRITE_GROUP_DELAY_MS = float(os.getenv("WRITE_GROUP_DELAY_MS", "5"))
+WRITE_GROUP_MAX_SIZE = int(os.getenv("WRITE_GROUP_MAX_SIZE", "64"))
+WRITE_TIMEOUT_S = float(os.getenv("WRITE_TIMEOUT_S", "60")) # Longest a request waits for its group; then 503
+writer = GroupCommitWriter(get_db_connection, lock=db_lock, max_group_size=WRITE_GROUP_MAX_SIZE,
+                           max_delay_ms=WRITE_GROUP_DELAY_MS, on_commit=analytics_cache.invalidate)
+
+# Prediction cache keyed by (model version, feature vector); size 0 disables, TTL 0 = no expiry
+prediction_cache = PredictionCache(
+    max_size=int(os.getenv("PREDICTION_CACHE_SIZE", "4096")),
+    ttl_seconds=float(os.getenv("PREDICTION_CACHE_TTL", "0"))
+)
 
 # Rate Limiting for Login
 login_attempts = {}
@@ -125,6 +207,18 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
 
+async def require_admin(current_user: dict = Depends(get_current_user),
+                        x_admin_password: Optional[str] = Header(None)):
+    """
+    Model and rescore administration: a signed-in user who also presents the master
+    password (ADMIN_PASSWORD, the credential /reset checks) in the X-Admin-Password header.
+    """
+    master_password = os.getenv("ADMIN_PASSWORD", "Mounib$7")
+    if not x_admin_password or not hmac.compare_digest(x_admin_password.encode(), master_password.encode()):
+        logger.warning(f"Admin request by {current_user['username']} blocked: missing or wrong admin password")
+        raise HTTPException(status_code=403, detail="Admin password required (X-Admin-Password header)")
+    return current_user
+
 @app.post("/pin-login")
 def pin_login(data: PinRequest):
     if data.pin != ACCESS_PIN:
@@ -142,9 +236,89 @@ def pin_login(data: PinRequest):
         "name": "Doctor"
     }
 
+def start_inference_pool(loaded):
+    """Publish the compiled forest as memory-mappable arrays and start the worker processes."""
+    global inference_pool
+    if INFERENCE_WORKERS <= 0 or loaded.engine is None:
+        return
+    # Bundles are already memory-mappable arrays; pickle-loaded versions are published on first use
+    artifact_dir = loaded.artifact_dir or os.path.join(INFERENCE_ARTIFACT_DIR, loaded.version)
+    try:
+        if not os.path.exists(os.path.join(artifact_dir, "meta.json")):
+            # Write to a staging dir and rename, so concurrent processes never see a partial artifact
+            staging_dir = f"{artifact_dir}.tmp-{os.getpid()}"
+            loaded.engine.save(staging_dir)
+            try:
+                os.rename(staging_dir, artifact_dir)
+            except OSError:
+                shutil.rmtree(staging_dir, ignore_errors=True) # Another process published it first
+        pool = InferencePool(artifact_dir, INFERENCE_WORKERS, version=loaded.version, cascade=CASCADE_SETTINGS)
+        pool.start()
+    except Exception as e:
+        logger.error(f"Inference pool unavailable, scoring in-process: {e}")
+        return
+    old_pool, inference_pool = inference_pool, pool
+    if old_pool is not None:
+        old_pool.stop()
+
+def on_model_activated(loaded):
+    """Registry hook: runs after every swap (startup, activation, rollback)."""
+    prediction_cache.set_model_version(loaded.version)
+    start_inference_pool(loaded)
+
+registry.on_activate(on_model_activated)
+
+def score_features(matrix: np.ndarray):
+    """
+    Return (predicted classes, heart disease probabilities, model versions, feature contributions)
+    for a raw feature matrix. Contributions are rows of per-feature probability shares (None
+    without the compiled engine). The whole matrix is scored by one model version, even if a
+    swap happens meanwhile.
+    """
+    active = registry.current
+    versions = np.full(len(matrix), active.version, dtype=object)
+    pool = inference_pool
+    if pool is not None and pool.version == active.version:
+        try:
+            predictions, probabilities, contributions, early = pool.predict(matrix)
+            record_tiers(early)
+            return predictions, probabilities[:, 1], versions, contributions
+        except Exception as e:
+            logger.error(f"Inference worker failed, scoring in-process: {e}")
+    predictions, probabilities, contributions = active.explain(matrix)
+    if contributions is None:
+        contributions = [None] * len(matrix)
+    return predictions, probabilities[:, 1], versions, contributions
+
+def score_one(features: List[float]):
+    """Score a single feature vector, through the micro-batcher when it is running."""
+    if batcher.running:
+        return batcher.score(features)
+    predictions, probabilities, versions, contributions = score_features(np.array([features]))
+    return predictions[0], probabilities[0], versions[0], contributions[0]
+
+# One scheduler thread per inference worker so every worker can have a batch in flight
+batcher = MicroBatcher(score_features, window_ms=PREDICT_BATCH_WINDOW_MS, max_batch_size=PREDICT_MAX_BATCH,
+                       threads=max(1, INFERENCE_WORKERS))
+
+# Serving-path gauges/counters, read from the components' own stats at scrape time
+METRICS.callback("cardioai_batcher_queue_depth", "Requests waiting for the micro-batcher", lambda: batcher.stats()["queue_depth"])
+METRICS.callback("cardioai_batcher_requests_total", "Requests scored through the micro-batcher", lambda: batcher.stats()["requests"], "counter")
+METRICS.callback("cardioai_batcher_batches_total", "Micro-batches evaluated", lambda: batcher.stats()["batches"], "counter")
+METRICS.callback("cardioai_prediction_cache_hits_total", "Prediction cache hits", lambda: prediction_cache.hits, "counter")
+METRICS.callback("cardioai_prediction_cache_misses_total", "Prediction cache misses", lambda: prediction_cache.misses, "counter")
+METRICS.callback("cardioai_prediction_cache_entries", "Entries in the prediction cache", lambda: prediction_cache.stats()["size"])
+METRICS.callback("cardioai_writer_queue_depth", "Writes waiting for the group-commit writer", lambda: writer.stats()["queue_depth"])
+METRICS.callback("cardioai_writer_jobs_total", "Writes committed through the group-commit writer", lambda: writer.stats()["jobs"], "counter")
+METRICS.callback("cardioai_writer_groups_total", "Group commits performed", lambda: writer.stats()["groups"], "counter")
+METRICS.callback("cardioai_analytics_cache_generation", "Current analytics data generation (bumped by every write)", lambda: analytics_cache.CACHE.stats()["generation"])
+METRICS.callback("cardioai_db_pool_connections", "Open pooled database connections", lambda: pool_stats().get("size"))
+METRICS.callback("cardioai_db_pool_in_use", "Pooled database connections currently borrowed", lambda: pool_stats().get("in_use"))
+METRICS.callback("cardioai_db_pool_waiting", "Threads waiting for a pooled database connection", lambda: pool_stats().get("waiting"))
+METRICS.callback("cardioai_db_pool_timeouts_total", "Borrows that timed out waiting for a connection", lambda: pool_stats().get("timeouts"), "counter")
+
 @app.on_event("startup")
 async def startup_event():
-    global model, scaler
     init_db()
     
     # SEED DEFAULT ADMIN USER
@@ -170,17 +344,119 @@ async def startup_event():
         logger.error(f"Error seeding admin: {e}")
 
     try:
-        if not os.path.exists(MODEL_PATH) or not os.path.exists(SCALER_PATH):
-            logger.error(f"Model files not found at {MODELS_DIR}")
-        else:
-            with open(MODEL_PATH, "rb") as f:
-                model = pickle.load(f)
-            with open(SCALER_PATH, "rb") as f:
-                scaler = pickle.load(f)
-            logger.info(f"Model loaded successfully from {MODEL_PATH}")
+        loaded = registry.load_active()
+        logger.info(f"Model loaded successfully from {loaded.source} (version {loaded.version})")
+        registry.start_watcher(MODEL_REGISTRY_WATCH_SECONDS)
+        if PREDICT_BATCH_WINDOW_MS > 0:
+            batcher.start()
+    except BundleError as e:
+        # A corrupt bundle or one trained on another feature schema must never serve
+        logger.critical(f"Refusing to start: {e}")
+        raise
     except Exception as e:
         logger.error(f"CRITICAL ERROR loading model: {e}")
 
+    if WRITE_GROUP_DELAY_MS > 0:
+        writer.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    registry.stop_watcher()
+    if rescorer is not None:
+        rescorer.stop()
+    batcher.stop()
+    writer.stop()
+    if inference_pool is not None:
+        inference_pool.stop()
+    async_db.shutdown()
+
+@app.get("/health/inference")
+def inference_diagnostic():
+    """Diagnostic endpoint for the prediction path (model, engine, micro-batcher, cache, writer)"""
+    active = registry.current
+    return {
+        "model_loaded": active is not None,
+        "model": active.describe() if active is not None else None,
+        "batcher": batcher.stats(),
+        "workers": inference_pool.stats() if inference_pool is not None else None,
+        "cache": prediction_cache.stats(),
+        "writer": writer.stats()
+    }
+
+@app.get("/health/analytics-cache")
+def analytics_cache_diagnostic():
+    """Analytics response cache: data generation and hit ratios per endpoint"""
+    return analytics_cache.CACHE.stats()
+
+# --- Model Registry Administration ---
+def activate_model_in_background(version: str):
+    try:
+        registry.activate(version)
+    except Exception as e:
+        logger.error(f"Activation of model {version} failed: {e}")
+
+@app.get("/admin/models")
+def list_model_versions(current_user: dict = Depends(require_admin)):
+    """Registered model versions, the active/previous ones and the last activation status"""
+    return registry.list_versions()
+
+@app.post("/admin/models/{version}/activate", status_code=202)
+def activate_model_version(version: str, background_tasks: BackgroundTasks, current_user: dict = Depends(require_admin)):
+    """Load and warm a model version in the background, then swap it in atomically"""
+    if not registry.has_version(version):
+        raise HTTPException(status_code=404, detail=f"Model version '{version}' not found")
+    background_tasks.add_task(activate_model_in_background, version)
+    logger.info(f"Model activation requested by {current_user['username']}: {version}")
+    return {"message": "Activation started; poll /admin/models for its status", "version": version}
+
+@app.post("/admin/models/rollback")
+def rollback_model_version(current_user: dict = Depends(require_admin)):
+    """Instantly swap back to the previously active model version"""
+    try:
+        loaded = registry.rollback()
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    logger.info(f"Model rollback by {current_user['username']}: now serving {loaded.version}")
+    return {"message": "Rolled back", "model": loaded.describe()}
+
+# --- Offline Rescoring (after a model change) ---
+RESCORE_CHUNK_SIZE = int(os.getenv("RESCORE_CHUNK_SIZE", "1000"))
+RESCORE_MAX_DUTY = float(os.getenv("RESCORE_MAX_DUTY", "0.5")) # Fraction of time the job may keep the DB busy
+rescorer = None
+rescore_thread = None
+
+def run_rescorer(job):
+    try:
+        job.run()
+    except Exception as e:
+        logger.error(f"Rescoring failed: {e}")
+
+@app.post("/admin/rescore", status_code=202)
+def start_rescore(current_user: dict = Depends(require_admin)):
+    """Rescore stored records with the serving model in a throttled, resumable background job"""
+    global rescorer, rescore_thread
+    if rescore_thread is not None and rescore_thread.is_alive():
+        raise HTTPException(status_code=409, detail="Rescoring is already running")
+    active = registry.current
+    if active is None:
+        raise HTTPException(status_code=500, detail="Model service unavailable - check server logs for loading errors")
+    rescorer = Rescorer(active, write_fn=persist, chunk_size=RESCORE_CHUNK_SIZE, max_duty=RESCORE_MAX_DUTY)
+    rescore_thread = threading.Thread(target=run_rescorer, args=(rescorer,), name="rescorer", daemon=True)
+    rescore_thread.start()
+    logger.info(f"Rescoring with model {active.version} requested by {current_user['username']}")
+    return {"message": "Rescoring started; poll GET /admin/rescore for progress", "version": active.version}
+
+@app.get("/admin/rescore")
+def rescore_status(current_user: dict = Depends(require_admin)):
+    return rescorer.state if rescorer is not None else {"state": "idle"}
+
+@app.post("/admin/rescore/stop")
+def stop_rescore(current_user: dict = Depends(require_admin)):
+    """Stop after the current chunk; the checkpoint lets the next start resume"""
+    if rescorer is not None:
+        rescorer.stop()
+    return {"message": "Stopping"}
+
 # Pydantic Models for Prediction Input (Updated with Name/Contact)
 class PatientData(BaseModel):
     name: str 
@@ -204,6 +480,12 @@ class PatientData(BaseModel):
     class Config:
         extra = "allow" # Be flexible with extra fields
 
+class FeatureContribution(BaseModel):
+    feature: str
+    label: str
+    value: float
+    contribution: float # Share of the risk probability (+ raises, - lowers)
+
 class PredictionResult(BaseModel):
     prediction: int
     risk_score: float
@@ -211,6 +493,21 @@ class PredictionResult(BaseModel):
     patient_id: int
     record_id: int
     explanation: Optional[str] = None # V20: Single Source of Truth for frontend
+    model_version: Optional[str] = None # Registry version that produced the score
+    top_factors: Optional[List[FeatureContribution]] = None # Largest per-feature contributions to risk_score
+
+    class Config:
+        protected_namespaces = () # Allow the model_version field name
+
+class BatchPredictionError(BaseModel):
+    index: int
+    detail: str
+
+class BatchPredictionResult(BaseModel):
+    results: List[Optional[PredictionResult]] # Aligned with the request rows, None for failed rows
+    errors: List[BatchPredictionError]
+    scored: int
+    failed: int
 
 class PatientCreate(BaseModel):
     name: str
@@ -248,6 +545,9 @@ class PatientNotesUpdate(BaseModel):
 class PatientSignatureUpdate(BaseModel):
     signature: str  # Base64 encoded image
 
+class RecordOutcomeUpdate(BaseModel):
+    outcome: Optional[int] = None # Confirmed diagnosis: 1 = heart disease, 0 = none, null clears the label
+
 # Endpoints
 
 @app.post("/register")
@@ -343,14 +643,6 @@ def create_feedback(feedback: FeedbackCreate):
     try:
         conn = get_db_connection()
         c = conn.cursor()
-        
-        # Ensure schema correctness dynamically
-        try:
-            c.execute("SELECT name FROM feedbacks LIMIT 1")
-        except:
-            logger.info("Migrating DB: Adding name column to feedbacks")
-            c.execute("ALTER TABLE feedbacks ADD COLUMN name TEXT")
-            
         c.execute("INSERT INTO feedbacks (patient_id, name, rating, comment) VALUES (?, ?, ?, ?)",
                   (feedback.patient_id, feedback.name, feedback.rating, feedback.comment))
         conn.commit()
@@ -369,100 +661,53 @@ def read_root():
 def health_check():
     return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
 
-@app.get("/dashboard/stats")
-async def get_dashboard_stats():
-    try:
-        conn = get_db_connection()
-        # 1. Total Patients
-        total_patients = conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
-        
-        # 2. Critical Cases (High Risk)
-        critical_cases = conn.execute("SELECT COUNT(*) FROM records WHERE risk_level = 'High'").fetchone()[0]
-        
-        # 3. Monthly Growth
-        import datetime
-        now = datetime.datetime.now()
-        start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        # Handle year rollover for previous month
-        if now.month == 1:
-            start_of_prev_month = now.replace(year=now.year-1, month=12, day=1, hour=0, minute=0, second=0, microsecond=0)
-        else:
-            start_of_prev_month = now.replace(month=now.month-1, day=1, hour=0, minute=0, second=0, microsecond=0)
-            
-        current_month_count = conn.execute("SELECT COUNT(*) FROM records WHERE created_at >= ?", (start_of_month,)).fetchone()[0]
-        prev_month_count = conn.execute("SELECT COUNT(*) FROM records WHERE created_at >= ? AND created_at < ?", (start_of_prev_month, start_of_month)).fetchone()[0]
-        
-        if prev_month_count > 0:
-            growth = ((current_month_count - prev_month_count) / prev_month_count) * 100
-            monthly_growth = f"{growth:+.1f}%"
-        elif current_month_count > 0:
-             monthly_growth = "+100%" # Growth from 0
-        else:
-            monthly_growth = "0%"
+async def dashboard_stats():
+    """Compute the /dashboard/stats payload (raises on failure)"""
+    # Month boundaries for the growth figure (handle year rollover for the previous month)
+    now = datetime.now()
+    start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if now.month == 1:
+        start_of_prev_month = now.replace(year=now.year-1, month=12, day=1, hour=0, minute=0, second=0, microsecond=0)
+    else:
+        start_of_prev_month = now.replace(month=now.month-1, day=1, hour=0, minute=0, second=0, microsecond=0)
+    days = [now - timedelta(days=i) for i in range(6, -1, -1)]
 
+    # Record counts come from the daily rollup (backend.rollups), not from scans of records.
+    # Every query below is independent: run them concurrently on the DB executor
+    (total_patients, totals, recent_activity, risk_counts, gender_counts, age_groups_data,
+     daily_rows) = await asyncio.gather(
+        # 1. Total Patients
+        async_db.fetchval(prepared("SELECT COUNT(*) FROM patients")),
+        # 2. Critical Cases (High Risk) + 3. Monthly Growth
+        async_db.fetchone(prepared("""
+            SELECT COALESCE(SUM(CASE WHEN risk_level = ? THEN assessments ELSE 0 END), 0) AS critical,
+                   COALESCE(SUM(CASE WHEN day >= ? THEN assessments ELSE 0 END), 0) AS current_month,
+                   COALESCE(SUM(CASE WHEN day >= ? AND day < ? THEN assessments ELSE 0 END), 0) AS prev_month
+            FROM record_daily_stats
+        """), ("High", f"{start_of_month:%Y-%m-%d}", f"{start_of_prev_month:%Y-%m-%d}", f"{start_of_month:%Y-%m-%d}")),
         # 4. Recent Activity
-        recent_activity = conn.execute("""
+        async_db.fetchall("""
             SELECT r.id, p.name, p.age, p.sex, r.risk_level, r.created_at, r.risk_score, d.name as doctor_name
             FROM records r
             JOIN patients p ON r.patient_id = p.id
             LEFT JOIN doctors d ON r.doctor_id = d.id
             ORDER BY r.created_at DESC
             LIMIT 5
-        """).fetchall()
-        
+        """),
         # 5. Risk Distribution
-        risk_counts = conn.execute("""
-            SELECT risk_level, COUNT(*) as count 
-            FROM records 
+        async_db.fetchall("""
+            SELECT risk_level, SUM(assessments) as count 
+            FROM record_daily_stats 
             GROUP BY risk_level
-        """).fetchall()
-        
-        # DO NOT CLOSE CONNECTION HERE - We still have more queries below!
-
-        formatted_activity = [
-            {
-                "id": str(row['id']),
-                "name": row['name'],
-                "age": row['age'],
-                "sex": row['sex'],
-                "risk_level": row['risk_level'],
-                "date": row['created_at'],
-                "doctor": row['doctor_name'] or "Dr. Sarah Chen"
-            } for row in recent_activity
-        ]
-
-        formatted_risks = [
-            {"name": "Low Risk", "value": 0},
-            {"name": "Medium Risk", "value": 0},
-            {"name": "High Risk", "value": 0}
-        ]
-        
-        for row in risk_counts:
-            level = row['risk_level']
-            count = row['count']
-            if level == "Low": formatted_risks[0]["value"] = count
-            elif level == "Medium": formatted_risks[1]["value"] = count
-            elif level == "High": formatted_risks[2]["value"] = count
-
+        """),
         # 6. Gender Distribution
-        gender_counts = conn.execute("""
+        async_db.fetchall("""
             SELECT sex, COUNT(*) as count 
             FROM patients 
             GROUP BY sex
-        """).fetchall()
-        
-        gender_distribution = [
-            {"name": "Male", "value": 0},
-            {"name": "Female", "value": 0}
-        ]
-        for row in gender_counts:
-            if row['sex'] == 1:
-                gender_distribution[0]["value"] = row['count']
-            else:
-                gender_distribution[1]["value"] = row['count']
-
+        """),
         # 7. Age Distribution (grouped)
-        age_groups_data = conn.execute("""
+        async_db.fetchall("""
             SELECT 
                 CASE 
                     WHEN age < 30 THEN '< 30'
@@ -475,77 +720,109 @@ async def get_dashboard_stats():
             FROM patients
             GROUP BY age_group
             ORDER BY age_group
-        """).fetchall()
-        
-        age_distribution = [
-            {"ageGroup": row['age_group'], "count": row['count']} 
-            for row in age_groups_data
-        ]
-
-        # 8. Assessment Trends (last 7 days)
-        from datetime import datetime, timedelta
-        trends_data = []
-        for i in range(6, -1, -1):
-            date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
-            count = conn.execute("""
-                SELECT COUNT(*) FROM records 
-                WHERE DATE(created_at) = ?
-            """, (date,)).fetchone()[0]
-            trends_data.append({
-                "date": (datetime.now() - timedelta(days=i)).strftime('%m/%d'),
-                "assessments": count
-            })
-
-        # 9. Risk Trends (last 7 days)
-        risk_trends_data = []
-        for i in range(6, -1, -1):
-            date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
-            risk_counts_day = conn.execute("""
-                SELECT risk_level, COUNT(*) as count 
-                FROM records 
-                WHERE DATE(created_at) = ?
-                GROUP BY risk_level
-            """, (date,)).fetchall()
-            
-            day_data = {
-                "date": (datetime.now() - timedelta(days=i)).strftime('%m/%d'),
-                "low": 0,
-                "medium": 0,
-                "high": 0
-            }
-            for row in risk_counts_day:
-                if row['risk_level'] == 'Low':
-                    day_data['low'] = row['count']
-                elif row['risk_level'] == 'Medium':
-                    day_data['medium'] = row['count']
-                elif row['risk_level'] == 'High':
-                    day_data['high'] = row['count']
-            risk_trends_data.append(day_data)
-
-        # 10. Doctor Performance (hardcoded for now, will be dynamic with multi-doctor system)
-        doctor_performance = [
-            {"doctor": "Dr. Sarah Chen", "patients": total_patients, "criticalCases": critical_cases},
-            {"doctor": "Dr. Emily Ross", "patients": 0, "criticalCases": 0},
-            {"doctor": "Dr. Michael Torres", "patients": 0, "criticalCases": 0}
-        ]
-
-        # Close connection AFTER all queries complete
-        conn.close()
+        """),
+        # 8. + 9. Assessment and Risk Trends (last 7 days)
+        async_db.fetchall(prepared("""
+            SELECT day, risk_level, SUM(assessments) as count 
+            FROM record_daily_stats 
+            WHERE day >= ?
+            GROUP BY day, risk_level
+        """), (days[0].strftime('%Y-%m-%d'),)),
+    )
+    critical_cases, current_month_count, prev_month_count = totals['critical'], totals['current_month'], totals['prev_month']
+    daily_risks = {}
+    for row in daily_rows:
+        daily_risks.setdefault(str(row['day'])[:10], {})[row['risk_level']] = row['count']
+
+    if prev_month_count > 0:
+        growth = ((current_month_count - prev_month_count) / prev_month_count) * 100
+        monthly_growth = f"{growth:+.1f}%"
+    elif current_month_count > 0:
+         monthly_growth = "+100%" # Growth from 0
+    else:
+        monthly_growth = "0%"
+
+    formatted_activity = [
+        {
+            "id": str(row['id']),
+            "name": row['name'],
+            "age": row['age'],
+            "sex": row['sex'],
+            "risk_level": row['risk_level'],
+            "date": row['created_at'],
+            "doctor": row['doctor_name'] or "Dr. Sarah Chen"
+        } for row in recent_activity
+    ]
+
+    formatted_risks = [
+        {"name": "Low Risk", "value": 0},
+        {"name": "Medium Risk", "value": 0},
+        {"name": "High Risk", "value": 0}
+    ]
+    
+    for row in risk_counts:
+        level = row['risk_level']
+        count = row['count']
+        if level == "Low": formatted_risks[0]["value"] = count
+        elif level == "Medium": formatted_risks[1]["value"] = count
+        elif level == "High": formatted_risks[2]["value"] = count
+
+    gender_distribution = [
+        {"name": "Male", "value": 0},
+        {"name": "Female", "value": 0}
+    ]
+    for row in gender_counts:
+        if row['sex'] == 1:
+            gender_distribution[0]["value"] = row['count']
+        else:
+            gender_distribution[1]["value"] = row['count']
+
+    age_distribution = [
+        {"ageGroup": row['age_group'], "count": row['count']} 
+        for row in age_groups_data
+    ]
+
+    trends_data = [
+        {"date": day.strftime('%m/%d'), "assessments": sum(daily_risks.get(day.strftime('%Y-%m-%d'), {}).values())}
+        for day in days
+    ]
+
+    risk_trends_data = []
+    for day in days:
+        risk_counts_day = daily_risks.get(day.strftime('%Y-%m-%d'), {})
+        risk_trends_data.append({
+            "date": day.strftime('%m/%d'),
+            "low": risk_counts_day.get('Low', 0),
+            "medium": risk_counts_day.get('Medium', 0),
+            "high": risk_counts_day.get('High', 0)
+        })
+
+    # 10. Doctor Performance (hardcoded for now, will be dynamic with multi-doctor system)
+    doctor_performance = [
+        {"doctor": "Dr. Sarah Chen", "patients": total_patients, "criticalCases": critical_cases},
+        {"doctor": "Dr. Emily Ross", "patients": 0, "criticalCases": 0},
+        {"doctor": "Dr. Michael Torres", "patients": 0, "criticalCases": 0}
+    ]
 
-        return {
-            "total_patients": total_patients,
-            "critical_cases": critical_cases,
-            "avg_accuracy": "0%", # No ground truth feedback loop yet
-            "monthly_growth": monthly_growth,
-            "recent_activity": formatted_activity,
-            "risk_distribution": formatted_risks,
-            "gender_distribution": gender_distribution,
-            "age_distribution": age_distribution,
-            "assessment_trends": trends_data,
-            "risk_trends": risk_trends_data,
-            "doctor_performance": doctor_performance
-        }
+    return {
+        "total_patients": total_patients,
+        "critical_cases": critical_cases,
+        "avg_accuracy": "0%", # No ground truth feedback loop yet
+        "monthly_growth": monthly_growth,
+        "recent_activity": formatted_activity,
+        "risk_distribution": formatted_risks,
+        "gender_distribution": gender_distribution,
+        "age_distribution": age_distribution,
+        "assessment_trends": trends_data,
+        "risk_trends": risk_trends_data,
+        "doctor_performance": doctor_performance
+    }
 
+
+@app.get("/dashboard/stats")
+async def get_dashboard_stats():
+    try:
+        return await analytics_cache.CACHE.get_or_compute("dashboard/stats", dashboard_stats)
     except Exception as e:
         logger.error(f"Stats Error: {e}")
         return {
@@ -561,172 +838,173 @@ async def get_dashboard_stats():
             "risk_trends": [],
             "doctor_performance": []
         }
-    finally:
-        if 'conn' in locals() and conn:
-            conn.close()
 
 # PHASE 1: Standardized Analytics Endpoints
+async def analytics_summary(doctor_id: Optional[int]):
+    """Compute /analytics/summary (raises on failure)"""
+    # doctor_id is bound, not spliced in, so every doctor shares the same two statement texts (and plans)
+    doctor_filter = " AND doctor_id = ?" if doctor_id else ""
+    doctor_params = (doctor_id,) if doctor_id else ()
+    
+    now = datetime.now()
+    start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if now.month == 1:
+        start_of_prev_month = now.replace(year=now.year-1, month=12, day=1, hour=0, minute=0, second=0, microsecond=0)
+    else:
+        start_of_prev_month = now.replace(month=now.month-1, day=1, hour=0, minute=0, second=0, microsecond=0)
+    
+    # One pass over the daily rollup; AVG(model_probability) over positive probabilities = sum / scored count
+    totals = await async_db.fetchone(prepared(f"""
+        SELECT COALESCE(SUM(CASE WHEN risk_level = ? THEN assessments ELSE 0 END), 0) AS critical,
+               COALESCE(SUM(assessments), 0) AS total,
+               COALESCE(SUM(probability_sum), 0) AS probability_sum,
+               COALESCE(SUM(scored_count), 0) AS scored,
+               COALESCE(SUM(CASE WHEN day >= ? THEN assessments ELSE 0 END), 0) AS current_month,
+               COALESCE(SUM(CASE WHEN day >= ? AND day < ? THEN assessments ELSE 0 END), 0) AS prev_month
+        FROM record_daily_stats
+        WHERE 1=1{doctor_filter}
+    """), ("High", f"{start_of_month:%Y-%m-%d}", f"{start_of_prev_month:%Y-%m-%d}", f"{start_of_month:%Y-%m-%d}") + doctor_params)
+    critical_cases, total_assessments = totals['critical'], totals['total']
+    current_month_count, prev_month_count = totals['current_month'], totals['prev_month']
+    avg_prob = totals['probability_sum'] / totals['scored'] if totals['scored'] else 0.0
+    avg_accuracy = round(avg_prob * 100, 1)
+    
+    if prev_month_count > 0:
+        growth_rate = ((current_month_count - prev_month_count) / prev_month_count) * 100
+        monthly_growth = round(growth_rate, 1)
+    else:
+        monthly_growth = 0.0
+    
+    return {
+        "critical_cases": critical_cases,
+        "avg_accuracy": avg_accuracy,
+        "total_assessments": total_assessments,
+        "monthly_growth": monthly_growth
+    }
+
 @app.get("/analytics/summary")
 async def get_analytics_summary(doctor_id: Optional[int] = Query(None)):
     """Get KPI summary (critical cases, accuracy, total assessments, growth)"""
     try:
-        conn = get_db_connection()
-        
-        doctor_filter = f" AND r.doctor_id = {doctor_id}" if doctor_id else ""
-        
-        critical_query = "SELECT COUNT(*) FROM records r WHERE r.risk_level = 'High'" + doctor_filter
-        critical_cases = conn.execute(critical_query).fetchone()[0]
-        
-        avg_query = "SELECT AVG(r.model_probability) FROM records r WHERE r.model_probability > 0" + doctor_filter
-        avg_prob = conn.execute(avg_query).fetchone()[0] or 0.0
-        avg_accuracy = round(avg_prob * 100, 1)
-        
-        total_query = "SELECT COUNT(*) FROM records r WHERE 1=1" + doctor_filter
-        total_assessments = conn.execute(total_query).fetchone()[0]
-        
-        import datetime
-        now = datetime.datetime.now()
-        start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        if now.month == 1:
-            start_of_prev_month = now.replace(year=now.year-1, month=12, day=1, hour=0, minute=0, second=0, microsecond=0)
-        else:
-            start_of_prev_month = now.replace(month=now.month-1, day=1, hour=0, minute=0, second=0, microsecond=0)
-        
-        current_month_query = f"SELECT COUNT(*) FROM records r WHERE r.created_at >= ?{doctor_filter}"
-        current_month_count = conn.execute(current_month_query, (start_of_month,)).fetchone()[0]
-        
-        prev_month_query = f"SELECT COUNT(*) FROM records r WHERE r.created_at >= ? AND r.created_at < ?{doctor_filter}"
-        prev_month_count = conn.execute(prev_month_query, (start_of_prev_month, start_of_month)).fetchone()[0]
-        
-        if prev_month_count > 0:
-            growth_rate = ((current_month_count - prev_month_count) / prev_month_count) * 100
-            monthly_growth = round(growth_rate, 1)
-        else:
-            monthly_growth = 0.0
-        
-        conn.close()
-        
-        return {
-            "critical_cases": critical_cases,
-            "avg_accuracy": avg_accuracy,
-            "total_assessments": total_assessments,
-            "monthly_growth": monthly_growth
-        }
+        return await analytics_cache.CACHE.get_or_compute("analytics/summary", lambda: analytics_summary(doctor_id), doctor_id)
     except Exception as e:
         logger.error(f"Analytics summary error: {str(e)}")
         return {"critical_cases": 0, "avg_accuracy": 0.0, "total_assessments": 0, "monthly_growth": 0.0}
-    finally:
-         if 'conn' in locals() and conn:
-            conn.close()
+
+async def monthly_trends(doctor_id: Optional[int]):
+    """Compute /analytics/monthly-trends (raises on failure)"""
+    current_year = datetime.now().year
+    months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+    
+    doctor_filter = " AND doctor_id = ?" if doctor_id else ""
+    
+    # Reads one year of the daily rollup (day is 'YYYY-MM-DD' text on SQLite, DATE on Postgres)
+    query = f"""
+        SELECT 
+            SUBSTR(CAST(day AS TEXT), 6, 2) as month_num,
+            SUM(assessments) as count,
+            SUM(CASE WHEN risk_level = 'High' THEN assessments ELSE 0 END) as high_risk
+        FROM record_daily_stats
+        WHERE day >= ? AND day < ? {doctor_filter}
+        GROUP BY month_num
+    """
+    
+    results = await async_db.fetchall(query, (f"{current_year}-01-01", f"{current_year + 1}-01-01") + ((doctor_id,) if doctor_id else ()))
+    
+    month_map = {row['month_num']: {"count": row['count'], "high_risk": row['high_risk']} for row in results}
+    
+    final_data = []
+    for i in range(1, 13):
+        m_str = f"{i:02d}"
+        final_data.append({
+            "month": months[i-1],
+            "count": month_map.get(m_str, {}).get("count", 0),
+            "high_risk": month_map.get(m_str, {}).get("high_risk", 0)
+        })
+        
+    return final_data
 
 @app.get("/analytics/monthly-trends")
 async def get_monthly_trends(doctor_id: Optional[int] = Query(None)):
     """Get monthly assessment trends (Always 12 months for current year)"""
     try:
-        current_year = datetime.now().year
-        months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
-        
-        conn = get_db_connection()
-        doctor_filter = f" AND doctor_id = {doctor_id}" if doctor_id else ""
-        
-        query = f"""
-            SELECT 
-                strftime('%m', created_at) as month_num,
-                COUNT(*) as count,
-                SUM(CASE WHEN risk_level = 'High' THEN 1 ELSE 0 END) as high_risk
-            FROM records
-            WHERE strftime('%Y', created_at) = '{current_year}' {doctor_filter}
-            GROUP BY month_num
-        """
-        
-        results = conn.execute(query).fetchall()
-        conn.close()
-        
-        month_map = {row['month_num']: {"count": row['count'], "high_risk": row['high_risk']} for row in results}
-        
-        final_data = []
-        for i in range(1, 13):
-            m_str = f"{i:02d}"
-            final_data.append({
-                "month": months[i-1],
-                "count": month_map.get(m_str, {}).get("count", 0),
-                "high_risk": month_map.get(m_str, {}).get("high_risk", 0)
-            })
-            
-        return final_data
+        return await analytics_cache.CACHE.get_or_compute("analytics/monthly-trends", lambda: monthly_trends(doctor_id), doctor_id)
     except Exception as e:
         logger.error(f"Monthly trends error: {str(e)}")
         return []
-    finally:
-        if 'conn' in locals() and conn:
-            conn.close()
+
+async def risk_distribution(doctor_id: Optional[int]):
+    """Compute /analytics/risk-distribution (raises on failure)"""
+    doctor_filter = " AND doctor_id = ?" if doctor_id else ""
+    doctor_params = (doctor_id,) if doctor_id else ()
+    
+    results = await async_db.fetchall(
+        f"SELECT risk_level, SUM(assessments) as count FROM record_daily_stats WHERE 1=1{doctor_filter} "
+        f"GROUP BY risk_level HAVING SUM(assessments) > 0",
+        doctor_params,
+    )
+    total = sum(row['count'] for row in results)
+    
+    distribution = []
+    for row in results:
+        count = row['count']
+        percentage = round((count / total * 100), 1) if total > 0 else 0
+        distribution.append({"level": row['risk_level'], "count": count, "percentage": percentage})
+    
+    return distribution
 
 @app.get("/analytics/risk-distribution")
 async def get_risk_distribution(doctor_id: Optional[int] = Query(None)):
     """Get risk level distribution with percentages"""
     try:
-        conn = get_db_connection()
-        doctor_filter = f" AND doctor_id = {doctor_id}" if doctor_id else ""
-        
-        total_query = f"SELECT COUNT(*) FROM records WHERE 1=1{doctor_filter}"
-        total = conn.execute(total_query).fetchone()[0]
-        
-        query = f"SELECT risk_level, COUNT(*) as count FROM records WHERE 1=1{doctor_filter} GROUP BY risk_level"
-        results = conn.execute(query).fetchall()
-        conn.close()
-        
-        distribution = []
-        for row in results:
-            count = row['count']
-            percentage = round((count / total * 100), 1) if total > 0 else 0
-            distribution.append({"level": row['risk_level'], "count": count, "percentage": percentage})
-        
-        return distribution
+        return await analytics_cache.CACHE.get_or_compute("analytics/risk-distribution", lambda: risk_distribution(doctor_id), doctor_id)
     except Exception as e:
         logger.error(f"Risk distribution error: {str(e)}")
         return []
-    finally:
-        if 'conn' in locals() and conn:
-            conn.close()
+
+async def doctor_performance():
+    """Compute /analytics/doctor-performance (raises on failure)"""
+    # Per-doctor totals from the daily rollup; AVG(model_probability) = sum / non-null count
+    query = """
+        SELECT 
+            d.id as doctor_id,
+            d.name as doctor_name,
+            COALESCE(s.assessments, 0) as assessments,
+            s.avg_confidence,
+            s.high_risk_cases
+        FROM doctors d
+        LEFT JOIN (
+            SELECT doctor_id,
+                   SUM(assessments) as assessments,
+                   SUM(probability_sum) * 100.0 / NULLIF(SUM(probability_count), 0) as avg_confidence,
+                   SUM(CASE WHEN risk_level = 'High' THEN assessments ELSE 0 END) as high_risk_cases
+            FROM record_daily_stats
+            GROUP BY doctor_id
+        ) s ON s.doctor_id = d.id
+        ORDER BY assessments DESC
+    """
+    
+    results = await async_db.fetchall(query)
+    
+    return [
+        {
+            "doctor_id": row['doctor_id'],
+            "name": row['doctor_name'],
+            "assessments": row['assessments'] or 0,
+            "accuracy": round(row['avg_confidence'] or 0.0, 1),
+            "high_risk_cases": row['high_risk_cases'] or 0
+        }
+        for row in results
+    ]
 
 @app.get("/analytics/doctor-performance")
 async def get_doctor_performance():
     """Get performance metrics for each doctor"""
     try:
-        conn = get_db_connection()
-        
-        query = """
-            SELECT 
-                d.id as doctor_id,
-                d.name as doctor_name,
-                COUNT(r.id) as assessments,
-                AVG(r.model_probability) * 100 as avg_confidence,
-                SUM(CASE WHEN r.risk_level = 'High' THEN 1 ELSE 0 END) as high_risk_cases
-            FROM doctors d
-            LEFT JOIN records r ON r.doctor_id = d.id
-            GROUP BY d.id, d.name
-            ORDER BY assessments DESC
-        """
-        
-        results = conn.execute(query).fetchall()
-        conn.close()
-        
-        return [
-            {
-                "doctor_id": row['doctor_id'],
-                "name": row['doctor_name'],
-                "assessments": row['assessments'] or 0,
-                "accuracy": round(row['avg_confidence'] or 0.0, 1),
-                "high_risk_cases": row['high_risk_cases'] or 0
-            }
-            for row in results
-        ]
+        return await analytics_cache.CACHE.get_or_compute("analytics/doctor-performance", doctor_performance)
     except Exception as e:
         logger.error(f"Doctor performance error: {str(e)}")
         return []
-    finally:
-        if 'conn' in locals() and conn:
-            conn.close()
 
 @app.get("/doctors")
 def get_doctors_list():
@@ -743,6 +1021,79 @@ def get_doctors_list():
         if 'conn' in locals() and conn:
             conn.close()
 
+def extract_features(data: PatientData) -> List[float]:
+    """Build the model feature vector for a patient (order matches FEATURE_COLUMNS)."""
+    return [float(getattr(data, col)) for col in FEATURE_COLUMNS]
+
+UPSERT_PATIENT_RETURNING_ID = prepared(UPSERT_PATIENT + "RETURNING id")
+
+def save_prediction(c, data: PatientData, prediction: int, risk_probability: float, risk_level: str,
+                    system_notes: str, model_version: str, doctor_names: Optional[dict] = None):
+    """
+    Persist one scored assessment (find-or-create patient + insert record) on an open cursor.
+    The caller owns the transaction. Returns (patient_id, record_id).
+    """
+    # 🚨 V20: Unified Doctor Retrieval
+    if doctor_names is not None and data.doctor_id in doctor_names:
+        assigned_doctor = doctor_names[data.doctor_id]
+    else:
+        doc_res = c.execute("SELECT name FROM doctors WHERE id = ?", (data.doctor_id,)).fetchone()
+        assigned_doctor = doc_res['name'] if doc_res else "Dr. Sarah Chen"
+        if doctor_names is not None:
+            doctor_names[data.doctor_id] = assigned_doctor
+
+    # 1. Find or Create Patient: one upsert on the unique identity key (normalized name + contact)
+    patient_id = c.execute(UPSERT_PATIENT_RETURNING_ID, (
+        patient_identity_key(data.name, data.contact), data.name, data.age, data.sex, data.contact,
+        risk_level, system_notes, assigned_doctor, data.doctor_id
+    )).fetchone()['id']
+
+    # 2. Save Record
+    record_data = data.dict()
+    record_data.pop('name', None)
+    record_data.pop('contact', None)
+    record_data.pop('doctor_id', None) 
+
+    record_id = c.execute(prepared("""
+        INSERT INTO records (
+            patient_id, input_data, prediction_result, risk_score, risk_level, 
+            doctor_name, doctor_id, model_probability, model_version
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        RETURNING id
+    """), (
+        patient_id, 
+        json.dumps(record_data), 
+        int(prediction), 
+        float(risk_probability), 
+        risk_level, 
+        assigned_doctor,
+        data.doctor_id,
+        float(risk_probability),
+        model_version
+    )).fetchone()['id']
+    rollups.add_record(c, data.doctor_id, risk_level, float(risk_probability))
+
+    return patient_id, record_id
+
+def mark_stage(stage: str, started: float) -> float:
+    """Record the time since `started` for a prediction stage and return the new mark."""
+    now = time.perf_counter()
+    PREDICT_STAGE_LATENCY.observe(now - started, stage)
+    return now
+
+def persist(write_fn):
+    """Run write_fn(cursor) through the group-commit writer (or synchronously if it is off)."""
+    try:
+        if writer.running:
+            return writer.write(write_fn, WRITE_TIMEOUT_S) # The writer invalidates the analytics cache once per group
+        result = write_with_retry(write_fn, get_db_connection, lock=db_lock)
+    except DatabaseBusyError as e:
+        logger.warning(f"Persist failed: {e}")
+        raise HTTPException(status_code=503, detail="Database busy. Please try again.")
+    analytics_cache.invalidate() # Every persisted write changes records (and so the analytics)
+    return result
+
 @app.post("/predict", response_model=PredictionResult)
 def predict_heart_disease(data: PatientData):
     # Log the incoming data for debugging
@@ -750,19 +1101,16 @@ def predict_heart_disease(data: PatientData):
     logger.info(f"Patient Name: {data.name}, Type: {type(data.name)}")
     logger.info(f"Doctor ID: {data.doctor_id}, Type: {type(data.doctor_id)}")
     
-    if model is None or scaler is None:
+    active_model = registry.current
+    if active_model is None:
         logger.error("Model or Scaler not loaded.")
         raise HTTPException(status_code=500, detail="Model service unavailable - check server logs for loading errors")
 
     try:
+        mark = time.perf_counter()
         # 🚨 CRITICAL: Validate input features for NaN BEFORE preprocessing
         try:
-            features = [
-                float(data.age), float(data.sex), float(data.cp), 
-                float(data.trestbps), float(data.chol), float(data.fbs), 
-                float(data.restecg), float(data.thalach), float(data.exang), 
-                float(data.oldpeak), float(data.slope), float(data.ca), float(data.thal)
-            ]
+            features = extract_features(data)
         except (ValueError, TypeError) as e:
             logger.error(f"Invalid input data type: {e}")
             raise HTTPException(status_code=400, detail=f"Invalid input: {str(e)}")
@@ -778,97 +1126,32 @@ def predict_heart_disease(data: PatientData):
         
         # Log for debugging
         logger.info(f"Input features valid: age={data.age}, cp={data.cp}, chol={data.chol}")
+        mark = mark_stage("validate", mark)
         
-        # Preprocess
-        input_data = np.array([features])
-        scaled_data = scaler.transform(input_data)
-        
-        # Predict
-        prediction = model.predict(scaled_data)[0]
-        probabilities = model.predict_proba(scaled_data)[0]
-        risk_probability = probabilities[1]  # Probability of heart disease
+        # Predict (class + probability in one pass, micro-batched with concurrent requests)
+        cache_key = prediction_cache.key(active_model.version, features)
+        cached = prediction_cache.get(cache_key)
+        if cached is not None:
+            prediction, risk_probability, contributions = cached
+            model_version = active_model.version
+        else:
+            prediction, risk_probability, model_version, contributions = score_one(features)
+            prediction_cache.put(prediction_cache.key(model_version, features), (prediction, risk_probability, contributions))
+        mark = mark_stage("model", mark)
         
         # PHASE 0: Use scientific thresholds from config
         risk_level = classify_risk(risk_probability)
 
-        # Generate AI system notes
-        system_notes = generate_system_notes(risk_level, risk_probability, data.dict())
+        # Generate AI system notes (led by the features that actually drove this score)
+        top_factors = top_contributors(contributions, features)
+        system_notes = generate_system_notes(risk_level, risk_probability, data.dict(), top_factors)
+        mark = mark_stage("notes", mark)
 
-        # --- SAVE TO DATABASE (WITH RETRY & GLOBAL LOCK) ---
-        max_retries = 5 
-        retry_delay = 1.0 
-        
-        # Global Lock: Serialize writes to prevent SQLite concurrency issues
-        with db_lock:
-            for attempt in range(max_retries):
-                try:
-                    logger.info(f"Connecting to database (Attempt {attempt+1}/{max_retries})...")
-                    conn = get_db_connection()
-                    c = conn.cursor()
-                    
-                    # 1. Find or Create Patient
-                    patient_id = None
-                    existing_patient = c.execute("SELECT id FROM patients WHERE name = ?", (data.name,)).fetchone()
-                    
-                    # 🚨 V20: Unified Doctor Retrieval
-                    doc_res = c.execute("SELECT name FROM doctors WHERE id = ?", (data.doctor_id,)).fetchone()
-                    assigned_doctor = doc_res['name'] if doc_res else "Dr. Sarah Chen"
-
-                    if existing_patient:
-                        patient_id = existing_patient['id']
-                        # Update patient risk level and system notes
-                        c.execute("""
-                            UPDATE patients 
-                            SET risk_level = ?, system_notes = ?, last_updated = CURRENT_TIMESTAMP, age = ?, sex = ?, contact = ?, doctor_name = ?
-                            WHERE id = ?
-                        """, (risk_level, system_notes, data.age, data.sex, data.contact, assigned_doctor, patient_id))
-                    else:
-                        # Create new patient with assigned doctor
-                        c.execute("""
-                            INSERT INTO patients (name, age, sex, contact, risk_level, system_notes, last_updated, doctor_name, doctor_id) 
-                            VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?, ?)
-                        """, (data.name, data.age, data.sex, data.contact, risk_level, system_notes, assigned_doctor, data.doctor_id))
-                        patient_id = c.lastrowid
-                        
-                    # 2. Save Record
-                    record_data = data.dict()
-                    record_data.pop('name', None)
-                    record_data.pop('contact', None)
-                    record_data.pop('doctor_id', None) 
-                    
-                    c.execute("""
-                        INSERT INTO records (
-                            patient_id, input_data, prediction_result, risk_score, risk_level, 
-                            doctor_name, doctor_id, model_probability
-                        )
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        patient_id, 
-                        json.dumps(record_data), 
-                        int(prediction), 
-                        float(risk_probability), 
-                        risk_level, 
-                        assigned_doctor,
-                        data.doctor_id,
-                        float(risk_probability)
-                    ))
-                    
-                    record_id = c.lastrowid
-                    conn.commit()
-                    # Success! Break the loop
-                    break
-                except sqlite3.OperationalError as e:
-                    # Retry if locked
-                    if "locked" in str(e):
-                        logger.warning(f"Database locked. Retrying in {retry_delay}s...")
-                        if 'conn' in locals() and conn: conn.close()
-                        time.sleep(retry_delay)
-                    else:
-                        raise e
-                finally:
-                    if 'conn' in locals() and conn: conn.close()
-            else:
-                 raise HTTPException(status_code=500, detail="Database busy. Please try again.")
+        # --- SAVE TO DATABASE (GROUP COMMIT WITH RETRY) ---
+        patient_id, record_id = persist(
+            lambda c: save_prediction(c, data, prediction, risk_probability, risk_level, system_notes, model_version)
+        )
+        mark_stage("persist", mark)
 
         logger.info(f"Prediction successful: Patient ID {patient_id}, Record ID {record_id}, Risk: {risk_level}")
 
@@ -878,7 +1161,9 @@ def predict_heart_disease(data: PatientData):
             "risk_level": risk_level,
             "patient_id": patient_id,
             "record_id": record_id,
-            "explanation": system_notes
+            "explanation": system_notes,
+            "model_version": model_version,
+            "top_factors": top_factors
         }
     except HTTPException:
         raise
@@ -891,19 +1176,186 @@ def predict_heart_disease(data: PatientData):
                 "trace": traceback.format_exc() if os.getenv("DEBUG") == "True" else "Check server logs"
             }
         )
+
+# Upper bound on rows per batch request (keeps one transaction reasonably short)
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
+
+@app.post("/predict/batch", response_model=BatchPredictionResult)
+def predict_heart_disease_batch(rows: List[Any]):
+    """
+    Score many patients in one call: one feature matrix, a single model evaluation,
+    vectorized risk classification and a single DB transaction. Invalid rows are reported
+    per index and skipped; valid rows are still scored and saved. Rows are validated here,
+    one by one, so a malformed row cannot turn the whole batch into a 422.
+    """
+    logger.info(f"--- BATCH PREDICTION START ({len(rows)} rows) ---")
+
+    active_model = registry.current
+    if active_model is None:
+        logger.error("Model or Scaler not loaded.")
+        raise HTTPException(status_code=500, detail="Model service unavailable - check server logs for loading errors")
+
+    if not rows:
+        raise HTTPException(status_code=400, detail="Batch is empty.")
+    if len(rows) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large ({len(rows)} rows, max {MAX_BATCH_SIZE}).")
+
+    errors = []
+    try:
+        mark = time.perf_counter()
+        # 1. Validate all rows as one matrix
+        matrix = np.full((len(rows), len(FEATURE_COLUMNS)), np.nan)
+        patients = [None] * len(rows)
+        for i, raw in enumerate(rows):
+            try:
+                patients[i] = PatientData.model_validate(raw)
+                matrix[i] = extract_features(patients[i])
+            except ValidationError as e:
+                errors.append({"index": i, "detail": f"Invalid input: {validation_detail(e)}"})
+            except (ValueError, TypeError) as e:
+                errors.append({"index": i, "detail": f"Invalid input: {str(e)}"})
+
+        finite = np.isfinite(matrix).all(axis=1)
+        invalid_indices = {err["index"] for err in errors}
+        for i in np.flatnonzero(~finite):
+            if int(i) not in invalid_indices:
+                errors.append({"index": int(i), "detail": "NaN or infinite values detected. Please fill all fields."})
+        valid_indices = np.flatnonzero(finite)
+        mark = mark_stage("batch_validate", mark)
+
+        results = [None] * len(rows)
+        if len(valid_indices):
+            # 2. Score every valid row in one vectorized model call
+            predictions, risk_probabilities, versions, contributions = score_features(matrix[valid_indices])
+            risk_levels = classify_risk_batch(risk_probabilities)
+            mark = mark_stage("batch_model", mark)
+
+            scored = []
+            for j, i in enumerate(valid_indices):
+                factors = top_contributors(contributions[j], matrix[i])
+                notes = generate_system_notes(risk_levels[j], risk_probabilities[j], patients[i].dict(), factors)
+                scored.append((int(i), int(predictions[j]), float(risk_probabilities[j]), risk_levels[j], notes, versions[j], factors))
+            mark = mark_stage("batch_notes", mark)
+
+            # 3. Persist the whole batch in one transaction
+            def write_batch(c):
+                doctor_names = {}
+                return [
+                    save_prediction(c, patients[i], prediction, probability, level, notes, version, doctor_names)
+                    for i, prediction, probability, level, notes, version, _ in scored
+                ]
+
+            saved = persist(write_batch)
+            mark_stage("batch_persist", mark)
+
+            for (i, prediction, probability, level, notes, version, factors), (patient_id, record_id) in zip(scored, saved):
+                results[i] = {
+                    "prediction": prediction,
+                    "risk_score": probability,
+                    "risk_level": level,
+                    "patient_id": patient_id,
+                    "record_id": record_id,
+                    "explanation": notes,
+                    "model_version": version,
+                    "top_factors": factors
+                }
+
+        errors.sort(key=lambda err: err["index"])
+        logger.info(f"Batch prediction complete: {len(valid_indices)} scored, {len(errors)} failed")
+
+        return {
+            "results": results,
+            "errors": errors,
+            "scored": int(len(valid_indices)),
+            "failed": len(errors)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Batch prediction error: {str(e)}\n{traceback.format_exc()}")
+        raise HTTPException(
+            status_code=500, 
+            detail={
+                "error": f"Internal Prediction Engine Error: {str(e)}",
+                "trace": traceback.format_exc() if os.getenv("DEBUG") == "True" else "Check server logs"
+            }
+        )
+
+# Rows per scoring/insert chunk of a bulk import (bounds memory and transaction length)
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "500"))
+UPLOAD_READ_BYTES = 64 * 1024
+UPLOAD_SPOOL_BYTES = 1024 * 1024 # Larger uploads spill to a temporary file
+
+async def spool_body(request: Request) -> UploadFile:
+    """
+    Copy a raw request body into a spooled temporary file. The streaming response listens
+    on the same ASGI channel for disconnects, so the body must be consumed before it starts.
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+    async for chunk in request.stream():
+        await run_in_threadpool(spooled.write, chunk)
+    spooled.seek(0)
+    return UploadFile(file=spooled)
+
+async def iter_upload(upload: UploadFile):
+    """Read an upload in fixed-size chunks, closing it at the end."""
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_READ_BYTES)
+            if not chunk:
+                break
+            yield chunk
     finally:
-        if 'conn' in locals() and conn:
-            conn.close()
+        await upload.close()
+
+@app.post("/predict/import")
+async def import_patients(request: Request, format: Optional[str] = Query(None),
+                          current_user: dict = Depends(get_current_user)):
+    """
+    Bulk-score a CSV (header row) or NDJSON file of patients with the 13 clinical features.
+    Send the file as the raw body (Content-Type text/csv or application/x-ndjson) or as the
+    'file' field of a multipart form. The file is parsed as a stream, scored in IMPORT_CHUNK_SIZE
+    chunks and bulk-inserted; the response streams NDJSON progress, per-row error and summary events.
+    """
+    if registry.current is None:
+        raise HTTPException(status_code=500, detail="Model service unavailable - check server logs for loading errors")
+
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Multipart upload must contain a 'file' field.")
+        content_type = upload.content_type
+    else:
+        upload = await spool_body(request)
+
+    try:
+        fmt = format.lower() if format else detect_format(content_type, upload.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{format}' (use csv or ndjson).")
+
+    logger.info(f"--- BULK IMPORT START ({fmt}) by {current_user['username']} ---")
+    importer = BulkImporter(PatientData, score_features, persist, IMPORT_CHUNK_SIZE)
+    events = (json.dumps(event) + "\n" async for event in importer.run(iter_upload(upload), fmt))
+    return StreamingResponse(events, media_type="application/x-ndjson")
 
 @app.post("/patients")
 def create_patient(patient: PatientCreate):
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("INSERT INTO patients (name, age, sex, contact) VALUES (?, ?, ?, ?)",
-              (patient.name, patient.age, patient.sex, patient.contact))
+    # Registering a patient who already exists (same identity key) returns, and refreshes, that record
+    patient_id = c.execute("""
+        INSERT INTO patients (identity_key, name, age, sex, contact) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (identity_key) DO UPDATE SET age = excluded.age, sex = excluded.sex, last_updated = CURRENT_TIMESTAMP
+        RETURNING id
+    """, (patient_identity_key(patient.name, patient.contact), patient.name, patient.age, patient.sex,
+          patient.contact)).fetchone()['id']
     conn.commit()
-    patient_id = c.lastrowid
     conn.close()
+    analytics_cache.invalidate()
     return {"id": patient_id, "message": "Patient created successfully"}
 
 @app.get("/patients")
@@ -1014,6 +1466,32 @@ def update_patient_signature(patient_id: int, signature_data: PatientSignatureUp
         logger.error(f"Error updating signature: {e}")
         raise HTTPException(status_code=500, detail="Failed to update signature")
 
+@app.put("/records/{record_id}/outcome")
+def update_record_outcome(record_id: int, update: RecordOutcomeUpdate, current_user: dict = Depends(get_current_user)):
+    """Label an assessment with the confirmed diagnosis (training data for backend.retrain)"""
+    if update.outcome not in (None, 0, 1):
+        raise HTTPException(status_code=400, detail="outcome must be 0, 1 or null")
+    try:
+        conn = get_db_connection()
+        c = conn.cursor()
+
+        record = c.execute("SELECT id FROM records WHERE id = ?", (record_id,)).fetchone()
+        if not record:
+            conn.close()
+            raise HTTPException(status_code=404, detail="Record not found")
+
+        c.execute("UPDATE records SET outcome = ?, outcome_at = CURRENT_TIMESTAMP WHERE id = ?", (update.outcome, record_id))
+        conn.commit()
+        conn.close()
+
+        logger.info(f"Outcome {update.outcome} recorded for record {record_id} by {current_user['username']}")
+        return {"message": "Outcome recorded", "record_id": record_id, "outcome": update.outcome}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error recording outcome: {e}")
+        raise HTTPException(status_code=500, detail="Failed to record outcome")
+
 @app.get("/feedbacks")
 def get_feedbacks():
     conn = get_db_connection()
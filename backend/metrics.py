@@ -0,0 +1,163 @@
+"""
+Minimal in-process metrics with Prometheus text exposition.
+
+Recording is a lock + a few additions (no I/O, no allocation beyond the first
+use of a label set); formatting only happens when /metrics is scraped, so the
+hot path cost stays negligible with no scraper attached.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds (100 us .. 10 s)
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items]
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {} # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *labelvalues):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+
+    def collect(self):
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        lines = []
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', _format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', '+Inf'))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+class CallbackMetric:
+    """Gauge or counter whose value is read from a callback at scrape time."""
+
+    def __init__(self, name: str, help: str, fn, type: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.type = type
+
+    def collect(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        return [] if value is None else [f"{self.name} {_format_value(value)}"]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name: str, help: str, fn, type: str = "gauge") -> CallbackMetric:
+        return self._register(CallbackMetric(name, help, fn, type))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# --- Shared metrics (recorded across modules) ---
+REQUESTS = REGISTRY.counter("cardioai_http_requests_total", "HTTP requests by route and status code", ("route", "method", "status"))
+REQUEST_ERRORS = REGISTRY.counter("cardioai_http_request_errors_total", "HTTP requests answered with 5xx or raising", ("route", "method"))
+REQUEST_LATENCY = REGISTRY.histogram("cardioai_http_request_seconds", "HTTP request latency by route", ("route", "method"))
+PREDICT_STAGE_LATENCY = REGISTRY.histogram("cardioai_predict_stage_seconds", "Latency of each /predict stage", ("stage",))
+DB_CONNECT_LATENCY = REGISTRY.histogram("cardioai_db_connect_seconds", "Time to open a database connection", ("backend",))
+DB_POOL_WAIT = REGISTRY.histogram("cardioai_db_pool_wait_seconds", "Time spent borrowing a pooled database connection", ("pool",))
+DB_RETRIES = REGISTRY.counter("cardioai_db_retries_total", "Writes retried because the database was locked", ("path",))
+DB_LOCK_WAIT = REGISTRY.histogram("cardioai_db_lock_wait_seconds", "Time spent waiting for the global write lock", ("path",))
+AUDIT_LATENCY = REGISTRY.histogram("cardioai_audit_log_seconds", "Time to write one audit log entry")
+AUDIT_ERRORS = REGISTRY.counter("cardioai_audit_log_errors_total", "Audit log writes that failed")
+CASCADE_ANSWERS = REGISTRY.counter("cardioai_cascade_answers_total", "Rows answered by each cascade inference tier", ("tier",))
+ANALYTICS_CACHE_LOOKUPS = REGISTRY.counter("cardioai_analytics_cache_lookups_total", "Analytics response cache lookups by endpoint and result (hit, coalesced, miss)", ("endpoint", "result"))
@@ -0,0 +1,371 @@
+"""
+Versioned schema migrations for the SQLite and PostgreSQL backends.
+
+Each migration has a number and runs once per database. The numbers already
+applied are recorded in schema_migrations, so a warm start with an
+up-to-date schema costs one SELECT and changes nothing. Pending migrations
+run in order in a single transaction, with other writers held off
+(BEGIN IMMEDIATE on SQLite, an advisory lock on Postgres). Workers starting
+together therefore apply each migration exactly once, and a failing migration
+leaves the schema as it was.
+
+Databases created before this runner existed are adopted transparently: the
+early migrations only create what is missing, so they are safe to apply to
+any older schema.
+
+    python -m backend.migrations             # apply pending migrations (init_db() does this on startup)
+    python -m backend.migrations status      # applied / pending versions
+
+To change the schema, append a migration to MIGRATIONS with the next
+number. Never edit or renumber one that has shipped.
+"""
+import argparse
+import logging
+import sys
+
+from backend import analytics_cache, rollups
+from backend.database import get_db_connection, is_postgres
+from backend.utils import patient_identity_key
+
+logger = logging.getLogger(__name__)
+
+ADVISORY_LOCK_KEY = 0x43415244 # Arbitrary but fixed: serializes migration runs across Postgres clients
+
+
+def _values(row) -> tuple:
+    return tuple(row.values()) if isinstance(row, dict) else tuple(row) # RealDictCursor rows on Postgres
+
+
+def _first(row):
+    return _values(row)[0]
+
+
+def _scalar(c, sql, params=None):
+    row = c.execute(sql, params).fetchone() if params is not None else c.execute(sql).fetchone()
+    return None if row is None else _first(row)
+
+
+# --- Migrations: (c, postgres) -> None, run inside the migration transaction ---
+def _baseline_tables(c, postgres):
+    """The tables as the pre-migration init code created them (no-ops on databases that already have them)."""
+    if postgres:
+        c.execute('''CREATE TABLE IF NOT EXISTS users (
+                        id SERIAL PRIMARY KEY,
+                        username VARCHAR(255) UNIQUE NOT NULL,
+                        password_hash VARCHAR(255) NOT NULL,
+                        role VARCHAR(50) DEFAULT 'doctor',
+                        email VARCHAR(255),
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS doctors (
+                        id SERIAL PRIMARY KEY,
+                        name VARCHAR(255) NOT NULL,
+                        email VARCHAR(255) UNIQUE,
+                        specialization VARCHAR(255) DEFAULT 'Cardiology',
+                        signature_path TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS patients (
+                        id SERIAL PRIMARY KEY,
+                        name VARCHAR(255) NOT NULL,
+                        age INTEGER,
+                        sex INTEGER,
+                        contact VARCHAR(255),
+                        status VARCHAR(50) DEFAULT 'Active',
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        doctor_name VARCHAR(255) DEFAULT 'Dr. Sarah Chen',
+                        doctor_notes TEXT,
+                        system_notes TEXT,
+                        risk_level VARCHAR(50) DEFAULT 'Unknown',
+                        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        doctor_signature TEXT,
+                        doctor_id INTEGER REFERENCES users(id),
+                        is_deleted BOOLEAN DEFAULT FALSE
+                    )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS records (
+                        id SERIAL PRIMARY KEY,
+                        patient_id INTEGER REFERENCES patients(id),
+                        input_data TEXT,
+                        prediction_result INTEGER,
+                        risk_score REAL,
+                        risk_level VARCHAR(50),
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        doctor_name VARCHAR(255) DEFAULT 'Dr. Sarah Chen',
+                        doctor_id INTEGER REFERENCES users(id),
+                        is_deleted BOOLEAN DEFAULT FALSE,
+                        model_probability REAL DEFAULT 0.0,
+                        model_version VARCHAR(64)
+                    )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS feedbacks (
+                        id SERIAL PRIMARY KEY,
+                        patient_id INTEGER REFERENCES patients(id),
+                        name VARCHAR(255),
+                        rating INTEGER,
+                        comment TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS audit_logs (
+                        id SERIAL PRIMARY KEY,
+                        doctor_id INTEGER REFERENCES users(id),
+                        action VARCHAR(255) NOT NULL,
+                        entity VARCHAR(255) NOT NULL,
+                        entity_id INTEGER,
+                        details TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )''')
+        return
+
+    c.execute('''CREATE TABLE IF NOT EXISTS patients (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    age INTEGER,
+                    sex INTEGER,
+                    contact TEXT,
+                    status TEXT DEFAULT 'Active',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS records (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    patient_id INTEGER,
+                    input_data TEXT,
+                    prediction_result INTEGER,
+                    risk_score REAL,
+                    risk_level TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (patient_id) REFERENCES patients (id)
+                )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS feedbacks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    patient_id INTEGER,
+                    name TEXT,
+                    rating INTEGER,
+                    comment TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT UNIQUE NOT NULL,
+                    password_hash TEXT NOT NULL,
+                    role TEXT DEFAULT 'doctor',
+                    email TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS doctors (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    email TEXT UNIQUE,
+                    specialization TEXT DEFAULT 'Cardiology',
+                    signature_path TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS audit_logs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    doctor_id INTEGER NOT NULL,
+                    action TEXT NOT NULL,
+                    entity TEXT NOT NULL,
+                    entity_id INTEGER,
+                    details TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (doctor_id) REFERENCES users(id)
+                )''')
+
+
+# Columns added after the tables were first shipped: (table, column, definition)
+ADDED_COLUMNS = [
+    ("patients", "doctor_name", "TEXT DEFAULT 'Dr. Sarah Chen'"),
+    ("patients", "doctor_notes", "TEXT"),
+    ("patients", "system_notes", "TEXT"),
+    ("patients", "risk_level", "TEXT DEFAULT 'Unknown'"),
+    ("patients", "last_updated", "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"),
+    ("patients", "doctor_signature", "TEXT"),
+    ("patients", "doctor_id", "INTEGER REFERENCES users(id)"),
+    ("patients", "is_deleted", "BOOLEAN DEFAULT FALSE"),
+    ("records", "doctor_name", "TEXT DEFAULT 'Dr. Sarah Chen'"),
+    ("records", "doctor_id", "INTEGER REFERENCES users(id)"),
+    ("records", "is_deleted", "BOOLEAN DEFAULT FALSE"),
+    ("records", "model_probability", "REAL DEFAULT 0.0"),
+    ("records", "model_version", "TEXT"),
+    ("records", "outcome", "INTEGER"), # Confirmed diagnosis (0/1), NULL = unknown
+    ("records", "outcome_at", "TIMESTAMP"),
+    ("feedbacks", "name", "TEXT"), # Used to be added on the fly by POST /feedbacks
+]
+
+
+def _added_columns(c, postgres):
+    """Add the later columns that older databases are missing."""
+    if postgres:
+        for table, column, definition in ADDED_COLUMNS:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {definition}")
+        return
+    existing = {}
+    for table, column, definition in ADDED_COLUMNS:
+        if table not in existing:
+            existing[table] = {row[1] for row in c.execute(f"PRAGMA table_info({table})").fetchall()}
+        if column not in existing[table]:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _daily_stats_table(c, postgres):
+    """Daily analytics rollup (backend.rollups), maintained with every record write."""
+    c.execute(f'''CREATE TABLE IF NOT EXISTS record_daily_stats (
+                    day {"DATE" if postgres else "TEXT"} NOT NULL,
+                    doctor_id INTEGER NOT NULL DEFAULT 0,
+                    risk_level {"VARCHAR(50)" if postgres else "TEXT"} NOT NULL,
+                    assessments INTEGER NOT NULL DEFAULT 0,
+                    probability_sum {"DOUBLE PRECISION" if postgres else "REAL"} NOT NULL DEFAULT 0,
+                    probability_count INTEGER NOT NULL DEFAULT 0,
+                    scored_count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, doctor_id, risk_level)
+                )''')
+    # Databases upgraded from before the rollup: fill it from existing records
+    if c.execute("SELECT 1 FROM record_daily_stats LIMIT 1").fetchone() is None \
+            and c.execute("SELECT 1 FROM records LIMIT 1").fetchone() is not None:
+        if postgres:
+            c.execute("LOCK TABLE records IN SHARE MODE")
+        rollups.fill(c)
+
+
+# Secondary indexes for the real access paths: (name, table, columns)
+INDEXES = [
+    ("idx_patients_doctor_id", "patients", "doctor_id"),
+    ("idx_patients_last_updated", "patients", "last_updated"), # GET /patients ordering
+    ("idx_records_patient_id", "records", "patient_id"), # Patient history, assessment counts
+    ("idx_records_created_at", "records", "created_at"), # Dashboard recent activity
+    ("idx_records_doctor_created", "records", "doctor_id, created_at"), # Per-doctor history and date ranges
+    ("idx_records_risk_level", "records", "risk_level"),
+    ("idx_audit_logs_created_at", "audit_logs", "created_at"),
+]
+
+
+def _indexes(c, postgres):
+    for name, table, columns in INDEXES:
+        c.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table}({columns})")
+
+
+def _default_doctors(c, postgres):
+    if _scalar(c, "SELECT COUNT(*) FROM doctors") == 0:
+        logger.info("Seeding default doctors...")
+        c.execute("INSERT INTO doctors (name, email, specialization) VALUES (?, ?, ?)", ('Dr. Sarah Chen', 'sarah.chen@cardioai.com', 'Cardiology'))
+        c.execute("INSERT INTO doctors (name, email, specialization) VALUES (?, ?, ?)", ('Dr. Emily Ross', 'emily.ross@cardioai.com', 'Internal Medicine'))
+        c.execute("INSERT INTO doctors (name, email, specialization) VALUES (?, ?, ?)", ('Dr. Michael Torres', 'michael.torres@cardioai.com', 'Cardiology'))
+
+
+def _patient_identity_key(c, postgres):
+    """
+    patients.identity_key (utils.patient_identity_key) with a unique index, for
+    the single-statement find-or-create upsert. Existing patients that share a
+    key are merged into the lowest id (the row find-by-name used to pick): their
+    records and feedback move to it, it keeps the latest last_updated, and the
+    duplicate rows are deleted.
+    """
+    if postgres:
+        c.execute("ALTER TABLE patients ADD COLUMN IF NOT EXISTS identity_key TEXT")
+    elif "identity_key" not in {row[1] for row in c.execute("PRAGMA table_info(patients)").fetchall()}:
+        c.execute("ALTER TABLE patients ADD COLUMN identity_key TEXT")
+    survivors = {} # identity key -> lowest patient id
+    updates = []
+    merges = [] # (surviving id, duplicate id)
+    for patient_id, name, contact in map(_values, c.execute("SELECT id, name, contact FROM patients ORDER BY id").fetchall()):
+        key = patient_identity_key(name, contact)
+        if key in survivors:
+            merges.append((survivors[key], patient_id))
+        else:
+            survivors[key] = patient_id
+            updates.append((key, patient_id))
+    for start in range(0, len(merges), 10_000):
+        chunk = merges[start:start + 10_000]
+        c.executemany("UPDATE records SET patient_id = ? WHERE patient_id = ?", chunk)
+        c.executemany("UPDATE feedbacks SET patient_id = ? WHERE patient_id = ?", chunk)
+        c.executemany("""UPDATE patients SET last_updated = (SELECT MAX(p.last_updated) FROM patients p WHERE p.id IN (?, ?))
+                         WHERE id = ?""", [(survivor, duplicate, survivor) for survivor, duplicate in chunk])
+        c.executemany("DELETE FROM patients WHERE id = ?", [(duplicate,) for _, duplicate in chunk])
+    if merges:
+        logger.info(f"Merged {len(merges)} duplicate patients into {len({survivor for survivor, _ in merges})} "
+                    f"by identity key")
+    for start in range(0, len(updates), 10_000):
+        c.executemany("UPDATE patients SET identity_key = ? WHERE id = ?", updates[start:start + 10_000])
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_patients_identity_key ON patients(identity_key)")
+
+
+MIGRATIONS = [
+    (1, "baseline tables", _baseline_tables),
+    (2, "added columns", _added_columns),
+    (3, "record daily stats", _daily_stats_table),
+    (4, "access path indexes", _indexes),
+    (5, "default doctors", _default_doctors),
+    (6, "patient identity key", _patient_identity_key),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def applied_versions(conn) -> set:
+    """Versions recorded in schema_migrations (empty if the table does not exist yet)."""
+    if is_postgres(conn):
+        exists = _scalar(conn, "SELECT to_regclass('schema_migrations') IS NOT NULL")
+    else:
+        exists = _scalar(conn, "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'schema_migrations'")
+    if not exists:
+        return set()
+    return {_first(row) for row in conn.execute("SELECT version FROM schema_migrations").fetchall()}
+
+
+def migrate(conn) -> list:
+    """Apply pending migrations in one transaction; returns the (version, name) pairs applied."""
+    applied = applied_versions(conn)
+    conn.rollback() # End the read transaction before taking the lock
+    if all(version in applied for version, _, _ in MIGRATIONS):
+        return []
+
+    postgres = is_postgres(conn)
+    c = conn.cursor()
+    try:
+        if postgres:
+            c.execute("SELECT pg_advisory_xact_lock(?)", (ADVISORY_LOCK_KEY,))
+        else:
+            c.execute("BEGIN IMMEDIATE")
+        c.execute('''CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INTEGER PRIMARY KEY,
+                        name TEXT NOT NULL,
+                        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )''')
+        applied = applied_versions(conn) # Another worker may have migrated while we waited for the lock
+        done = []
+        for version, name, apply in MIGRATIONS:
+            if version in applied:
+                continue
+            apply(c, postgres)
+            c.execute("INSERT INTO schema_migrations (version, name) VALUES (?, ?)", (version, name))
+            done.append((version, name))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    for version, name in done:
+        logger.info(f"Applied schema migration {version:03d} ({name})")
+    if done:
+        analytics_cache.invalidate()
+    return done
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Apply or inspect schema migrations")
+    parser.add_argument("command", nargs="?", choices=("migrate", "status"), default="migrate")
+    args = parser.parse_args(argv)
+
+    conn = get_db_connection()
+    try:
+        if args.command == "migrate":
+            done = migrate(conn)
+            print(f"Applied {len(done)} migration(s); schema is at version {LATEST_VERSION}")
+            return 0
+        applied = applied_versions(conn)
+    finally:
+        conn.close()
+    for version, name, _ in MIGRATIONS:
+        print(f"  {version:03d} {name:<30} {'applied' if version in applied else 'pending'}")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,284 @@
+"""
+Group-commit write pipeline for prediction persistence.
+
+Request threads hand a write function (cursor -> result) to one writer thread,
+which runs every job that arrived within a short window inside a single
+transaction and commits once, so N concurrent predictions cost one commit
+(one fsync) instead of N. Each job runs under its own SAVEPOINT: a failing job
+is rolled back and reported to its caller without affecting the rest of the
+group. Callers block on a future, so they still get their patient/record IDs.
+"""
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from backend.database import is_postgres
+from backend.metrics import DB_RETRIES, DB_LOCK_WAIT
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class DatabaseBusyError(RuntimeError):
+    """The database stayed locked through every retry of a commit group."""
+
+
+def _is_locked(error: Exception) -> bool:
+    return isinstance(error, sqlite3.OperationalError) and "locked" in str(error)
+
+
+def write_with_retry(write_fn, connect, lock=None, max_retries: int = 5, retry_delay: float = 0.05,
+                     path: str = "sync"):
+    """
+    Run write_fn(cursor) in a transaction of its own and commit; returns its result.
+    The write path outside the group-commit writer (synchronous /predict, CLI rescoring):
+    takes the SQLite write lock up-front, backs off exponentially while another connection
+    holds it and raises DatabaseBusyError once max_retries attempts were locked out.
+    path labels the retry and lock-wait metrics.
+    """
+    if lock is not None:
+        wait_started = time.perf_counter()
+        lock.acquire()
+        DB_LOCK_WAIT.observe(time.perf_counter() - wait_started, path)
+    try:
+        for attempt in range(max_retries):
+            conn = connect()
+            try:
+                if not is_postgres(conn):
+                    conn.execute("BEGIN IMMEDIATE")
+                result = write_fn(conn.cursor())
+                conn.commit()
+                return result
+            except Exception as e:
+                conn.rollback()
+                if not _is_locked(e):
+                    raise
+                DB_RETRIES.inc(path)
+                logger.warning(f"Database locked ({path} write), retry {attempt + 1}/{max_retries}")
+            finally:
+                conn.close()
+            time.sleep(retry_delay * (2 ** attempt))
+        raise DatabaseBusyError("Database busy. Please try again.")
+    finally:
+        if lock is not None:
+            lock.release()
+
+
+class GroupCommitWriter:
+    """
+    Single writer thread committing queued jobs in groups.
+
+    A group closes when max_group_size jobs are collected or max_delay_ms has
+    passed. Like the micro-batcher, the delay is only applied once concurrent
+    writes have been observed; an isolated write commits immediately.
+    on_commit() runs once after each group that committed at least one job,
+    before the group's callers are released. Once stop() has begun, jobs are
+    committed on the submitting thread instead of being queued behind _STOP.
+    """
+
+    def __init__(self, connect, lock=None, max_group_size: int = 64, max_delay_ms: float = 5.0,
+                 max_retries: int = 5, retry_delay: float = 0.05, on_commit=None):
+        self.connect = connect
+        self.lock = lock
+        self.on_commit = on_commit
+        self.max_group_size = max(1, int(max_group_size))
+        self.max_delay = max_delay_ms / 1000.0
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stopping = False # Set by stop(), cleared by start(); guarded by _state_lock
+        self._state_lock = threading.Lock()
+        self._last_group_size = 1
+        self._stats_lock = threading.Lock()
+        self._jobs = 0
+        self._groups = 0
+        self._failed_jobs = 0
+        self._retries = 0
+        self._max_group_seen = 0
+        self._commit_time_total = 0.0
+        self._commit_time_max = 0.0
+        self._last_commit_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        with self._state_lock:
+            self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="group-commit-writer", daemon=True)
+        self._thread.start()
+        logger.info(f"Group-commit writer started (max group {self.max_group_size}, "
+                    f"delay {self.max_delay * 1000:.1f} ms)")
+
+    def stop(self, timeout: float = 10.0):
+        """Stop accepting jobs, let the writer thread flush the queue, then commit any leftovers inline."""
+        with self._state_lock:
+            self._stopping = True # From here on submit() commits inline, so nothing new is queued
+        if self.running:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            if self.running:
+                logger.warning(f"Group-commit writer still busy after {timeout:.1f}s; leaving it to finish")
+                return
+        self._thread = None
+        leftovers = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftovers.append(item)
+        if leftovers:
+            logger.info(f"Group-commit writer stopped with {len(leftovers)} queued jobs; committing them inline")
+            self._commit_group(leftovers)
+
+    def submit(self, write_fn) -> Future:
+        """Queue write_fn(cursor); once stop() has begun it is committed on this thread before returning."""
+        future = Future()
+        with self._state_lock:
+            if not self._stopping:
+                self._queue.put((write_fn, future))
+                return future
+        self._commit_group([(write_fn, future)])
+        return future
+
+    def write(self, write_fn, timeout: float = 60.0):
+        """
+        Queue write_fn(cursor) and block until its group has committed; returns its result.
+        Raises DatabaseBusyError if that takes longer than timeout (the job may still commit later).
+        """
+        future = self.submit(write_fn)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            raise DatabaseBusyError(f"Write not committed within {timeout:.1f}s. Database busy. Please try again.")
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "running": self.running,
+                "queue_depth": self._queue.qsize(),
+                "jobs": self._jobs,
+                "groups": self._groups,
+                "failed_jobs": self._failed_jobs,
+                "retries": self._retries,
+                "avg_group_size": round(self._jobs / self._groups, 2) if self._groups else 0.0,
+                "max_group_seen": self._max_group_seen,
+                "avg_commit_ms": round(self._commit_time_total / self._groups * 1000, 3) if self._groups else 0.0,
+                "max_commit_ms": round(self._commit_time_max * 1000, 3),
+                "last_commit_ms": round(self._last_commit_ms, 3),
+            }
+
+    def _collect(self, first):
+        group = [first]
+        wait = self._last_group_size > 1 or not self._queue.empty()
+        deadline = time.perf_counter() + (self.max_delay if wait else 0.0)
+        while len(group) < self.max_group_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP) # Commit this group, stop on the next loop
+                break
+            group.append(item)
+        return group
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            self._commit_group(self._collect(first))
+
+    def _commit_group(self, group):
+        started = time.perf_counter()
+        outcomes = None
+        error = None
+        for attempt in range(self.max_retries):
+            try:
+                outcomes = self._execute(group)
+                break
+            except Exception as e:
+                if not _is_locked(e):
+                    error = e
+                    break
+                with self._stats_lock:
+                    self._retries += 1
+                DB_RETRIES.inc("group_commit")
+                logger.warning(f"Database locked during group commit ({len(group)} jobs), "
+                               f"retry {attempt + 1}/{self.max_retries}")
+                time.sleep(self.retry_delay * (2 ** attempt))
+        else:
+            error = DatabaseBusyError("Database busy. Please try again.")
+
+        if outcomes is None:
+            logger.error(f"Group commit failed ({len(group)} jobs): {error}")
+            outcomes = [(False, error)] * len(group)
+        elif self.on_commit is not None and any(ok for ok, _ in outcomes):
+            try:
+                self.on_commit()
+            except Exception as e:
+                logger.error(f"Group commit hook failed: {e}")
+        for (_, future), (ok, value) in zip(group, outcomes):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+        self._record(group, outcomes, time.perf_counter() - started)
+
+    def _execute(self, group):
+        """Run every job of the group in one transaction (one SAVEPOINT per job) and commit once."""
+        if self.lock is not None:
+            wait_started = time.perf_counter()
+            self.lock.acquire()
+            DB_LOCK_WAIT.observe(time.perf_counter() - wait_started, "group_commit")
+        try:
+            conn = self.connect()
+            try:
+                if not is_postgres(conn):
+                    conn.execute("BEGIN IMMEDIATE") # Take the write lock up-front, for the whole group
+                c = conn.cursor()
+                outcomes = []
+                for write_fn, _ in group:
+                    c.execute("SAVEPOINT group_job")
+                    try:
+                        outcomes.append((True, write_fn(c)))
+                    except Exception as e:
+                        if _is_locked(e):
+                            raise
+                        c.execute("ROLLBACK TO SAVEPOINT group_job")
+                        outcomes.append((False, e))
+                    c.execute("RELEASE SAVEPOINT group_job")
+                conn.commit()
+                return outcomes
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+        finally:
+            if self.lock is not None:
+                self.lock.release()
+
+    def _record(self, group, outcomes, elapsed: float):
+        size = len(group)
+        self._last_group_size = size
+        with self._stats_lock:
+            self._jobs += size
+            self._groups += 1
+            self._failed_jobs += sum(1 for ok, _ in outcomes if not ok)
+            self._max_group_seen = max(self._max_group_seen, size)
+            self._commit_time_total += elapsed
+            self._commit_time_max = max(self._commit_time_max, elapsed)
+            self._last_commit_ms = elapsed * 1000
@@ -0,0 +1,248 @@
+"""
+Thread-safe connection pool shared by the SQLite and PostgreSQL backends.
+
+Opening a connection costs a TCP + auth handshake on Postgres and a file open
+plus PRAGMA on SQLite, so connections are borrowed from a pool instead:
+
+    with pool.connection() as conn:     # returned to the pool even if the block raises
+        conn.execute(...)
+        conn.commit()
+
+Borrowed connections are PooledConnection proxies whose close() hands the
+connection back (calling it twice is harmless), so code written against
+plain connections keeps working. Returning a connection rolls back whatever
+it left uncommitted. Connections older than max_lifetime are retired on
+return, connections idle for longer than health_check_after are probed before
+they are handed out, and a borrower waits at most `timeout` seconds for a free
+slot before PoolTimeoutError is raised.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from backend.metrics import DB_POOL_WAIT
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(RuntimeError):
+    """No pooled connection became free within the borrow timeout."""
+
+
+def _rollback(raw):
+    raw.rollback()
+
+
+class PooledConnection:
+    """Borrowed connection: attribute access goes to the real connection, close() returns it to the pool."""
+
+    def __init__(self, pool, raw, created_at: float):
+        object.__setattr__(self, "_pool", pool)
+        object.__setattr__(self, "_raw", raw)
+        object.__setattr__(self, "_created_at", created_at)
+
+    @property
+    def raw(self):
+        raw = self._raw
+        if raw is None:
+            raise RuntimeError("Connection was already returned to the pool")
+        return raw
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.raw, name, value)
+
+    def close(self):
+        raw = self._raw
+        if raw is not None:
+            object.__setattr__(self, "_raw", None)
+            self._pool.release(raw, self._created_at)
+
+    # Unlike sqlite3's `with conn:` this does not commit: leaving the block returns the connection
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        # Safety net for code paths that forget close() (e.g. an exception before it)
+        if self.__dict__.get("_raw") is not None:
+            logger.warning("Pooled connection garbage-collected without close(); returning it to the pool")
+            self.close()
+
+
+class ConnectionPool:
+    """
+    Up to max_size connections made by connect(); min_size of them are opened
+    up-front. check(raw) probes a connection (raising if it is dead) and
+    reset(raw) cleans one up before it goes back into the pool (by default it
+    rolls back, so no open transaction or read snapshot reaches the next borrower).
+    """
+
+    def __init__(self, connect, min_size: int = 1, max_size: int = 10, timeout: float = 30.0,
+                 max_lifetime: float = 1800.0, health_check_after: float = 30.0, check=None, reset=_rollback,
+                 name: str = "db"):
+        self.connect = connect
+        self.max_size = max(1, int(max_size))
+        self.min_size = min(max(0, int(min_size)), self.max_size)
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self.check = check
+        self.reset = reset
+        self.name = name
+        self._idle = deque() # (raw, created_at, returned_at); the most recently returned is reused first
+        self._size = 0 # Open connections, idle or borrowed
+        self._waiting = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._borrows = 0
+        self._created = 0
+        self._retired = 0
+        self._timeouts = 0
+        self._health_check_failures = 0
+        self._wait_time_total = 0.0
+        for _ in range(self.min_size):
+            try:
+                raw = self._open()
+            except Exception as e:
+                logger.warning(f"Could not pre-open {self.name} pool connection: {e}")
+                break
+            with self._cond:
+                self._size += 1
+                self._idle.append((raw, time.monotonic(), time.monotonic()))
+
+    def _open(self):
+        raw = self.connect()
+        with self._cond:
+            self._created += 1
+        return raw
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._retired += 1
+
+    def acquire(self, timeout: float = None) -> PooledConnection:
+        """Borrow a connection, waiting up to timeout (default: the pool's) for a free slot."""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        entry = None
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"The {self.name} connection pool is closed")
+            self._waiting += 1
+            try:
+                while True:
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1 # Reserve the slot; the connection is opened outside the lock
+                        break
+                    remaining = started + timeout - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(f"No {self.name} connection free within {timeout:.1f}s "
+                                               f"({self.max_size} in use)")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._borrows += 1
+
+        try:
+            raw, created_at = self._checked_out(entry)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        waited = time.monotonic() - started
+        with self._cond:
+            self._wait_time_total += waited
+        DB_POOL_WAIT.observe(waited, self.name)
+        return PooledConnection(self, raw, created_at)
+
+    def _checked_out(self, entry):
+        """Turn an idle entry (or None for a reserved slot) into a usable (raw, created_at)."""
+        if entry is not None:
+            raw, created_at, returned_at = entry
+            now = time.monotonic()
+            if now - created_at > self.max_lifetime:
+                self._discard(raw)
+            elif self.check is not None and now - returned_at > self.health_check_after:
+                try:
+                    self.check(raw)
+                    return raw, created_at
+                except Exception as e:
+                    logger.warning(f"Discarding dead {self.name} pool connection: {e}")
+                    with self._cond:
+                        self._health_check_failures += 1
+                    self._discard(raw)
+            else:
+                return raw, created_at
+        return self._open(), time.monotonic()
+
+    def release(self, raw, created_at: float):
+        """Give a borrowed connection back; it is rolled back, and closed if broken, too old or the pool is closed."""
+        healthy = True
+        if self.reset is not None:
+            try:
+                self.reset(raw)
+            except Exception as e:
+                logger.warning(f"Discarding {self.name} pool connection that failed to reset: {e}")
+                healthy = False
+        if not healthy or self._closed or time.monotonic() - created_at > self.max_lifetime:
+            self._discard(raw)
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append((raw, created_at, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def close(self):
+        """Close idle connections now and borrowed ones as they come back."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for raw, _, _ in idle:
+            self._discard(raw)
+
+    def stats(self) -> dict:
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                "name": self.name,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": idle,
+                "in_use": self._size - idle,
+                "waiting": self._waiting,
+                "borrows": self._borrows,
+                "created": self._created,
+                "retired": self._retired,
+                "timeouts": self._timeouts,
+                "health_check_failures": self._health_check_failures,
+                "avg_wait_ms": round(self._wait_time_total / self._borrows * 1000, 3) if self._borrows else 0.0,
+            }
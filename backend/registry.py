@@ -0,0 +1,432 @@
+"""
+Versioned model registry with atomic hot swap.
+
+Layout (MODEL_REGISTRY_DIR, default backend/models/registry):
+
+    manifest.json            {"active": "v2", "previous": "v1", "versions": {...}}
+    v1/heart_model.pkl
+    v1/scaler.pkl
+    v1/bundle/...            checksummed compiled-forest bundle (backend.bundle), served when present
+    v2/...
+
+The serving process holds one immutable LoadedModel at a time. Activating a
+version loads, compiles, verifies and warms it off the request path, then
+swaps the reference in one assignment; in-flight requests finish on the model
+they started with. The previously active model stays in memory so rollback is
+an instant swap. Without a manifest, the legacy backend/models/*.pkl pair is
+served under a content-hash version.
+
+Registering a version also writes its bundle, so servers load it without
+pickle or scikit-learn in milliseconds; a bundle that fails its checksum or
+feature-schema check is never served.
+
+CLI:
+    python -m backend.registry list
+    python -m backend.registry register --model heart_model.pkl --scaler scaler.pkl [--version v3] [--activate]
+    python -m backend.registry activate v3
+    python -m backend.registry bundle v2                # (re)build the bundle of an existing version
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from backend.bundle import BUNDLE_DIR, load_bundle, verify_estimators, write_bundle
+from backend.cascade import CascadeForest, record_tiers
+from backend.forest import compile_forest, max_probability_error, probe_matrix, verification_matrix
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(BASE_DIR, "models")
+REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", os.path.join(MODELS_DIR, "registry"))
+MODEL_FILE = "heart_model.pkl"
+SCALER_FILE = "scaler.pkl"
+MANIFEST_FILE = "manifest.json"
+
+COMPILED_TOLERANCE = 1e-9
+
+
+def artifact_version(*paths) -> str:
+    """Short content hash identifying a set of model artifacts."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+class LoadedModel:
+    """An immutable, ready-to-serve model version (sklearn objects + optional compiled engine and cascade)."""
+
+    def __init__(self, version: str, model, scaler, engine=None, source: str = None, cascade=None, bundle: dict = None):
+        self.version = version
+        self.model = model # None when served from a bundle
+        self.scaler = scaler
+        self.engine = engine
+        self.source = source
+        self.cascade = cascade
+        self.bundle = bundle # Bundle manifest, if loaded from one
+        self.loaded_at = datetime.utcnow().isoformat()
+
+    @property
+    def n_features(self) -> int:
+        return len(self.bundle["feature_schema"]) if self.bundle else self.model.n_features_in_
+
+    @property
+    def artifact_dir(self):
+        """Directory holding memory-mappable forest arrays (bundles only)."""
+        return self.source if self.bundle else None
+
+    @classmethod
+    def from_files(cls, version: str, model_path: str, scaler_path: str, compiled: bool = True,
+                   cascade: dict = None) -> "LoadedModel":
+        """
+        cascade: CascadeForest settings (first_trees, margin, z) to enable tiered inference, or None.
+        Raises BundleSchemaError if the pair was fitted on other features than FEATURE_COLUMNS.
+        """
+        with open(model_path, "rb") as f:
+            model = pickle.load(f)
+        with open(scaler_path, "rb") as f:
+            scaler = pickle.load(f)
+        verify_estimators(model, scaler, source=f"Model {version}")
+        engine = compile_verified(model, scaler) if compiled else None
+        tiers = CascadeForest(engine, **cascade) if engine is not None and cascade else None
+        loaded = cls(version, model, scaler, engine, source=os.path.dirname(model_path), cascade=tiers)
+        loaded.warm()
+        return loaded
+
+    @classmethod
+    def from_bundle(cls, version: str, bundle_dir: str, cascade: dict = None) -> "LoadedModel":
+        """Load a verified bundle (raises BundleError on checksum or feature-schema mismatch)."""
+        engine, manifest = load_bundle(bundle_dir)
+        tiers = CascadeForest(engine, **cascade) if cascade else None
+        loaded = cls(version, None, None, engine, source=bundle_dir, cascade=tiers, bundle=manifest)
+        loaded.warm()
+        return loaded
+
+    def predict(self, matrix: np.ndarray):
+        """Return (predicted classes, class probabilities) for a raw feature matrix."""
+        if self.engine is not None:
+            return self.engine.predict(matrix)
+        probabilities = self.model.predict_proba(self.scaler.transform(matrix))
+        return self.model.classes_[probabilities.argmax(axis=1)], probabilities
+
+    def explain(self, matrix: np.ndarray, count_tiers: bool = True):
+        """
+        Return (predicted classes, class probabilities, per-feature contributions or None without the compiled engine).
+        count_tiers=False keeps the rows out of the cascade answer metrics (offline rescoring, warm-up).
+        """
+        if self.cascade is not None:
+            predictions, probabilities, contributions, early = self.cascade.explain(matrix)
+            if count_tiers:
+                record_tiers(early)
+            return predictions, probabilities, contributions
+        if self.engine is not None:
+            return self.engine.explain(matrix)
+        return (*self.predict(matrix), None)
+
+    def warm(self):
+        """Run one prediction so lazy initialisation happens before the model takes traffic."""
+        self.explain(probe_matrix(self.scaler, self.n_features, n_rows=1), count_tiers=False) # Not served traffic
+
+    def describe(self) -> dict:
+        return {
+            "version": self.version,
+            "engine": "compiled" if self.engine is not None else "sklearn",
+            "format": "bundle" if self.bundle else "pickle",
+            "checksum": self.bundle["checksum"][:12] if self.bundle else None,
+            "cascade": self.cascade.describe() if self.cascade is not None else None,
+            "source": self.source,
+            "loaded_at": self.loaded_at,
+        }
+
+
+def compile_verified(model, scaler):
+    """Compile the forest and return it only if it matches sklearn on probe rows, split boundaries included."""
+    try:
+        engine = compile_forest(model, scaler)
+        error = max_probability_error(engine, model, scaler, verification_matrix(engine, scaler, model.n_features_in_))
+        if error > COMPILED_TOLERANCE:
+            logger.error(f"Compiled forest disagrees with sklearn (max error {error:.2e}); using sklearn")
+            return None
+        logger.info(f"Compiled forest ready: {engine.n_trees} trees, {engine.n_nodes} nodes, depth {engine.max_depth}")
+        return engine
+    except Exception as e:
+        logger.error(f"Forest compilation failed, using sklearn: {e}")
+        return None
+
+
+class ModelRegistry:
+    def __init__(self, registry_dir: str = REGISTRY_DIR, legacy_model_path: str = None,
+                 legacy_scaler_path: str = None, compiled: bool = True, cascade: dict = None):
+        self.registry_dir = registry_dir
+        self.legacy_model_path = legacy_model_path or os.path.join(MODELS_DIR, MODEL_FILE)
+        self.legacy_scaler_path = legacy_scaler_path or os.path.join(MODELS_DIR, SCALER_FILE)
+        self.compiled = compiled
+        self.cascade = cascade # CascadeForest settings applied to every loaded version, or None
+        self._current = None
+        self._previous = None
+        self._swap_lock = threading.Lock()
+        self._listeners = []
+        self._watcher = None
+        self._watch_stop = threading.Event()
+        self.last_activation = None
+
+    # --- Serving side ---
+    @property
+    def current(self) -> LoadedModel:
+        return self._current
+
+    def on_activate(self, callback):
+        """Register callback(loaded_model) to run after every swap."""
+        self._listeners.append(callback)
+
+    def load_active(self) -> LoadedModel:
+        """Load whatever the manifest marks active (or the legacy artifacts) at startup."""
+        manifest = self.read_manifest()
+        active = manifest.get("active")
+        legacy = self.legacy_version()
+        if active and active.startswith("legacy-") and legacy and active != legacy:
+            # The legacy pickles were retrained in place since the manifest was written
+            logger.warning(f"Active model {active} no longer matches the legacy artifacts; serving {legacy}")
+            active = legacy
+        if active:
+            loaded = self._load_version(active)
+        elif legacy:
+            loaded = LoadedModel.from_files(legacy, self.legacy_model_path, self.legacy_scaler_path, self.compiled,
+                                           self.cascade)
+        else:
+            raise FileNotFoundError(f"No active model in {self.registry_dir} and no legacy artifacts in {MODELS_DIR}")
+        self._swap(loaded)
+        return loaded
+
+    def activate(self, version: str) -> LoadedModel:
+        """Load, compile and warm a registered version, then swap it in and record it in the manifest."""
+        self.last_activation = {"version": version, "state": "loading", "started_at": datetime.utcnow().isoformat()}
+        try:
+            current = self._current
+            if current is not None and current.version == version:
+                loaded = current
+            else:
+                loaded = self._load_version(version)
+                self._swap(loaded)
+            self._update_manifest(active=version, previous=self._previous.version if self._previous else None)
+            self.last_activation.update(state="active", finished_at=datetime.utcnow().isoformat())
+            return loaded
+        except Exception as e:
+            self.last_activation.update(state="failed", error=str(e), finished_at=datetime.utcnow().isoformat())
+            raise
+
+    def rollback(self) -> LoadedModel:
+        """Swap back to the previously active model (already in memory)."""
+        with self._swap_lock:
+            previous = self._previous
+            if previous is None:
+                raise ValueError("No previous model version to roll back to")
+            self._previous, self._current = self._current, previous
+        logger.info(f"Rolled back to model {previous.version}")
+        self._notify(previous)
+        self._update_manifest(active=previous.version, previous=self._previous.version)
+        return previous
+
+    def _swap(self, loaded: LoadedModel):
+        with self._swap_lock:
+            if self._current is not None:
+                self._previous = self._current
+            self._current = loaded
+        logger.info(f"Model {loaded.version} is now serving")
+        self._notify(loaded)
+
+    def _notify(self, loaded: LoadedModel):
+        for callback in self._listeners:
+            try:
+                callback(loaded)
+            except Exception as e:
+                logger.error(f"Model activation hook failed: {e}")
+
+    def legacy_version(self):
+        """Version name of the pre-registry artifacts on disk ("legacy-<hash>"), or None without them."""
+        if os.path.exists(self.legacy_model_path) and os.path.exists(self.legacy_scaler_path):
+            return "legacy-" + artifact_version(self.legacy_model_path, self.legacy_scaler_path)
+        return None
+
+    def has_version(self, version: str) -> bool:
+        if version.startswith("legacy-"):
+            return version == self.legacy_version()
+        if version in ("", ".", "..") or os.path.basename(version) != version:
+            return False # Only plain directory names inside the registry
+        return os.path.isdir(os.path.join(self.registry_dir, version))
+
+    def _load_version(self, version: str) -> LoadedModel:
+        """Load a version from its bundle when there is one (and compiled serving is on), else from the pickles."""
+        if version.startswith("legacy-"):
+            # Rolling back to (or restarting on) the pre-registry artifacts, only under their real hash
+            if version != self.legacy_version():
+                raise FileNotFoundError(f"Model version '{version}' does not match the legacy artifacts in {MODELS_DIR}")
+            return LoadedModel.from_files(version, self.legacy_model_path, self.legacy_scaler_path, self.compiled,
+                                          self.cascade)
+        version_dir = os.path.join(self.registry_dir, version)
+        if not os.path.isdir(version_dir):
+            raise FileNotFoundError(f"Model version '{version}' not found in {self.registry_dir}")
+        bundle_dir = os.path.join(version_dir, BUNDLE_DIR)
+        if self.compiled and os.path.isdir(bundle_dir):
+            return LoadedModel.from_bundle(version, bundle_dir, self.cascade)
+        return LoadedModel.from_files(
+            version, os.path.join(version_dir, MODEL_FILE), os.path.join(version_dir, SCALER_FILE), self.compiled,
+            self.cascade
+        )
+
+    # --- Watcher (keeps several server processes on the manifest's active version) ---
+    def start_watcher(self, interval_seconds: float):
+        if interval_seconds <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, args=(interval_seconds,), name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._watch_stop.set()
+
+    def _watch(self, interval_seconds: float):
+        while not self._watch_stop.wait(interval_seconds):
+            try:
+                active = self.read_manifest().get("active")
+                current = self._current
+                if not active or (current is not None and current.version == active):
+                    continue
+                if self._previous is not None and self._previous.version == active:
+                    self.rollback()
+                else:
+                    self._swap(self._load_version(active))
+            except Exception as e:
+                logger.error(f"Model watcher failed: {e}")
+
+    # --- Manifest ---
+    def read_manifest(self) -> dict:
+        path = os.path.join(self.registry_dir, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return {"active": None, "previous": None, "versions": {}}
+        with open(path) as f:
+            return json.load(f)
+
+    def write_manifest(self, manifest: dict):
+        os.makedirs(self.registry_dir, exist_ok=True)
+        path = os.path.join(self.registry_dir, MANIFEST_FILE)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def _update_manifest(self, **fields):
+        manifest = self.read_manifest()
+        manifest.update(fields)
+        self.write_manifest(manifest)
+
+    def list_versions(self) -> dict:
+        manifest = self.read_manifest()
+        return {
+            "active": manifest.get("active"),
+            "previous": manifest.get("previous"),
+            "serving": self._current.describe() if self._current else None,
+            "versions": manifest.get("versions", {}),
+            "last_activation": self.last_activation,
+        }
+
+    def register(self, model_path: str, scaler_path: str, version: str = None, metadata: dict = None) -> str:
+        """Copy a model/scaler pair into the registry as a new version; returns the version id."""
+        manifest = self.read_manifest()
+        versions = manifest.setdefault("versions", {})
+        if version is None:
+            version = f"v{len(versions) + 1}"
+            while version in versions or os.path.exists(os.path.join(self.registry_dir, version)):
+                version = f"v{int(version[1:]) + 1}"
+        elif version in versions:
+            raise ValueError(f"Model version '{version}' already exists")
+
+        version_dir = os.path.join(self.registry_dir, version)
+        os.makedirs(version_dir)
+        shutil.copyfile(model_path, os.path.join(version_dir, MODEL_FILE))
+        shutil.copyfile(scaler_path, os.path.join(version_dir, SCALER_FILE))
+        versions[version] = {
+            "created_at": datetime.utcnow().isoformat(),
+            "checksum": artifact_version(os.path.join(version_dir, MODEL_FILE), os.path.join(version_dir, SCALER_FILE)),
+            **(metadata or {}),
+        }
+        try:
+            bundle = self.build_bundle(version, metadata)
+        except Exception:
+            shutil.rmtree(version_dir, ignore_errors=True) # e.g. BundleSchemaError: never half-register
+            raise
+        if bundle is not None:
+            versions[version]["bundle_checksum"] = bundle["checksum"]
+        self.write_manifest(manifest)
+        logger.info(f"Registered model version {version}")
+        return version
+
+    def build_bundle(self, version: str, metrics: dict = None):
+        """Compile a registered version's pickles into its bundle; returns the bundle manifest (None if it cannot compile)."""
+        version_dir = os.path.join(self.registry_dir, version)
+        with open(os.path.join(version_dir, MODEL_FILE), "rb") as f:
+            model = pickle.load(f)
+        with open(os.path.join(version_dir, SCALER_FILE), "rb") as f:
+            scaler = pickle.load(f)
+        verify_estimators(model, scaler, source=f"Model {version}") # The bundle is stamped with FEATURE_COLUMNS
+        engine = compile_verified(model, scaler)
+        if engine is None:
+            logger.warning(f"Model version {version} could not be compiled; it will be served from its pickles")
+            return None
+        return write_bundle(os.path.join(version_dir, BUNDLE_DIR), engine, version, metrics)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CardioAI model registry")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list")
+    register_cmd = sub.add_parser("register")
+    register_cmd.add_argument("--model", required=True)
+    register_cmd.add_argument("--scaler", required=True)
+    register_cmd.add_argument("--version")
+    register_cmd.add_argument("--activate", action="store_true")
+    activate_cmd = sub.add_parser("activate")
+    activate_cmd.add_argument("version")
+    bundle_cmd = sub.add_parser("bundle")
+    bundle_cmd.add_argument("version")
+    args = parser.parse_args()
+
+    registry = ModelRegistry()
+    if args.command == "list":
+        print(json.dumps(registry.read_manifest(), indent=2))
+    elif args.command == "register":
+        version = registry.register(args.model, args.scaler, args.version)
+        print(f"Registered {version}")
+        if args.activate:
+            registry._update_manifest(active=version, previous=registry.read_manifest().get("active"))
+            print(f"Marked {version} active (running servers pick it up via the watcher or /admin/models)")
+    elif args.command == "activate":
+        if not os.path.isdir(os.path.join(registry.registry_dir, args.version)):
+            raise SystemExit(f"Unknown version {args.version}")
+        registry._update_manifest(active=args.version, previous=registry.read_manifest().get("active"))
+        print(f"Marked {args.version} active (running servers pick it up via the watcher or /admin/models)")
+    elif args.command == "bundle":
+        manifest = registry.read_manifest()
+        if args.version not in manifest.get("versions", {}):
+            raise SystemExit(f"Unknown version {args.version}")
+        bundle = registry.build_bundle(args.version, manifest["versions"][args.version])
+        if bundle is None:
+            raise SystemExit(f"Version {args.version} could not be compiled into a bundle")
+        manifest["versions"][args.version]["bundle_checksum"] = bundle["checksum"]
+        registry.write_manifest(manifest)
+        print(f"Bundle for {args.version} written (checksum {bundle['checksum'][:12]})")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,259 @@
+"""
+Resumable offline rescoring of the records table.
+
+After a model change every stored risk_score / risk_level (and the
+denormalized patients.risk_level / system_notes) reflect the old model. The
+rescorer walks records in keyset order (id > last_id ORDER BY id LIMIT n),
+decodes each chunk's input_data, scores it with one vectorized model call and
+writes it back in one short transaction. The last committed id is checkpointed
+to a JSON file after every chunk, so an interrupted run resumes where it
+stopped. Between chunks it sleeps so that it is busy at most --max-duty of the
+time, leaving the database to live /predict writes.
+
+CLI:
+    python -m backend.rescore                       # rescore stale records with the active model
+    python -m backend.rescore --version v3 --max-duty 0.25
+    python -m backend.rescore --reset --all         # start over, including records already on the version
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from backend.config import FEATURE_COLUMNS, classify_risk_batch
+from backend import analytics_cache, rollups
+from backend.database import BASE_DIR, get_db_connection
+from backend.persistence import write_with_retry
+from backend.utils import generate_system_notes, top_contributors
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_PATH = os.getenv("RESCORE_CHECKPOINT", os.path.join(BASE_DIR, "rescore-checkpoint.json"))
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_MAX_DUTY = 0.5
+
+
+def decode_features(rows):
+    """Bulk-decode input_data JSON; returns (feature matrix, valid-row mask, decoded payloads)."""
+    matrix = np.full((len(rows), len(FEATURE_COLUMNS)), np.nan)
+    payloads = [None] * len(rows)
+    for i, row in enumerate(rows):
+        try:
+            payload = json.loads(row["input_data"])
+            matrix[i] = [float(payload[col]) for col in FEATURE_COLUMNS]
+            payloads[i] = payload
+        except (TypeError, ValueError, KeyError):
+            pass # Left as NaN -> skipped
+    return matrix, np.isfinite(matrix).all(axis=1), payloads
+
+
+def commit_chunk(write_fn):
+    """Default Rescorer write_fn outside the API: a retried transaction of its own, then invalidate the analytics cache."""
+    result = write_with_retry(write_fn, get_db_connection, max_retries=10, retry_delay=0.1, path="rescore")
+    analytics_cache.invalidate()
+    return result
+
+
+class Rescorer:
+    """
+    Rescores records with one LoadedModel. write_fn(write) runs write(cursor) in a
+    committed transaction (the API passes its group-commit `persist`).
+    """
+
+    def __init__(self, loaded, write_fn=commit_chunk, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 max_duty: float = DEFAULT_MAX_DUTY, checkpoint_path: str = CHECKPOINT_PATH, only_stale: bool = True):
+        self.loaded = loaded
+        self.write_fn = write_fn
+        self.chunk_size = max(1, int(chunk_size))
+        self.max_duty = min(1.0, max(0.01, float(max_duty)))
+        self.checkpoint_path = checkpoint_path
+        self.only_stale = only_stale
+        self.stop_event = threading.Event()
+        self.state = {"state": "idle", "version": loaded.version}
+
+    # --- Checkpoint ---
+    def load_checkpoint(self) -> dict:
+        if not os.path.exists(self.checkpoint_path):
+            return {}
+        with open(self.checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("version") != self.loaded.version:
+            logger.info(f"Checkpoint is for model {checkpoint.get('version')}, starting over for {self.loaded.version}")
+            return {}
+        if checkpoint.get("finished_at"):
+            return {} # A new pass only touches records written since (stale filter)
+        return checkpoint
+
+    def save_checkpoint(self, checkpoint: dict):
+        tmp_path = f"{self.checkpoint_path}.tmp-{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f, indent=2)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def reset(self):
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    # --- Run ---
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self) -> dict:
+        checkpoint = {
+            "version": self.loaded.version,
+            "last_id": 0,
+            "processed": 0,
+            "updated": 0,
+            "skipped": 0,
+            "started_at": datetime.utcnow().isoformat(),
+            **self.load_checkpoint(),
+        }
+        if checkpoint["last_id"]:
+            logger.info(f"Resuming rescoring for {self.loaded.version} after record {checkpoint['last_id']}")
+        self.state = {"state": "running", **checkpoint}
+
+        while not self.stop_event.is_set():
+            started = time.perf_counter()
+            try:
+                rows = self.fetch_chunk(checkpoint["last_id"])
+                updated, skipped = self.rescore_chunk(rows) if rows else (0, 0)
+            except Exception as e:
+                self.state = {"state": "failed", "error": str(e), **checkpoint}
+                raise
+            if not rows:
+                checkpoint["finished_at"] = datetime.utcnow().isoformat()
+                self.save_checkpoint(checkpoint)
+                self.state = {"state": "finished", **checkpoint}
+                logger.info(f"Rescoring finished: {checkpoint['updated']} records updated, {checkpoint['skipped']} skipped")
+                return self.state
+
+            checkpoint["last_id"] = rows[-1]["id"]
+            checkpoint["processed"] += len(rows)
+            checkpoint["updated"] += updated
+            checkpoint["skipped"] += skipped
+            checkpoint["updated_at"] = datetime.utcnow().isoformat()
+            self.save_checkpoint(checkpoint)
+            self.state = {"state": "running", **checkpoint}
+
+            # Duty-cycle throttle: idle long enough that work is at most max_duty of wall time
+            busy = time.perf_counter() - started
+            self.stop_event.wait(busy * (1 - self.max_duty) / self.max_duty)
+
+        self.state = {"state": "stopped", **checkpoint}
+        logger.info(f"Rescoring stopped after record {checkpoint['last_id']} (resume to continue)")
+        return self.state
+
+    def fetch_chunk(self, last_id: int):
+        query = "SELECT id, patient_id, input_data FROM records WHERE id > ?"
+        params = [last_id]
+        if self.only_stale:
+            query += " AND (model_version IS NULL OR model_version != ?)"
+            params.append(self.loaded.version)
+        query += " ORDER BY id LIMIT ?"
+        params.append(self.chunk_size)
+        conn = get_db_connection()
+        try:
+            return conn.execute(query, tuple(params)).fetchall()
+        finally:
+            conn.close()
+
+    def rescore_chunk(self, rows):
+        matrix, valid, payloads = decode_features(rows)
+        indices = np.flatnonzero(valid)
+        if not len(indices):
+            return 0, len(rows)
+        predictions, probabilities, contributions = self.loaded.explain(matrix[indices], count_tiers=False)
+        probabilities = probabilities[:, 1]
+        risk_levels = classify_risk_batch(probabilities)
+        version = self.loaded.version
+        updates = [
+            (int(predictions[j]), float(probabilities[j]), risk_levels[j], float(probabilities[j]), version, rows[i]["id"])
+            for j, i in enumerate(indices)
+        ]
+        # Latest record per patient in this chunk, for the denormalized patient columns
+        latest = {}
+        for j, i in enumerate(indices):
+            latest[rows[i]["patient_id"]] = (rows[i]["id"], j, i)
+
+        def write(c):
+            # Move the rescored records between risk levels in the analytics rollup (same transaction)
+            deltas = {}
+            record_ids = [update[-1] for update in updates]
+            new_values = {update[-1]: (update[2], update[3]) for update in updates}
+            for start in range(0, len(record_ids), 500): # Stay under SQLite's bound-parameter limit
+                batch = record_ids[start:start + 500]
+                for row in c.execute(
+                    f"""SELECT id, DATE(created_at) AS day, doctor_id, risk_level, model_probability FROM records
+                        WHERE id IN ({",".join("?" * len(batch))}) AND created_at IS NOT NULL""",
+                    tuple(batch),
+                ).fetchall():
+                    level, probability = new_values[row["id"]]
+                    rollups.accumulate(deltas, row["day"], row["doctor_id"], row["risk_level"], row["model_probability"], -1)
+                    rollups.accumulate(deltas, row["day"], row["doctor_id"], level, probability)
+            rollups.apply_deltas(c, deltas)
+
+            c.executemany(
+                """UPDATE records SET prediction_result = ?, risk_score = ?, risk_level = ?, model_probability = ?, model_version = ?
+                   WHERE id = ?""",
+                updates,
+            )
+            patient_ids = [pid for pid in latest if pid is not None]
+            if not patient_ids:
+                return
+            placeholders = ",".join("?" * len(patient_ids))
+            newest = {
+                row["patient_id"]: row["id"]
+                for row in c.execute(
+                    f"SELECT patient_id, MAX(id) AS id FROM records WHERE patient_id IN ({placeholders}) GROUP BY patient_id",
+                    tuple(patient_ids),
+                ).fetchall()
+            }
+            c.executemany(
+                "UPDATE patients SET risk_level = ?, system_notes = ? WHERE id = ?",
+                [
+                    (risk_levels[j], generate_system_notes(risk_levels[j], probabilities[j], payloads[i],
+                                                           top_contributors(None if contributions is None else contributions[j], matrix[i])),
+                     patient_id)
+                    for patient_id, (record_id, j, i) in latest.items()
+                    if newest.get(patient_id) == record_id
+                ],
+            )
+
+        self.write_fn(write)
+        return len(indices), len(rows) - len(indices)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rescore stored records with the active (or a given) model version")
+    parser.add_argument("--version", help="Registry version to score with (default: the active one)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--max-duty", type=float, default=DEFAULT_MAX_DUTY,
+                        help="Fraction of wall time spent working (the rest is left to live traffic)")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--reset", action="store_true", help="Ignore and remove an existing checkpoint")
+    parser.add_argument("--all", action="store_true", help="Also rescore records already stamped with the version")
+    args = parser.parse_args()
+
+    from backend.registry import ModelRegistry
+
+    registry = ModelRegistry()
+    loaded = registry._load_version(args.version) if args.version else registry.load_active()
+    rescorer = Rescorer(loaded, chunk_size=args.chunk_size, max_duty=args.max_duty,
+                        checkpoint_path=args.checkpoint, only_stale=not args.all)
+    if args.reset:
+        rescorer.reset()
+    try:
+        result = rescorer.run()
+    except KeyboardInterrupt:
+        result = {"state": "interrupted", **rescorer.state}
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
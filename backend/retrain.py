@@ -0,0 +1,231 @@
+"""
+Incremental retraining from labeled production records.
+
+Records labeled with a confirmed diagnosis (records.outcome, set through
+PUT /records/{id}/outcome) are streamed out of SQLite or Postgres in keyset
+chunks (id > last_id ORDER BY id LIMIT n) and folded into a fixed-size
+reservoir sample, so memory is bounded by --max-memory-mb no matter how many
+records are labeled. The sample is merged with the base Cleveland dataset and
+either
+
+    warm-start  adds --add-trees trees, fitted on the merged data, to the
+                serving forest (the serving scaler is kept, so old and new
+                trees see identically scaled features), or
+    retrain     fits a fresh scaler + forest with the serving hyperparameters
+                (or a grid search with --search) on all cores.
+
+Both candidates are scored against the serving model on a held-out slice of
+the labeled records, and the result is published as a new registry version.
+
+    python -m backend.retrain                                  # warm-start 50 trees, register
+    python -m backend.retrain --mode retrain --jobs 4 --chunk-size 2000 --max-memory-mb 128
+    python -m backend.retrain --activate                       # activate unless the hold-out AUC got worse
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import time
+from datetime import datetime
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler
+
+from backend.config import FEATURE_COLUMNS
+from backend.database import get_db_connection
+from backend.registry import ModelRegistry
+from backend.rescore import decode_features
+from backend.train_model import DATASET_PATH, PARAM_GRID, evaluate, load_dataset, publish, search
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 5000
+DEFAULT_MAX_MEMORY_MB = 256
+ROW_BYTES = (len(FEATURE_COLUMNS) + 1) * 8 # One float64 feature row plus its label
+
+
+def iter_labeled_chunks(chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """Yield (features, labels) arrays for labeled records, one keyset page at a time."""
+    last_id = 0
+    while True:
+        conn = get_db_connection()
+        try:
+            rows = conn.execute(
+                """SELECT id, input_data, outcome FROM records
+                   WHERE id > ? AND outcome IS NOT NULL AND (is_deleted IS NULL OR is_deleted = ?)
+                   ORDER BY id LIMIT ?""",
+                (last_id, False, chunk_size),
+            ).fetchall()
+        finally:
+            conn.close() # Never hold a connection (or a read snapshot) across chunks
+        if not rows:
+            return
+        last_id = rows[-1]["id"]
+        matrix, valid, _ = decode_features(rows)
+        labels = np.array([int(row["outcome"]) for row in rows])
+        valid &= np.isin(labels, (0, 1))
+        yield matrix[valid], labels[valid]
+
+
+class Reservoir:
+    """Uniform fixed-size sample of a stream of (features, label) rows (Algorithm R, vectorized per chunk)."""
+
+    def __init__(self, capacity: int, n_features: int, seed: int = 0):
+        self.capacity = max(1, int(capacity))
+        self.X = np.empty((self.capacity, n_features))
+        self.y = np.empty(self.capacity, dtype=np.int64)
+        self.seen = 0
+        self.rng = np.random.default_rng(seed)
+
+    def add(self, X, y):
+        n = len(X)
+        fill = min(n, max(0, self.capacity - self.seen))
+        self.X[self.seen:self.seen + fill] = X[:fill]
+        self.y[self.seen:self.seen + fill] = y[:fill]
+        if fill < n:
+            # Row t (0-based stream position) replaces a random slot with probability capacity / (t + 1);
+            # fancy assignment keeps the last write per slot, matching the sequential algorithm
+            positions = np.arange(self.seen + fill, self.seen + n)
+            slots = self.rng.integers(0, positions + 1)
+            keep = slots < self.capacity
+            self.X[slots[keep]] = X[fill:][keep]
+            self.y[slots[keep]] = y[fill:][keep]
+        self.seen += n
+
+    @property
+    def size(self) -> int:
+        return min(self.seen, self.capacity)
+
+    def sample(self):
+        return self.X[:self.size], self.y[:self.size]
+
+
+def peak_memory_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # Linux reports KiB
+
+
+def fit_warm_start(model, scaler, X, y, add_trees: int, n_jobs: int):
+    """Grow add_trees more trees on (X, y); the existing trees and the scaler are kept as they are."""
+    model.set_params(warm_start=True, n_estimators=model.n_estimators + add_trees, n_jobs=n_jobs)
+    try:
+        model.fit(scaler.transform(X), y)
+    except AttributeError as e:
+        # Forests unpickled from another sklearn version lack attributes fit() expects
+        raise SystemExit(f"Cannot warm-start this model ({e}); it was probably pickled by another "
+                         f"scikit-learn version. Use --mode retrain.")
+    model.set_params(warm_start=False, n_jobs=None)
+    return model, scaler
+
+
+def fit_retrain(model, X, y, n_jobs: int, seed: int):
+    """Fresh scaler + forest with the serving model's hyperparameters, trees fitted in parallel."""
+    params = {k: v for k, v in model.get_params().items() if k not in ("n_jobs", "warm_start", "random_state")}
+    scaler = StandardScaler().fit(X)
+    forest = RandomForestClassifier(**params, n_jobs=n_jobs, random_state=seed).fit(scaler.transform(X), y)
+    forest.set_params(n_jobs=None)
+    return forest, scaler
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Retrain the model from labeled production records")
+    parser.add_argument("--mode", choices=("warm-start", "retrain"), default="warm-start")
+    parser.add_argument("--add-trees", type=int, default=50, help="Trees added in warm-start mode")
+    parser.add_argument("--search", action="store_true", help="Retrain mode: grid-search hyperparameters instead")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Records fetched per query")
+    parser.add_argument("--max-memory-mb", type=float, default=DEFAULT_MAX_MEMORY_MB,
+                        help="Budget for the in-memory training sample (labeled records beyond it are sampled)")
+    parser.add_argument("--data", default=DATASET_PATH, help="Base Cleveland-format dataset merged into training")
+    parser.add_argument("--no-base", action="store_true", help="Train on production records only")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Share of the labeled records held out for evaluation")
+    parser.add_argument("--jobs", type=int, default=-1, help="Parallel fits (-1 = all cores)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--version", help="Registry version to start from (default: the active one)")
+    parser.add_argument("--activate", action="store_true", help="Activate the new version if it does not lose hold-out AUC")
+    parser.add_argument("--force", action="store_true", help="With --activate: activate even if it does")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    registry = ModelRegistry(compiled=False)
+    base_model = registry._load_version(args.version) if args.version else registry.load_active()
+
+    # 1. Stream labeled records into the bounded sample
+    capacity = int(args.max_memory_mb * 1024 * 1024 / ROW_BYTES)
+    reservoir = Reservoir(capacity, len(FEATURE_COLUMNS), args.seed)
+    for X_chunk, y_chunk in iter_labeled_chunks(args.chunk_size):
+        reservoir.add(X_chunk, y_chunk)
+    X_records, y_records = reservoir.sample()
+    logger.info(f"Read {reservoir.seen} labeled records, sampled {len(X_records)} (capacity {capacity})")
+    if not len(X_records) and args.no_base:
+        raise SystemExit("No labeled records to train on (label them with PUT /records/{id}/outcome)")
+
+    # 2. Hold out labeled records for evaluation; neither the serving nor the new model trained on them
+    X_base, y_base = np.empty((0, len(FEATURE_COLUMNS))), np.empty(0, dtype=np.int64)
+    if not args.no_base:
+        if os.path.exists(args.data):
+            X_base, y_base = load_dataset(args.data)
+        else:
+            logger.warning(f"Base dataset {args.data} not found; training on production records only")
+    stratify = y_records if len(np.unique(y_records)) == 2 and np.bincount(y_records).min() >= 2 else None
+    if len(X_records) >= 10:
+        X_train, X_test, y_train, y_test = train_test_split(X_records, y_records, test_size=args.holdout,
+                                                            random_state=args.seed, stratify=stratify)
+    elif len(X_base):
+        # Same split as train_model (seed, size, stratified), so the serving model never saw these rows either
+        logger.warning("Too few labeled records for a hold-out; evaluating on the base dataset's test slice")
+        X_train, y_train = X_records, y_records
+        X_base, X_test, y_base, y_test = train_test_split(X_base, y_base, test_size=args.holdout,
+                                                          random_state=args.seed, stratify=y_base)
+    else:
+        raise SystemExit("Too few labeled records and no base dataset to evaluate on")
+    X_fit = np.concatenate([X_base, X_train])
+    y_fit = np.concatenate([y_base, y_train]).astype(np.int64)
+    if len(np.unique(y_fit)) < 2:
+        raise SystemExit("Training data contains a single class; label more records first")
+
+    # 3. Fit
+    phase = time.perf_counter()
+    if args.mode == "warm-start":
+        model, scaler = fit_warm_start(base_model.model, base_model.scaler, X_fit, y_fit, args.add_trees, args.jobs)
+        params = {"n_estimators": model.n_estimators, "warm_started_from": base_model.version}
+    elif args.search:
+        grid = search(X_fit, y_fit, PARAM_GRID, n_jobs=args.jobs, seed=args.seed)
+        scaler, model = grid.best_estimator_.named_steps["scaler"], grid.best_estimator_.named_steps["model"]
+        params = {name.split("__", 1)[1]: value for name, value in grid.best_params_.items()}
+    else:
+        model, scaler = fit_retrain(base_model.model, X_fit, y_fit, args.jobs, args.seed)
+        params = {"n_estimators": model.n_estimators, "max_depth": model.max_depth}
+    fit_seconds = time.perf_counter() - phase
+
+    # 4. Compare with the serving model on the same hold-out
+    reference = registry._load_version(base_model.version) # Fresh copy: warm-start grew the loaded one in place
+    candidate_metrics = evaluate(model, scaler, X_test, y_test)
+    serving_metrics = evaluate(reference.model, reference.scaler, X_test, y_test)
+    metrics = {
+        "trained_at": datetime.utcnow().isoformat(),
+        "mode": args.mode,
+        "dataset": {"labeled_records": reservoir.seen, "sampled_records": len(X_records), "base_rows": len(X_base),
+                    "train_rows": len(X_fit), "holdout_rows": len(X_test)},
+        "params": params,
+        "test": candidate_metrics,
+        "serving": {"version": base_model.version, **{k: serving_metrics[k] for k in ("accuracy", "f1", "roc_auc")}},
+        "timings": {"fit_s": round(fit_seconds, 3), "total_s": round(time.perf_counter() - started, 3)},
+        "peak_memory_mb": round(peak_memory_mb(), 1),
+    }
+    improved = candidate_metrics["roc_auc"] >= serving_metrics["roc_auc"]
+    activate = args.activate and (improved or args.force)
+    version = publish(model, scaler, metrics, register=True, activate=activate, registry=registry)
+
+    print(json.dumps({k: metrics[k] for k in ("mode", "dataset", "params", "serving", "timings", "peak_memory_mb")}, indent=2))
+    print(f"Hold-out roc_auc {candidate_metrics['roc_auc']} vs serving {serving_metrics['roc_auc']}; "
+          f"registered {version}{' (active)' if activate else ''}")
+    if args.activate and not activate:
+        print("Not activated: the new model loses hold-out AUC against the serving one (pass --force to override)")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(main())
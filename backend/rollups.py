@@ -0,0 +1,145 @@
+"""
+Daily analytics rollup of the records table.
+
+record_daily_stats holds one row per (day, doctor_id, risk_level). Each row
+stores the number of assessments, the sum of model probabilities, how many
+probabilities were recorded, and how many were positive. Every write path
+that inserts or rescores records updates the rollup in the same transaction:
+/predict, bulk import, rescoring and the seed script. The analytics endpoints
+read these rows instead of scanning records, so their cost grows with the
+date range they cover, not with the table size. Records without a doctor are
+counted under doctor_id 0.
+
+The schema migration that creates the table fills it from existing records.
+To rebuild it or check it against the records table by hand:
+
+    python -m backend.rollups backfill
+    python -m backend.rollups verify      # non-zero exit if the rollup and records disagree
+"""
+import argparse
+import logging
+import sys
+import time
+
+from backend import analytics_cache
+from backend.database import db_connection, is_postgres, prepared
+
+logger = logging.getLogger(__name__)
+
+TABLE = "record_daily_stats"
+STAT_COLUMNS = ("assessments", "probability_sum", "probability_count", "scored_count")
+
+_UPSERT = f"""
+    INSERT INTO {TABLE} (day, doctor_id, risk_level, assessments, probability_sum, probability_count, scored_count)
+    VALUES ({{day}}, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (day, doctor_id, risk_level) DO UPDATE SET
+        {", ".join(f"{column} = {TABLE}.{column} + excluded.{column}" for column in STAT_COLUMNS)}
+"""
+# Today's row, dated by the database clock like records.created_at's CURRENT_TIMESTAMP default
+UPSERT_TODAY = prepared(_UPSERT.format(day="CURRENT_DATE"))
+UPSERT_DAY = prepared(_UPSERT.format(day="?"))
+
+_AGGREGATE = """
+    SELECT DATE(created_at) AS day, COALESCE(doctor_id, 0) AS doctor_id, COALESCE(risk_level, 'Unknown') AS risk_level,
+           COUNT(*) AS assessments, COALESCE(SUM(model_probability), 0) AS probability_sum,
+           COUNT(model_probability) AS probability_count,
+           SUM(CASE WHEN model_probability > 0 THEN 1 ELSE 0 END) AS scored_count
+    FROM records
+    WHERE created_at IS NOT NULL
+    GROUP BY DATE(created_at), COALESCE(doctor_id, 0), COALESCE(risk_level, 'Unknown')
+"""
+
+
+def _stats(probability, sign: int = 1):
+    scored = probability is not None and probability > 0
+    return (sign, sign * (probability or 0.0), sign * (probability is not None), sign * scored)
+
+
+def add_record(c, doctor_id, risk_level, probability):
+    """Count one record inserted now (inside the inserting transaction)."""
+    c.execute(UPSERT_TODAY, (doctor_id or 0, risk_level or "Unknown", *_stats(probability)))
+
+
+def accumulate(deltas: dict, day, doctor_id, risk_level, probability, sign: int = 1):
+    """
+    Add one record (sign=-1: remove it) to a {(day, doctor_id, risk_level): stats} delta map.
+    day None means today by the database clock (a record inserted now with the created_at default).
+    """
+    key = (str(day)[:10] if day is not None else None, doctor_id or 0, risk_level or "Unknown")
+    current = deltas.get(key, (0, 0.0, 0, 0))
+    deltas[key] = tuple(a + b for a, b in zip(current, _stats(probability, sign)))
+
+
+def apply_deltas(c, deltas: dict):
+    """Upsert accumulated deltas (inside the transaction that changed the records)."""
+    rows = [(day, doctor_id, level, *stats) for (day, doctor_id, level), stats in deltas.items() if any(stats)]
+    dated = [row for row in rows if row[0] is not None]
+    today = [row[1:] for row in rows if row[0] is None]
+    if dated:
+        c.executemany(UPSERT_DAY, dated)
+    if today:
+        c.executemany(UPSERT_TODAY, today)
+
+
+def fill(c):
+    """Replace the rollup with a fresh aggregation of records (inside a transaction that blocks record writes)."""
+    c.execute(f"DELETE FROM {TABLE}")
+    c.execute(f"""INSERT INTO {TABLE} (day, doctor_id, risk_level, {", ".join(STAT_COLUMNS)})
+                  SELECT day, doctor_id, risk_level, {", ".join(STAT_COLUMNS)} FROM ({_AGGREGATE}) aggregated""")
+
+
+def backfill(conn) -> int:
+    """Rebuild the rollup from records in one transaction, with record writes blocked; returns the row count."""
+    if is_postgres(conn):
+        conn.execute("LOCK TABLE records IN SHARE MODE") # Waits for in-flight inserts, blocks new ones until commit
+    else:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        fill(conn)
+        count = conn.execute(f"SELECT COUNT(*) AS count FROM {TABLE}").fetchone()["count"]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    analytics_cache.invalidate()
+    return count
+
+
+def verify(conn) -> list:
+    """Rollup rows that differ from a fresh aggregation of records: [(key, rollup stats, records stats)]."""
+    def load(sql):
+        return {
+            (str(row["day"])[:10], row["doctor_id"], row["risk_level"]): (
+                row["assessments"], round(row["probability_sum"], 6), row["probability_count"], row["scored_count"])
+            for row in conn.execute(sql).fetchall()
+        }
+    expected = load(_AGGREGATE)
+    actual = {key: stats for key, stats in load(f"SELECT * FROM {TABLE}").items() if stats[0] or stats[2]}
+    return [(key, actual.get(key), expected.get(key)) for key in sorted(set(expected) | set(actual))
+            if actual.get(key) != expected.get(key)]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=f"Maintain the {TABLE} analytics rollup")
+    parser.add_argument("command", choices=("backfill", "verify"))
+    args = parser.parse_args(argv)
+
+    with db_connection() as conn:
+        if args.command == "backfill":
+            started = time.perf_counter()
+            count = backfill(conn)
+            print(f"Rebuilt {TABLE}: {count} rows in {time.perf_counter() - started:.1f}s")
+            return 0
+        mismatches = verify(conn)
+    for key, actual, expected in mismatches[:20]:
+        print(f"  {key}: rollup {actual} != records {expected}")
+    if mismatches:
+        print(f"{len(mismatches)} rollup rows disagree with records; run `python -m backend.rollups backfill`")
+        return 1
+    print(f"{TABLE} matches records")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
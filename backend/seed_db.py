@@ -5,7 +5,9 @@ import sqlite3
 import json
 from datetime import datetime, timedelta
 import random
+from backend import analytics_cache, rollups
 from backend.database import get_db_connection
+from backend.utils import patient_identity_key
 
 def seed_database():
     conn = get_db_connection()
@@ -28,17 +30,19 @@ def seed_database():
     print("Inserting patients...")
     patient_ids = []
     for name, age, sex, contact, risk in sample_patients:
-        c.execute("""
-            INSERT INTO patients (name, age, sex, contact, status, risk_level, doctor_name)
-            VALUES (?, ?, ?, ?, 'Active', ?, 'Dr. Sarah Chen')
-        """, (name, age, sex, contact, risk))
-        patient_ids.append(c.lastrowid)
+        patient_ids.append(c.execute("""
+            INSERT INTO patients (identity_key, name, age, sex, contact, status, risk_level, doctor_name)
+            VALUES (?, ?, ?, ?, ?, 'Active', ?, 'Dr. Sarah Chen')
+            ON CONFLICT (identity_key) DO UPDATE SET last_updated = CURRENT_TIMESTAMP
+            RETURNING id
+        """, (patient_identity_key(name, contact), name, age, sex, contact, risk)).fetchone()['id'])
     
     print(f"Inserted {len(patient_ids)} patients")
     
     # Generate assessment records with realistic cardio data
     print("Generating assessment records...")
     records_count = 0
+    deltas = {}
     
     for patient_id in patient_ids:
         # Each patient gets 2-3 assessments
@@ -103,12 +107,15 @@ def seed_database():
                 risk_level,
                 created_at.strftime('%Y-%m-%d %H:%M:%S')
             ))
+            rollups.accumulate(deltas, created_at.strftime('%Y-%m-%d'), None, risk_level, 0.0) # model_probability defaults to 0.0
             records_count += 1
     
     print(f"Inserted {records_count} assessment records")
+    rollups.apply_deltas(c, deltas)
     
     conn.commit()
     conn.close()
+    analytics_cache.invalidate()
     
     print("\n✅ Database seeded successfully!")
     print(f"Total Patients: {len(patient_ids)}")
@@ -1,68 +1,234 @@
-import pandas as pd
-import numpy as np
-import pickle
+"""
+Training pipeline for the heart disease model.
+
+Reads the Cleveland dataset from a local cache, backend/data/processed.cleveland.data
+by default (TRAINING_DATA_PATH or --data to override). The file is not part of
+the repository: fill the cache once with --download (needs network), after
+which training runs offline; metrics.json records the checksum of the file a
+model was trained on. Then runs a cross-validated hyperparameter search over a StandardScaler +
+RandomForestClassifier pipeline on all cores, evaluates the best candidate on
+a held-out split and writes heart_model.pkl, scaler.pkl and metrics.json where the server loads them from: the legacy
+backend/models pair by default, or a new registry version with --register.
+
+    python -m backend.train_model --download              # first run: fill the cache from UCI, then train
+    python -m backend.train_model                         # later runs: search + train offline, write backend/models
+    python -m backend.train_model --register --activate   # publish as a new registry version instead
+    python -m backend.train_model --param-grid '{"n_estimators": [100, 300]}' --jobs 4
+"""
+import argparse
+import hashlib
+import json
+import logging
 import os
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
+import pickle
+import shutil
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import sklearn
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import accuracy_score, classification_report
+from sklearn.metrics import accuracy_score, classification_report, f1_score, roc_auc_score
+from sklearn.model_selection import GridSearchCV, StratifiedKFold, train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
 
-# Ensure models directory exists
-# Use absolute path relative to this script
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-MODELS_DIR = os.path.join(BASE_DIR, '..', 'models')
+from backend.config import FEATURE_COLUMNS, classify_risk_batch
+from backend.registry import MODELS_DIR, MODEL_FILE, SCALER_FILE, ModelRegistry
 
-if not os.path.exists(MODELS_DIR):
-    os.makedirs(MODELS_DIR)
+logger = logging.getLogger(__name__)
 
-# Data URL
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+DATASET_PATH = os.getenv("TRAINING_DATA_PATH", os.path.join(DATA_DIR, "processed.cleveland.data"))
 DATA_URL = "https://archive.ics.uci.edu/ml/machine-learning-databases/heart-disease/processed.cleveland.data"
-COLUMN_NAMES = [
-    "age", "sex", "cp", "trestbps", "chol", "fbs", "restecg", 
-    "thalach", "exang", "oldpeak", "slope", "ca", "thal", "target"
-]
-
-print("Downloading dataset...")
-# Load data, handling missing values represented by '?'
-df = pd.read_csv(DATA_URL, names=COLUMN_NAMES, na_values="?")
-
-print("Preprocessing data...")
-# Drop rows with missing values (small dataset, simple imputation by dropping)
-df = df.dropna()
-
-# Convert target to binary (0 = no disease, 1-4 = disease)
-df['target'] = df['target'].apply(lambda x: 1 if x > 0 else 0)
-
-# Features and Target
-X = df.drop('target', axis=1)
-y = df['target']
-
-# Split data
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-# Scaling
-scaler = StandardScaler()
-X_train_scaled = scaler.fit_transform(X_train)
-X_test_scaled = scaler.transform(X_test)
-
-# Train Model
-print("Training RandomForest Classifier...")
-model = RandomForestClassifier(n_estimators=100, random_state=42)
-model.fit(X_train_scaled, y_train)
-
-# Evaluate
-y_pred = model.predict(X_test_scaled)
-acc = accuracy_score(y_test, y_pred)
-print(f"Model Accuracy: {acc:.4f}")
-print("Classification Report:")
-print(classification_report(y_test, y_pred))
-
-# Save Artifacts
-print("Saving model and scaler...")
-with open(os.path.join(MODELS_DIR, 'heart_model.pkl'), 'wb') as f:
-    pickle.dump(model, f)
-
-with open(os.path.join(MODELS_DIR, 'scaler.pkl'), 'wb') as f:
-    pickle.dump(scaler, f)
-
-print(f"Done! Artifacts saved to '{MODELS_DIR}'")
+COLUMN_NAMES = FEATURE_COLUMNS + ["target"]
+METRICS_FILE = "metrics.json"
+
+# Searched with GridSearchCV; keys are RandomForestClassifier parameters
+PARAM_GRID = {
+    "n_estimators": [100, 200, 400],
+    "max_depth": [None, 6, 12],
+    "min_samples_leaf": [1, 2, 4],
+    "max_features": ["sqrt", 0.5],
+}
+
+
+def download_dataset(path: str = DATASET_PATH, url: str = DATA_URL) -> str:
+    """Fetch the UCI file once into the local cache (written atomically)."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with urllib.request.urlopen(url, timeout=60) as response, open(tmp_path, "wb") as f:
+        shutil.copyfileobj(response, f)
+    os.replace(tmp_path, path)
+    logger.info(f"Cached dataset from {url} at {path} (checksum {dataset_checksum(path)})")
+    return path
+
+
+def dataset_checksum(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+def dataset_label(path: str) -> str:
+    """Path of the dataset as recorded in metrics: repo-relative for the default cache, else absolute."""
+    path = os.path.abspath(path)
+    repo_dir = os.path.dirname(BASE_DIR)
+    return os.path.relpath(path, repo_dir) if path.startswith(repo_dir + os.sep) else path
+
+
+def load_dataset(path: str = DATASET_PATH):
+    """Return (features, binary labels) from a Cleveland-format file ('?' = missing, target 1-4 = disease)."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No dataset at {path}; fill the cache once with --download (needs network) "
+                                f"or pass --data with a Cleveland-format file")
+    # Drop rows with missing values (small dataset, simple imputation by dropping)
+    df = pd.read_csv(path, names=COLUMN_NAMES, na_values="?").dropna()
+    X = df[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+    y = (df["target"].to_numpy() > 0).astype(int)
+    return X, y
+
+
+def search(X, y, param_grid: dict = PARAM_GRID, cv_folds: int = 5, n_jobs: int = -1, scoring: str = "roc_auc",
+           seed: int = 42) -> GridSearchCV:
+    """
+    Cross-validated grid search; the scaler is fitted inside every fold so no
+    validation statistics leak into training. The best pipeline is refitted on all of X.
+    """
+    pipeline = Pipeline([
+        ("scaler", StandardScaler()),
+        ("model", RandomForestClassifier(random_state=seed)),
+    ])
+    grid = GridSearchCV(
+        pipeline,
+        {f"model__{name}": values for name, values in param_grid.items()},
+        scoring=scoring,
+        cv=StratifiedKFold(n_splits=cv_folds, shuffle=True, random_state=seed),
+        n_jobs=n_jobs,
+        refit=True,
+    )
+    grid.fit(X, y)
+    return grid
+
+
+def evaluate(model, scaler, X_test, y_test) -> dict:
+    probabilities = model.predict_proba(scaler.transform(X_test))[:, 1]
+    predictions = model.classes_[(probabilities > 0.5).astype(int)]
+    levels = classify_risk_batch(probabilities)
+    return {
+        "accuracy": round(float(accuracy_score(y_test, predictions)), 4),
+        "f1": round(float(f1_score(y_test, predictions)), 4),
+        "roc_auc": round(float(roc_auc_score(y_test, probabilities)), 4),
+        "risk_levels": {level: int((levels == level).sum()) for level in ("Low", "Medium", "High")},
+        "classification_report": classification_report(y_test, predictions, output_dict=True),
+    }
+
+
+def save_artifacts(directory: str, model, scaler, metrics: dict):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, MODEL_FILE), "wb") as f:
+        pickle.dump(model, f)
+    with open(os.path.join(directory, SCALER_FILE), "wb") as f:
+        pickle.dump(scaler, f)
+    with open(os.path.join(directory, METRICS_FILE), "w") as f:
+        json.dump(metrics, f, indent=2)
+
+
+def publish(model, scaler, metrics: dict, output_dir: str = MODELS_DIR, register: bool = False,
+            activate: bool = False, registry: ModelRegistry = None) -> str:
+    """
+    Write the artifacts where the server loads them: output_dir (the legacy pair), or a
+    new registry version. Returns the directory (or registry version) written.
+    """
+    if not register:
+        save_artifacts(output_dir, model, scaler, metrics)
+        return output_dir
+    registry = registry or ModelRegistry()
+    staging_dir = tempfile.mkdtemp(prefix="cardioai-train-")
+    try:
+        save_artifacts(staging_dir, model, scaler, metrics)
+        summary = {key: metrics[key] for key in ("cv_best_score", "params", "dataset") if key in metrics}
+        summary["test"] = {k: v for k, v in metrics.get("test", {}).items() if k != "classification_report"}
+        version = registry.register(os.path.join(staging_dir, MODEL_FILE), os.path.join(staging_dir, SCALER_FILE),
+                                    metadata={"trained_by": "train_model", **summary})
+        shutil.copyfile(os.path.join(staging_dir, METRICS_FILE), os.path.join(registry.registry_dir, version, METRICS_FILE))
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    if activate:
+        registry._update_manifest(active=version, previous=registry.read_manifest().get("active"))
+    return version
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Train the heart disease model with a parallel hyperparameter search")
+    parser.add_argument("--data", default=DATASET_PATH, help="Cached Cleveland-format dataset")
+    parser.add_argument("--download", action="store_true", help=f"Fetch {DATA_URL} into --data first")
+    parser.add_argument("--param-grid", type=json.loads, default=PARAM_GRID, help="JSON grid of RandomForestClassifier params")
+    parser.add_argument("--cv", type=int, default=5, help="Cross-validation folds")
+    parser.add_argument("--scoring", default="roc_auc")
+    parser.add_argument("--jobs", type=int, default=-1, help="Parallel fits (-1 = all cores)")
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=MODELS_DIR, help="Directory for the legacy model/scaler pair")
+    parser.add_argument("--register", action="store_true", help="Publish as a new registry version instead of --output")
+    parser.add_argument("--activate", action="store_true", help="Mark the registered version active")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    timings = {}
+    if args.download:
+        download_dataset(args.data)
+        timings["download_s"] = round(time.perf_counter() - started, 3)
+
+    phase = time.perf_counter()
+    X, y = load_dataset(args.data)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=args.test_size, random_state=args.seed, stratify=y)
+    timings["load_s"] = round(time.perf_counter() - phase, 3)
+    logger.info(f"Loaded {len(X)} rows from {args.data} ({len(X_train)} train / {len(X_test)} test)")
+
+    phase = time.perf_counter()
+    grid = search(X_train, y_train, args.param_grid, args.cv, args.jobs, args.scoring, args.seed)
+    timings["search_s"] = round(time.perf_counter() - phase, 3)
+    candidates = len(grid.cv_results_["params"])
+    logger.info(f"Searched {candidates} candidates x {args.cv} folds in {timings['search_s']:.1f}s")
+
+    best = grid.best_estimator_
+    scaler, model = best.named_steps["scaler"], best.named_steps["model"]
+    phase = time.perf_counter()
+    test_metrics = evaluate(model, scaler, X_test, y_test)
+    timings["evaluate_s"] = round(time.perf_counter() - phase, 3)
+
+    if not args.register and ModelRegistry().read_manifest().get("active"):
+        logger.warning("The registry has an active version, so the server will not load the legacy pair; "
+                       "use --register to publish this model")
+
+    metrics = {
+        "trained_at": datetime.utcnow().isoformat(),
+        "dataset": {"path": dataset_label(args.data), "checksum": dataset_checksum(args.data), "rows": len(X),
+                    "train_rows": len(X_train), "test_rows": len(X_test), "positive_rate": round(float(y.mean()), 4)},
+        "search": {"scoring": args.scoring, "cv_folds": args.cv, "candidates": candidates, "n_jobs": args.jobs,
+                   "cpu_count": os.cpu_count()},
+        "cv_best_score": round(float(grid.best_score_), 4),
+        "params": {name.split("__", 1)[1]: value for name, value in grid.best_params_.items()},
+        "test": test_metrics,
+        "sklearn": sklearn.__version__,
+        "timings": {**timings, "train_total_s": round(time.perf_counter() - started, 3)},
+    }
+    target = publish(model, scaler, metrics, args.output, args.register, args.activate)
+    total = time.perf_counter() - started
+
+    print(f"Best params: {metrics['params']} (cv {args.scoring} {metrics['cv_best_score']})")
+    print(f"Held-out: accuracy {test_metrics['accuracy']}, f1 {test_metrics['f1']}, roc_auc {test_metrics['roc_auc']}")
+    print(f"Artifacts: {'registry version ' + target if args.register else target}"
+          f"{' (active)' if args.register and args.activate else ''}")
+    print(f"Total wall-clock time: {total:.1f}s (load {timings['load_s']:.1f}s, search {timings['search_s']:.1f}s, "
+          f"evaluate {timings['evaluate_s']:.1f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(main())
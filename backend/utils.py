@@ -1,10 +1,57 @@
 """
 Utility functions for generating AI-powered system notes based on patient risk analysis.
 """
+import os
+import re
+import unicodedata
+from typing import Optional
 
-def generate_system_notes(risk_level: str, risk_score: float, patient_data: dict) -> str:
+import numpy as np
+
+from backend.config import FEATURE_COLUMNS, FEATURE_LABELS
+
+# Number of feature contributions reported per prediction
+TOP_CONTRIBUTORS = int(os.getenv("TOP_CONTRIBUTORS", "5"))
+
+def top_contributors(contributions, features, k: int = TOP_CONTRIBUTORS):
+    """
+    Largest per-feature contributions (by magnitude) of one prediction, as dicts with
+    feature, label, value and contribution. Returns None when no attribution is available.
+    """
+    if contributions is None:
+        return None
+    contributions = np.asarray(contributions, dtype=float)
+    order = np.argsort(-np.abs(contributions))[:k]
+    return [
+        {
+            "feature": FEATURE_COLUMNS[i],
+            "label": FEATURE_LABELS[FEATURE_COLUMNS[i]],
+            "value": float(features[i]),
+            "contribution": round(float(contributions[i]), 4)
+        }
+        for i in order if abs(contributions[i]) >= 1e-4
+    ]
+
+def patient_identity_key(name: str, contact: Optional[str] = None) -> str:
+    """
+    Normalized name + contact that identifies a patient (patients.identity_key):
+    case, Unicode form and spacing are ignored, and phone numbers keep only
+    digits and a leading +. Patients sharing a name but not a contact stay apart.
+    """
+    name_part = " ".join(unicodedata.normalize("NFKC", str(name)).split()).casefold()
+    contact_part = "".join(unicodedata.normalize("NFKC", str(contact or "")).split()).casefold()
+    if re.fullmatch(r"\+?[\d().\-/]+", contact_part): # A phone number: keep the digits (and a leading +)
+        contact_part = ("+" if contact_part.startswith("+") else "") + re.sub(r"\D", "", contact_part)
+    return f"{name_part}|{contact_part}"
+
+def _format_value(value: float) -> str:
+    return f"{value:g}"
+
+def generate_system_notes(risk_level: str, risk_score: float, patient_data: dict, contributors=None) -> str:
     """
     Generate professional medical AI analysis summary.
+    With contributors (see top_contributors) the factors section reports what the model
+    actually weighed; otherwise it falls back to fixed vital-sign thresholds.
     """
     prob_percent = risk_score * 100
     
@@ -18,14 +65,20 @@ def generate_system_notes(risk_level: str, risk_score: float, patient_data: dict
     ]
     
     concerns = []
-    if patient_data.get('trestbps', 0) > 140:
-        concerns.append(f"Hypertension indicator ({patient_data['trestbps']} mm Hg)")
-    if patient_data.get('chol', 0) > 200:
-        concerns.append(f"Hyperlipidemia indicator ({patient_data['chol']} mg/dl)")
-    if patient_data.get('oldpeak', 0) > 2.0:
-        concerns.append(f"ST-segment depression ({patient_data['oldpeak']})")
-    if patient_data.get('thalach', 0) < 60:
-         concerns.append(f"Bradycardia risk ({patient_data['thalach']} bpm)")
+    if contributors:
+        for factor in contributors:
+            direction = "raises" if factor["contribution"] > 0 else "lowers"
+            concerns.append(f"{factor['label']} ({_format_value(factor['value'])}) {direction} risk by "
+                            f"{abs(factor['contribution']) * 100:.1f} pts")
+    else:
+        if patient_data.get('trestbps', 0) > 140:
+            concerns.append(f"Hypertension indicator ({patient_data['trestbps']} mm Hg)")
+        if patient_data.get('chol', 0) > 200:
+            concerns.append(f"Hyperlipidemia indicator ({patient_data['chol']} mg/dl)")
+        if patient_data.get('oldpeak', 0) > 2.0:
+            concerns.append(f"ST-segment depression ({patient_data['oldpeak']})")
+        if patient_data.get('thalach', 0) < 60:
+            concerns.append(f"Bradycardia risk ({patient_data['thalach']} bpm)")
         
     if concerns:
         for c in concerns:
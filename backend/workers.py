@@ -0,0 +1,100 @@
+"""
+Optional out-of-process inference tier.
+
+N worker processes each open the same compiled forest directory with
+memory-mapped arrays, so the node arrays live once in the OS page cache no
+matter how many workers are running. The API process sends feature matrices
+to the pool and gets (predictions, probabilities, contributions, cascade tiers) back; scoring no longer
+competes with request handling for the API process's GIL.
+
+This module is imported by the spawned workers, so it must not import
+backend.main (or anything that touches the database).
+"""
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from backend.cascade import CascadeForest
+from backend.forest import CompiledForest
+
+logger = logging.getLogger(__name__)
+
+_engine = None # Per-worker compiled forest (memory-mapped)
+_cascade = None # Optional tiered inference over _engine
+
+
+def _init_worker(artifact_dir: str, cascade: dict = None):
+    global _engine, _cascade
+    _engine = CompiledForest.load(artifact_dir, mmap=True)
+    _cascade = CascadeForest(_engine, **cascade) if cascade else None
+
+
+def _score(matrix: np.ndarray):
+    if _cascade is not None:
+        return _cascade.explain(matrix)
+    return (*_engine.explain(matrix), None)
+
+
+def _ping(_=None) -> int:
+    return _engine.n_trees
+
+
+class InferencePool:
+    """Process pool of scoring workers sharing one memory-mapped model artifact."""
+
+    def __init__(self, artifact_dir: str, n_workers: int, version: str = None, cascade: dict = None):
+        self.artifact_dir = artifact_dir
+        self.version = version # Model version the artifact belongs to
+        self.cascade = cascade # CascadeForest settings, or None for full-forest scoring
+        self.n_workers = max(1, int(n_workers))
+        self._executor = None
+        self.jobs = 0
+        self.failures = 0
+
+    @property
+    def running(self) -> bool:
+        return self._executor is not None
+
+    def start(self):
+        if self.running:
+            return
+        # spawn: never fork a process that already runs threads (uvicorn, batcher, DB)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.n_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.artifact_dir, self.cascade),
+        )
+        # Warm every worker so the first requests don't pay process start-up
+        list(self._executor.map(_ping, range(self.n_workers)))
+        logger.info(f"Inference pool started: {self.n_workers} workers on {self.artifact_dir}")
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def predict(self, matrix: np.ndarray, timeout: float = 30.0):
+        """
+        Score a feature matrix in a worker; returns (predictions, probabilities, contributions,
+        answered-early mask or None without the cascade).
+        """
+        self.jobs += 1
+        try:
+            return self._executor.submit(_score, np.ascontiguousarray(matrix, dtype=np.float64)).result(timeout)
+        except Exception:
+            self.failures += 1
+            raise
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "workers": self.n_workers,
+            "version": self.version,
+            "cascade": self.cascade,
+            "artifact_dir": self.artifact_dir,
+            "jobs": self.jobs,
+            "failures": self.failures,
+        }
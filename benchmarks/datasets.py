@@ -0,0 +1,122 @@
+"""
+Seeded synthetic SQLite databases for benchmarks.
+
+Databases are built once per (size, seed) with the production schema
+(backend.migrations) and cached under benchmarks/.data, so
+repeated runs measure queries, not seeding.
+"""
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from backend.config import FEATURE_COLUMNS, classify_risk_batch
+from backend.migrations import migrate
+from backend.rollups import backfill
+from backend.utils import patient_identity_key
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data")
+INSERT_CHUNK = 50_000
+DOCTORS = {1: "Dr. Sarah Chen", 2: "Dr. Emily Ross", 3: "Dr. Michael Torres"}
+
+# (low, high) per feature; integer features are drawn with randint, oldpeak uniformly
+FEATURE_RANGES = {
+    "age": (29, 78), "sex": (0, 2), "cp": (0, 4), "trestbps": (94, 201), "chol": (126, 565),
+    "fbs": (0, 2), "restecg": (0, 3), "thalach": (71, 203), "exang": (0, 2), "oldpeak": (0.0, 6.2),
+    "slope": (0, 3), "ca": (0, 5), "thal": (0, 4),
+}
+
+
+def feature_matrix(n_rows: int, seed: int = 0) -> np.ndarray:
+    """Random but clinically plausible raw feature rows, columns in FEATURE_COLUMNS order."""
+    rng = np.random.default_rng(seed)
+    columns = []
+    for name in FEATURE_COLUMNS:
+        low, high = FEATURE_RANGES[name]
+        if isinstance(low, float):
+            columns.append(np.round(rng.uniform(low, high, n_rows), 1))
+        else:
+            columns.append(rng.integers(low, high, n_rows).astype(np.float64))
+    return np.column_stack(columns)
+
+
+def dataset_path(n_records: int, seed: int = 0) -> str:
+    return os.path.join(DATA_DIR, f"records-{n_records}-seed{seed}.db")
+
+
+def ensure_dataset(n_records: int, seed: int = 0) -> str:
+    """Return the path of a seeded database with n_records records, building it if missing."""
+    path = dataset_path(n_records, seed)
+    if os.path.exists(path):
+        return path
+    os.makedirs(DATA_DIR, exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    started = time.perf_counter()
+    build_dataset(tmp_path, n_records, seed)
+    os.replace(tmp_path, path)
+    logger.info(f"Seeded {n_records} records into {path} in {time.perf_counter() - started:.1f}s")
+    return path
+
+
+def build_dataset(path: str, n_records: int, seed: int = 0):
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+
+    rng = np.random.default_rng(seed)
+    n_patients = max(1, n_records // 3)
+    patient_doctors = rng.integers(1, 4, n_patients)
+    patient_features = feature_matrix(n_patients, seed)
+    conn.executemany(
+        "INSERT INTO patients (id, identity_key, name, age, sex, contact, risk_level, doctor_name, doctor_id) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            (i + 1, patient_identity_key(f"Patient {i + 1:07d}", f"+97150{i:07d}"), f"Patient {i + 1:07d}",
+             int(patient_features[i, 0]), int(patient_features[i, 1]), f"+97150{i:07d}", "Unknown",
+             DOCTORS[int(patient_doctors[i])], int(patient_doctors[i]))
+            for i in range(n_patients)
+        ),
+    )
+
+    # Two years of history ending now, so current/previous-month queries hit real rows
+    now = datetime.now().replace(microsecond=0)
+    for start in range(0, n_records, INSERT_CHUNK):
+        size = min(INSERT_CHUNK, n_records - start)
+        patient_ids = rng.integers(1, n_patients + 1, size)
+        features = feature_matrix(size, seed + 1 + start)
+        risk_scores = rng.beta(2.0, 2.5, size)
+        risk_levels = classify_risk_batch(risk_scores)
+        ages = rng.integers(0, 730 * 24 * 3600, size)
+        rows = []
+        for j in range(size):
+            doctor_id = int(patient_doctors[patient_ids[j] - 1])
+            input_data = {name: features[j, k] for k, name in enumerate(FEATURE_COLUMNS)}
+            rows.append((
+                int(patient_ids[j]),
+                json.dumps(input_data),
+                int(risk_scores[j] >= 0.5),
+                float(risk_scores[j]),
+                risk_levels[j],
+                (now - timedelta(seconds=int(ages[j]))).strftime("%Y-%m-%d %H:%M:%S"),
+                DOCTORS[doctor_id],
+                doctor_id,
+                float(risk_scores[j]),
+                "bench",
+            ))
+        conn.executemany(
+            """INSERT INTO records (patient_id, input_data, prediction_result, risk_score, risk_level, created_at,
+                                    doctor_name, doctor_id, model_probability, model_version)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            rows,
+        )
+        conn.commit()
+    conn.row_factory = sqlite3.Row
+    backfill(conn) # Analytics rollup, as the write paths would have maintained it
+    conn.close()
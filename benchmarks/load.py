@@ -0,0 +1,283 @@
+"""
+End-to-end load test for the API.
+
+Boots the FastAPI app against a temporary SQLite file (pre-seeded with
+--seed-records records), replays a weighted traffic mix with N concurrent
+virtual users per concurrency level, and reports per-endpoint p50/p95/p99
+latency, throughput and error rate.
+
+Traffic mix (weights via --mix):
+    predict     a burst of --burst concurrent POST /predict calls
+    dashboard   GET /dashboard/stats (dashboard polling)
+    patients    GET /patients
+    login       POST /doctor/login (seeded admin user)
+
+Server modes:
+    subprocess  uvicorn in a child process (default; pass --workers for several)
+    inprocess   uvicorn in a thread of this process (shares the GIL with the
+                load generator, so absolute numbers are pessimistic)
+    --url       target an already running server, no boot / temp database
+
+    python -m benchmarks.load --concurrency 1 8 32 --duration 20
+    PREDICT_BATCH_WINDOW_MS=0 WRITE_GROUP_DELAY_MS=0 python -m benchmarks.load   # serving knobs pass through the env
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import httpx
+import numpy as np
+
+from backend.config import FEATURE_COLUMNS
+from benchmarks.datasets import build_dataset, feature_matrix
+
+DEFAULT_MIX = {"predict": 4, "dashboard": 3, "patients": 2, "login": 1}
+ADMIN_CREDENTIALS = {"username": "admin", "password": "admin123"} # Seeded by the API on startup
+PATIENT_POOL = 500 # Distinct names, so /predict exercises both find and create
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_healthy(url: str, timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{url}/health/inference", timeout=2.0).json().get("model_loaded"):
+                return
+        except Exception:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"Server at {url} did not become ready within {timeout:.0f}s")
+
+
+class ServerUnderTest:
+    """Boots the API on a free local port against a temporary SQLite database."""
+
+    def __init__(self, mode: str, workers: int = 1, seed_records: int = 0):
+        self.mode = mode
+        self.workers = workers
+        self.seed_records = seed_records
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.workdir = tempfile.mkdtemp(prefix="cardioai-load-")
+        self.db_path = os.path.join(self.workdir, "cardioai.db")
+        self._process = None
+        self._server = None
+        self._thread = None
+
+    def __enter__(self):
+        if self.seed_records:
+            build_dataset(self.db_path, self.seed_records)
+        os.environ["CARDIOAI_DB_PATH"] = self.db_path
+        if self.mode == "subprocess":
+            self._process = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1",
+                 "--port", str(self.port), "--workers", str(self.workers), "--log-level", "warning"],
+                env=os.environ.copy(),
+            )
+        else:
+            import uvicorn
+
+            config = uvicorn.Config("backend.main:app", host="127.0.0.1", port=self.port, log_level="warning")
+            self._server = uvicorn.Server(config)
+            self._thread = threading.Thread(target=self._server.run, name="load-test-server", daemon=True)
+            self._thread.start()
+        wait_until_healthy(self.url)
+        return self
+
+    def __exit__(self, *exc):
+        if self._process is not None:
+            self._process.terminate()
+            try:
+                self._process.wait(15)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(15)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint: str, seconds: float, status):
+        self.latencies[endpoint].append(seconds)
+        self.statuses[endpoint][str(status)] += 1
+        if not isinstance(status, int) or status >= 400:
+            self.errors[endpoint] += 1
+
+    def summary(self, elapsed: float) -> dict:
+        report = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            ms = np.asarray(values) * 1000
+            report[endpoint] = {
+                "requests": len(values),
+                "throughput_rps": round(len(values) / elapsed, 2),
+                "error_rate": round(self.errors[endpoint] / len(values), 4),
+                "p50_ms": round(float(np.percentile(ms, 50)), 2),
+                "p95_ms": round(float(np.percentile(ms, 95)), 2),
+                "p99_ms": round(float(np.percentile(ms, 99)), 2),
+                "max_ms": round(float(ms.max()), 2),
+                "statuses": dict(self.statuses[endpoint]),
+            }
+        return report
+
+
+class TrafficMix:
+    def __init__(self, weights: dict, burst: int, seed: int = 0):
+        self.actions = list(weights)
+        self.weights = [weights[action] for action in self.actions]
+        self.burst = burst
+        self.rng = random.Random(seed)
+        self.features = feature_matrix(2048, seed)
+
+    def pick(self) -> str:
+        return self.rng.choices(self.actions, self.weights)[0]
+
+    def patient(self) -> dict:
+        row = self.features[self.rng.randrange(len(self.features))]
+        payload = {name: (float(value) if name == "oldpeak" else int(value)) for name, value in zip(FEATURE_COLUMNS, row)}
+        payload.update(name=f"Load Patient {self.rng.randrange(PATIENT_POOL):04d}", contact="+971500000000",
+                       doctor_id=self.rng.randint(1, 3))
+        return payload
+
+
+async def timed(client: httpx.AsyncClient, recorder: Recorder, endpoint: str, method: str, path: str, **kwargs):
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, path, **kwargs)
+        status = response.status_code
+    except Exception as e:
+        status = type(e).__name__
+    recorder.record(endpoint, time.perf_counter() - started, status)
+
+
+async def virtual_user(client, recorder: Recorder, mix: TrafficMix, deadline: float, think_ms: float):
+    while time.perf_counter() < deadline:
+        action = mix.pick()
+        if action == "predict":
+            await asyncio.gather(*(
+                timed(client, recorder, "POST /predict", "POST", "/predict", json=mix.patient())
+                for _ in range(mix.burst)
+            ))
+        elif action == "dashboard":
+            await timed(client, recorder, "GET /dashboard/stats", "GET", "/dashboard/stats")
+        elif action == "patients":
+            await timed(client, recorder, "GET /patients", "GET", "/patients")
+        elif action == "login":
+            await timed(client, recorder, "POST /doctor/login", "POST", "/doctor/login", json=ADMIN_CREDENTIALS)
+        if think_ms:
+            await asyncio.sleep(mix.rng.uniform(0, 2 * think_ms) / 1000)
+
+
+async def run_level(url: str, concurrency: int, duration: float, mix: TrafficMix, think_ms: float) -> dict:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=concurrency * mix.burst, max_keepalive_connections=concurrency * mix.burst)
+    async with httpx.AsyncClient(base_url=url, timeout=60.0, limits=limits) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(virtual_user(client, recorder, mix, deadline, think_ms) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    endpoints = recorder.summary(elapsed)
+    total = sum(e["requests"] for e in endpoints.values())
+    errors = sum(recorder.errors.values())
+    return {
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 2),
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 2),
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+def print_level(result: dict):
+    print(f"\nconcurrency {result['concurrency']}: {result['requests']} requests, "
+          f"{result['throughput_rps']} req/s, error rate {result['error_rate']:.2%}")
+    print(f"  {'endpoint':<24}{'reqs':>7}{'req/s':>9}{'err%':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for endpoint, e in result["endpoints"].items():
+        print(f"  {endpoint:<24}{e['requests']:>7}{e['throughput_rps']:>9}{e['error_rate'] * 100:>8.2f}"
+              f"{e['p50_ms']:>9}{e['p95_ms']:>9}{e['p99_ms']:>9}{e['max_ms']:>9}")
+
+
+def parse_mix(value: str) -> dict:
+    """'predict=4,dashboard=3,patients=2,login=1' -> weights dict"""
+    weights = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown action '{name}' (choose from {', '.join(DEFAULT_MIX)})")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="CardioAI end-to-end load test")
+    parser.add_argument("--mode", choices=("subprocess", "inprocess"), default="subprocess")
+    parser.add_argument("--url", help="Target an already running server instead of booting one")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes (subprocess mode)")
+    parser.add_argument("--seed-records", type=int, default=1000, help="Records pre-seeded into the temporary database")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="Virtual users per level")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds per concurrency level")
+    parser.add_argument("--burst", type=int, default=4, help="Concurrent /predict calls per predict action")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Mean pause between a user's actions")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="e.g. predict=4,dashboard=3,patients=2,login=1")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args(argv)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    def run_all(url: str) -> list:
+        results = []
+        for concurrency in args.concurrency:
+            mix = TrafficMix(args.mix, args.burst, args.seed + concurrency)
+            result = asyncio.run(run_level(url, concurrency, args.duration, mix, args.think_ms))
+            print_level(result)
+            results.append(result)
+        return results
+
+    if args.url:
+        levels = run_all(args.url.rstrip("/"))
+    else:
+        with ServerUnderTest(args.mode, args.workers, args.seed_records) as server:
+            print(f"API booted ({args.mode}, {args.workers} worker(s)) at {server.url} on {server.db_path}")
+            levels = run_all(server.url)
+
+    if args.output:
+        report = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "config": {
+                "mode": "external" if args.url else args.mode, "workers": args.workers, "seed_records": args.seed_records,
+                "duration_s": args.duration, "burst": args.burst, "think_ms": args.think_ms, "mix": args.mix,
+                "serving_env": {k: v for k, v in os.environ.items() if k.startswith(("PREDICT", "WRITE_GROUP_", "INFERENCE_", "COMPILED_", "CASCADE_", "MODEL_", "DB_POOL_"))},
+            },
+            "levels": levels,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
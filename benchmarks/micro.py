@@ -0,0 +1,295 @@
+"""
+Micro-benchmarks for the backend hot paths.
+
+Covers model inference (single row and batch, compiled engine, cascade and sklearn),
+classify_risk, generate_system_notes, SQLite connection setup, a pooled
+connection borrow, one prediction insert, and every /analytics/* query on
+seeded datasets (1k / 100k / 1M records by default). Results are written as
+JSON and can be compared against a stored baseline:
+
+    python -m benchmarks.micro                                  # run, write benchmarks/results/<timestamp>.json
+    python -m benchmarks.micro --sizes 1000 --only analytics    # subset
+    python -m benchmarks.micro --save-baseline                  # store this run as benchmarks/baseline.json
+    python -m benchmarks.micro --baseline benchmarks/baseline.json --fail-on-regression
+
+A benchmark regresses when its median is more than --tolerance (default 20%)
+slower than the baseline median. Baselines are machine-specific; only compare
+runs from the same host.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.datasets import ensure_dataset, feature_matrix
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+
+SAMPLE_PATIENT = {
+    "name": "Bench Patient", "age": 54, "sex": 1, "contact": "+971500000000", "doctor_id": 1,
+    "cp": 2, "trestbps": 130, "chol": 246, "fbs": 0, "restecg": 1, "thalach": 150,
+    "exang": 0, "oldpeak": 1.0, "slope": 1, "ca": 0, "thal": 2,
+}
+
+
+def measure(fn, number: int = 1, min_runs: int = 5, max_runs: int = 200, budget_seconds: float = 2.0) -> dict:
+    """
+    Time fn() in runs of `number` calls (one warm-up run first) until max_runs
+    or the time budget is reached, but never fewer than min_runs. All figures
+    are seconds per call.
+    """
+    fn()
+    timings = []
+    deadline = time.perf_counter() + budget_seconds
+    while len(timings) < max_runs and (len(timings) < min_runs or time.perf_counter() < deadline):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - started) / number)
+    timings.sort()
+    return {
+        "runs": len(timings),
+        "number": number,
+        "min": timings[0],
+        "median": statistics.median(timings),
+        "mean": statistics.fmean(timings),
+        "p95": timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))],
+        "stdev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+    }
+
+
+class Suite:
+    def __init__(self, only=None, budget_seconds: float = 2.0):
+        self.only = only or []
+        self.budget_seconds = budget_seconds
+        self.results = {}
+
+    def wants(self, name: str) -> bool:
+        return not self.only or any(pattern in name for pattern in self.only)
+
+    def run(self, name: str, fn, **kwargs):
+        if not self.wants(name):
+            return
+        kwargs.setdefault("budget_seconds", self.budget_seconds)
+        result = measure(fn, **kwargs)
+        self.results[name] = result
+        print(f"{name:<48} median {format_seconds(result['median']):>10}   p95 {format_seconds(result['p95']):>10}   ({result['runs']} runs)")
+
+
+def format_seconds(value: float) -> str:
+    if value < 1e-3:
+        return f"{value * 1e6:.1f} us"
+    if value < 1:
+        return f"{value * 1e3:.2f} ms"
+    return f"{value:.2f} s"
+
+
+# --- Benchmark groups ---
+def bench_inference(suite: Suite):
+    from backend.cascade import CascadeForest
+    from backend.registry import LoadedModel, MODELS_DIR, MODEL_FILE, SCALER_FILE
+
+    model_path = os.path.join(MODELS_DIR, MODEL_FILE)
+    scaler_path = os.path.join(MODELS_DIR, SCALER_FILE)
+    single = feature_matrix(1, seed=42)
+    batch = feature_matrix(1000, seed=43)
+    for engine in ("compiled", "sklearn"):
+        if not suite.wants(f"inference.{engine}"):
+            continue
+        loaded = LoadedModel.from_files("bench", model_path, scaler_path, compiled=engine == "compiled")
+        if engine == "compiled" and loaded.engine is None:
+            print("Compiled engine unavailable (verification failed); skipping compiled benchmarks")
+            continue
+        suite.run(f"inference.{engine}.single", lambda: loaded.predict(single))
+        suite.run(f"inference.{engine}.batch_1000", lambda: loaded.predict(batch), min_runs=3)
+        if engine == "compiled":
+            cascade = CascadeForest(loaded.engine)
+            suite.run("inference.cascade.single", lambda: cascade.explain(single))
+            suite.run("inference.cascade.batch_1000", lambda: cascade.explain(batch), min_runs=3)
+
+
+def bench_scoring_helpers(suite: Suite):
+    from backend.config import classify_risk, classify_risk_batch
+    from backend.utils import generate_system_notes
+
+    probabilities = np.random.default_rng(7).random(1000)
+    suite.run("classify_risk", lambda: classify_risk(0.63), number=1000)
+    suite.run("classify_risk_batch_1000", lambda: classify_risk_batch(probabilities), number=10)
+    suite.run("generate_system_notes", lambda: generate_system_notes("High", 0.82, SAMPLE_PATIENT), number=100)
+
+
+def bench_database(suite: Suite, workdir: str):
+    from backend import database
+
+    database.DB_NAME = os.path.join(workdir, "connect.db")
+    database.init_db()
+
+    def connect():
+        database.open_connection().close()
+
+    suite.run("db.connect.sqlite", connect, number=20)
+
+    # Borrow + return through the pool (rollback on release included): what request handlers pay
+    if database.DB_POOL_MAX_SIZE > 0:
+        pool = database.get_pool()
+
+        def acquire():
+            pool.acquire().close()
+
+        suite.run("db.pool.acquire", acquire, number=100)
+
+    if suite.wants("db.insert_record"):
+        from backend.main import PatientData, save_prediction
+
+        data = PatientData(**SAMPLE_PATIENT)
+        conn = database.get_db_connection()
+
+        def insert():
+            save_prediction(conn.cursor(), data, 1, 0.82, "High", "bench", "bench")
+            conn.commit()
+
+        suite.run("db.insert_record", insert, number=20)
+        conn.close()
+
+
+def bench_analytics(suite: Suite, sizes, seed: int):
+    from backend import analytics_cache, database
+    from backend.main import get_analytics_summary, get_doctor_performance, get_monthly_trends, get_risk_distribution
+
+    queries = {
+        "summary": lambda: get_analytics_summary(doctor_id=None),
+        "summary_doctor": lambda: get_analytics_summary(doctor_id=1),
+        "monthly_trends": lambda: get_monthly_trends(doctor_id=None),
+        "risk_distribution": lambda: get_risk_distribution(doctor_id=None),
+        "risk_distribution_doctor": lambda: get_risk_distribution(doctor_id=1),
+        "doctor_performance": lambda: get_doctor_performance(),
+    }
+    live_cache = analytics_cache.CACHE
+    for size in sizes:
+        names = {key: f"analytics.{key}[{size}]" for key in queries}
+        cached_name = f"analytics.summary_cached[{size}]"
+        if not any(suite.wants(name) for name in [*names.values(), cached_name]):
+            continue
+        database.DB_NAME = ensure_dataset(size, seed)
+        database.init_db() # Brings datasets seeded by older versions up to date (e.g. backfills the analytics rollup)
+        analytics_cache.CACHE = analytics_cache.AnalyticsCache(ttl_seconds=0)
+        # The handlers swallow errors and return empty payloads; make sure we time real work
+        total = asyncio.run(get_analytics_summary(doctor_id=None))["total_assessments"]
+        if total != size:
+            raise RuntimeError(f"Dataset {database.DB_NAME} returned {total} records, expected {size}")
+        # Time the queries, not the response cache; then one cache hit for comparison
+        for key, query in queries.items():
+            suite.run(names[key], lambda: asyncio.run(query()), min_runs=3 if size >= 100_000 else 5)
+        cache_dir = tempfile.mkdtemp(prefix="cardioai-bench-cache-")
+        analytics_cache.CACHE = analytics_cache.AnalyticsCache(os.path.join(cache_dir, "cache.db"))
+        try:
+            suite.run(cached_name, lambda: asyncio.run(get_analytics_summary(doctor_id=None)))
+        finally:
+            analytics_cache.CACHE = live_cache
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+# --- Results / baseline ---
+def environment() -> dict:
+    import sklearn
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=BENCH_DIR, timeout=10).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "sklearn": sklearn.__version__,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Print a comparison table; returns the names of regressed benchmarks."""
+    regressions = []
+    base_results = baseline.get("results", {})
+    print(f"\nComparison against baseline ({baseline.get('environment', {}).get('commit')}), tolerance {tolerance:.0%}:")
+    for name, result in results.items():
+        base = base_results.get(name)
+        if base is None:
+            print(f"  {name:<48} new")
+            continue
+        change = result["median"] / base["median"] - 1 if base["median"] else 0.0
+        status = "REGRESSION" if change > tolerance else ("faster" if change < -tolerance else "ok")
+        if status == "REGRESSION":
+            regressions.append(name)
+        print(f"  {name:<48} {format_seconds(base['median']):>10} -> {format_seconds(result['median']):>10}  {change:+7.1%}  {status}")
+    return regressions
+
+
+def write_json(path: str, payload: dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="CardioAI backend micro-benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Seeded record counts for analytics queries")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="+", help="Run benchmarks whose name contains any of these substrings")
+    parser.add_argument("--budget", type=float, default=2.0, help="Time budget per benchmark in seconds")
+    parser.add_argument("--output", help="Results file (default benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", help="Baseline results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed median slowdown vs baseline (0.2 = 20%%)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Also write the results to {DEFAULT_BASELINE}")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    warnings.filterwarnings("ignore", message="Trying to unpickle estimator") # sklearn version skew of the shipped pickles
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+    suite = Suite(args.only, args.budget)
+    workdir = tempfile.mkdtemp(prefix="cardioai-bench-")
+    try:
+        bench_inference(suite)
+        bench_scoring_helpers(suite)
+        bench_database(suite, workdir)
+        bench_analytics(suite, args.sizes, args.seed)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    payload = {"environment": environment(), "sizes": args.sizes, "results": suite.results}
+    output = args.output or os.path.join(RESULTS_DIR, datetime.utcnow().strftime("%Y%m%dT%H%M%SZ") + ".json")
+    write_json(output, payload)
+    print(f"\nResults written to {output}")
+    if args.save_baseline:
+        write_json(DEFAULT_BASELINE, payload)
+        print(f"Baseline saved to {DEFAULT_BASELINE}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(suite.results, json.load(f), args.tolerance)
+        if regressions and args.fail_on_regression:
+            print(f"{len(regressions)} benchmark(s) regressed")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+Latency / accuracy / memory Pareto explorer for forest configurations.
+
+Trains every combination of --grid (n_estimators x max_depth x
+max_leaf_nodes by default) on the cached training dataset, in parallel, and
+measures for each configuration:
+
+    holdout accuracy / ROC AUC      same split as backend.train_model
+    agreement                       share of rows whose risk level matches the production model
+    single / batch latency          compiled-engine explain(), the serving path
+    size                            bundle bytes on disk (and pickle bytes)
+    rss                             resident memory added by loading the bundle in a fresh process
+
+and prints the Pareto frontier over (AUC up, batch latency down, RSS down):
+configurations no other one beats on all three at once.
+
+    python -m benchmarks.pareto --data backend/data/processed.cleveland.data
+    python -m benchmarks.pareto --grid '{"n_estimators": [50, 100], "max_depth": [null, 8]}' --output pareto.json
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import product
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler
+
+from backend.config import classify_risk_batch
+from benchmarks.datasets import feature_matrix
+from benchmarks.micro import environment, format_seconds, measure, write_json
+
+DEFAULT_GRID = {
+    "n_estimators": [25, 50, 100, 200, 400],
+    "max_depth": [None, 4, 8, 12],
+    "max_leaf_nodes": [None, 16, 64],
+}
+
+
+def configurations(grid: dict) -> list:
+    names = list(grid)
+    return [dict(zip(names, values)) for values in product(*(grid[name] for name in names))]
+
+
+def fit_config(params: dict, X, y, seed: int):
+    scaler = StandardScaler().fit(X)
+    model = RandomForestClassifier(**params, random_state=seed, n_jobs=1).fit(scaler.transform(X), y)
+    return model, scaler
+
+
+def _rss_kb() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def _rss_after_load(bundle_dir: str, n_rows: int) -> float:
+    """Runs in a fresh process: MB of resident memory added by loading + scoring a bundle."""
+    from backend.bundle import load_bundle
+
+    matrix = feature_matrix(n_rows, seed=7)
+    before = _rss_kb()
+    engine, _ = load_bundle(bundle_dir)
+    engine.explain(matrix) # Touch the mapped pages the way traffic does
+    return (_rss_kb() - before) / 1024
+
+
+def evaluate_config(params, model, scaler, X_test, y_test, agreement_rows, production_levels, workdir, rss_pool,
+                    budget: float) -> dict:
+    from backend.bundle import write_bundle
+    from backend.forest import compile_forest
+    from backend.train_model import evaluate
+
+    engine = compile_forest(model, scaler)
+    holdout = evaluate(model, scaler, X_test, y_test)
+    levels = classify_risk_batch(engine.predict_proba(agreement_rows)[:, 1])
+    single = agreement_rows[:1]
+    batch = agreement_rows[:1000]
+    single_timing = measure(lambda: engine.explain(single), budget_seconds=budget)
+    batch_timing = measure(lambda: engine.explain(batch), min_runs=3, budget_seconds=budget)
+
+    name = "-".join(f"{key}{value}" for key, value in params.items())
+    bundle_dir = os.path.join(workdir, name)
+    write_bundle(bundle_dir, engine, name)
+    bundle_bytes = sum(os.path.getsize(os.path.join(bundle_dir, f)) for f in os.listdir(bundle_dir))
+    rss_mb = rss_pool.submit(_rss_after_load, bundle_dir, len(batch)).result()
+    shutil.rmtree(bundle_dir, ignore_errors=True)
+    return {
+        "params": params,
+        "trees": engine.n_trees,
+        "nodes": engine.n_nodes,
+        "depth": engine.max_depth,
+        "accuracy": holdout["accuracy"],
+        "roc_auc": holdout["roc_auc"],
+        "agreement": round(float((levels == production_levels).mean()), 4),
+        "single_ms": round(single_timing["median"] * 1e3, 4),
+        "batch_ms": round(batch_timing["median"] * 1e3, 3),
+        "batch_us_per_row": round(batch_timing["median"] / len(batch) * 1e6, 3),
+        "bundle_kb": round(bundle_bytes / 1024, 1),
+        "pickle_kb": round(len(pickle.dumps(model)) / 1024, 1),
+        "rss_mb": round(rss_mb, 2),
+    }
+
+
+def pareto_frontier(results: list) -> list:
+    """Indices of results not dominated on (roc_auc max, batch_ms min, rss_mb min)."""
+    points = np.array([(-r["roc_auc"], r["batch_ms"], r["rss_mb"]) for r in results])
+    frontier = []
+    for i, point in enumerate(points):
+        dominated = np.any(np.all(points <= point, axis=1) & np.any(points < point, axis=1))
+        if not dominated:
+            frontier.append(i)
+    return frontier
+
+
+def production_rows(n_rows: int, X_test) -> np.ndarray:
+    """Rows to compare risk levels on: stored records when the database has them, else synthetic ones."""
+    from backend import database
+    from backend.cascade import stored_features
+
+    rows = np.empty((0, X_test.shape[1]))
+    if os.getenv("DATABASE_URL") or os.path.exists(database.DB_NAME): # Don't create an empty SQLite file
+        try:
+            rows = stored_features(n_rows)
+        except Exception as e:
+            print(f"Could not read stored records ({e}); using synthetic rows")
+    if len(rows) >= 1000:
+        return rows
+    return np.concatenate([X_test, feature_matrix(max(1000, n_rows) - len(X_test), seed=11)])
+
+
+def main(argv=None) -> int:
+    from backend.registry import ModelRegistry
+    from backend.train_model import DATASET_PATH, load_dataset
+
+    parser = argparse.ArgumentParser(description="Train a grid of forests and report the latency/accuracy Pareto frontier")
+    parser.add_argument("--data", default=DATASET_PATH, help="Cached Cleveland-format dataset")
+    parser.add_argument("--grid", type=json.loads, default=DEFAULT_GRID, help="JSON grid of RandomForestClassifier params")
+    parser.add_argument("--jobs", type=int, default=-1, help="Parallel training jobs (-1 = all cores)")
+    parser.add_argument("--rows", type=int, default=5000, help="Rows used for the production agreement rate")
+    parser.add_argument("--budget", type=float, default=0.5, help="Timing budget per latency measurement (s)")
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write all results and the frontier as JSON")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    warnings.filterwarnings("ignore", message="Trying to unpickle estimator")
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+    X, y = load_dataset(args.data)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=args.test_size, random_state=args.seed, stratify=y)
+    production = ModelRegistry().load_active()
+    agreement_rows = production_rows(args.rows, X_test)
+    production_levels = classify_risk_batch(production.predict(agreement_rows)[1][:, 1])
+
+    configs = configurations(args.grid)
+    print(f"Training {len(configs)} configurations on {len(X_train)} rows "
+          f"(production model {production.version}, {len(agreement_rows)} agreement rows)")
+    fitted = Parallel(n_jobs=args.jobs)(delayed(fit_config)(params, X_train, y_train, args.seed) for params in configs)
+
+    # Latency and RSS are measured one configuration at a time so they do not compete for cores
+    workdir = tempfile.mkdtemp(prefix="cardioai-pareto-")
+    results = []
+    try:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                                 max_tasks_per_child=1) as rss_pool:
+            for params, (model, scaler) in zip(configs, fitted):
+                results.append(evaluate_config(params, model, scaler, X_test, y_test, agreement_rows,
+                                               production_levels, workdir, rss_pool, args.budget))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    frontier = set(pareto_frontier(results))
+    print(f"\n  {'':2}{'n_est':>6}{'depth':>6}{'leaves':>7}{'nodes':>8}{'acc':>7}{'auc':>7}{'agree':>8}"
+          f"{'single':>11}{'batch1k':>11}{'bundle':>10}{'rss':>9}")
+    for i in sorted(range(len(results)), key=lambda i: results[i]["batch_ms"]):
+        r = results[i]
+        p = r["params"]
+        print(f"  {'*' if i in frontier else ' ':2}{str(p.get('n_estimators', '')):>6}{str(p.get('max_depth', '')):>6}"
+              f"{str(p.get('max_leaf_nodes', '')):>7}{r['nodes']:>8}{r['accuracy']:>7}{r['roc_auc']:>7}{r['agreement']:>8.2%}"
+              f"{format_seconds(r['single_ms'] / 1e3):>11}{format_seconds(r['batch_ms'] / 1e3):>11}"
+              f"{r['bundle_kb']:>8}kB{r['rss_mb']:>7}MB")
+    print(f"\n* = Pareto frontier over (roc_auc, batch latency, rss): {len(frontier)} of {len(results)} configurations")
+
+    if args.output:
+        write_json(args.output, {
+            "timestamp": datetime.utcnow().isoformat(),
+            "environment": environment(),
+            "production_version": production.version,
+            "dataset": {"path": os.path.abspath(args.data), "train_rows": len(X_train), "test_rows": len(X_test),
+                        "agreement_rows": len(agreement_rows)},
+            "results": results,
+            "frontier": [results[i] for i in sorted(frontier)],
+        })
+        print(f"Report written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""
+Shared fixtures. Every test gets its own SQLite file and analytics cache file
+under tmp_path, so nothing touches backend/cardioai.db or the shared cache in
+the temp directory.
+"""
+import os
+import tempfile
+
+# Module-level defaults are read at import time; point them at a scratch directory first
+_SCRATCH = tempfile.mkdtemp(prefix="cardioai-tests-")
+os.environ.setdefault("CARDIOAI_DB_PATH", os.path.join(_SCRATCH, "import.db"))
+os.environ.setdefault("ANALYTICS_CACHE_PATH", os.path.join(_SCRATCH, "analytics-cache.db"))
+os.environ.setdefault("RESCORE_CHECKPOINT", os.path.join(_SCRATCH, "rescore-checkpoint.json"))
+
+import pytest
+
+from backend import analytics_cache, database
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """A fresh shared analytics cache, installed as the process-wide one."""
+    fresh = analytics_cache.AnalyticsCache(str(tmp_path / "analytics-cache.db"), ttl_seconds=60)
+    monkeypatch.setattr(analytics_cache, "CACHE", fresh)
+    yield fresh
+    fresh.store.close()
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch, cache):
+    """An empty database file that get_db_connection() / open_connection() now use."""
+    path = str(tmp_path / "cardioai.db")
+    monkeypatch.setattr(database, "DB_NAME", path)
+    yield path
+    pool = database._pools.pop((os.getpid(), path), None)
+    if pool is not None:
+        pool.close()
+
+
+@pytest.fixture
+def db(db_path):
+    """A migrated database; yields its path."""
+    database.init_db()
+    return db_path
+
+
+@pytest.fixture
+def client(db):
+    """The API on a migrated test database, with startup (model, batcher, writer) and shutdown run."""
+    from fastapi.testclient import TestClient
+
+    from backend.main import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def token(client):
+    return client.post("/doctor/login", json={"username": "admin", "password": "admin123"}).json()["token"]
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+from backend.analytics_cache import AnalyticsCache
+
+
+class Computation:
+    """An analytics query stand-in that counts its runs."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {"calls": self.calls}
+
+
+def test_hit_until_the_generation_changes(cache):
+    compute = Computation()
+
+    async def scenario():
+        first = await cache.get_or_compute("analytics/summary", compute)
+        second = await cache.get_or_compute("analytics/summary", compute)
+        cache.invalidate()
+        third = await cache.get_or_compute("analytics/summary", compute)
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+    assert first == second == {"calls": 1}
+    assert third == {"calls": 2}
+    stats = cache.stats()
+    assert (stats["hit"], stats["miss"], stats["invalidations"]) == (1, 2, 1)
+
+
+def test_entries_are_per_doctor(cache):
+    compute = Computation()
+
+    async def scenario():
+        await cache.get_or_compute("analytics/summary", compute, doctor_id=1)
+        await cache.get_or_compute("analytics/summary", compute, doctor_id=2)
+        await cache.get_or_compute("analytics/summary", compute, doctor_id=1)
+
+    asyncio.run(scenario())
+    assert compute.calls == 2
+
+
+def test_concurrent_misses_are_coalesced(cache):
+    compute = Computation(delay=0.05)
+
+    async def scenario():
+        return await asyncio.gather(*[cache.get_or_compute("analytics/trends", compute) for _ in range(10)])
+
+    results = asyncio.run(scenario())
+    assert compute.calls == 1
+    assert all(result == {"calls": 1} for result in results)
+    assert cache.stats()["coalesced"] == 9
+
+
+def test_failures_are_not_cached(cache):
+    calls = 0
+
+    async def flaky():
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("database unavailable")
+        return {"ok": True}
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await cache.get_or_compute("dashboard/stats", flaky)
+        return await cache.get_or_compute("dashboard/stats", flaky)
+
+    assert asyncio.run(scenario()) == {"ok": True}
+    assert calls == 2
+
+
+def test_workers_share_entries_and_invalidation(cache, tmp_path):
+    # A second instance on the same file behaves like another uvicorn worker
+    other = AnalyticsCache(cache.store.path, ttl_seconds=60)
+    compute = Computation()
+
+    async def scenario():
+        await cache.get_or_compute("analytics/risk", compute)
+        from_other = await other.get_or_compute("analytics/risk", compute)
+        cache.invalidate()
+        after_write = await other.get_or_compute("analytics/risk", compute)
+        return from_other, after_write
+
+    try:
+        from_other, after_write = asyncio.run(scenario())
+    finally:
+        other.store.close()
+    assert from_other == {"calls": 1}
+    assert after_write == {"calls": 2}
+
+
+def test_disabled_cache_always_computes(tmp_path):
+    disabled = AnalyticsCache(str(tmp_path / "unused.db"), ttl_seconds=0)
+    compute = Computation()
+
+    async def scenario():
+        for _ in range(3):
+            await disabled.get_or_compute("analytics/summary", compute)
+
+    asyncio.run(scenario())
+    assert compute.calls == 3
+    assert not (tmp_path / "unused.db").exists()
+
+
+def test_superseded_entries_are_pruned_on_the_next_save(cache):
+    compute = Computation()
+
+    async def scenario():
+        await cache.get_or_compute("analytics/summary", compute)
+        await cache.get_or_compute("analytics/risk", compute)
+        cache.invalidate()
+        await cache.get_or_compute("analytics/summary", compute)
+
+    asyncio.run(scenario())
+    rows = cache.store._conn().execute("SELECT key, generation FROM entries").fetchall()
+    assert rows == [("analytics/summary", cache.store.generation())]
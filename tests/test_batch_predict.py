@@ -0,0 +1,62 @@
+import math
+
+import numpy as np
+
+from backend.config import RISK_THRESHOLDS, classify_risk, classify_risk_batch
+
+
+def patient(i: int, **overrides) -> dict:
+    return {"name": f"Batch Patient {i}", "age": 45 + i, "sex": i % 2, "doctor_id": 1, "cp": i % 4, "trestbps": 130 + i,
+            "chol": 230 + 5 * i, "fbs": 0, "restecg": 1, "thalach": 155 - 3 * i, "exang": i % 2, "oldpeak": 0.5 * i,
+            "slope": 2, "ca": i % 3, "thal": 3 if i % 2 else 7, **overrides}
+
+
+def test_malformed_rows_get_errors_while_the_rest_score(client):
+    rows = [
+        patient(0),
+        {"name": "Missing Fields", "age": 50},
+        patient(2),
+        "not an object",
+        patient(4, oldpeak=math.nan),
+        patient(5, age="fifty"),
+        patient(6),
+    ]
+    response = client.post("/predict/batch", json=rows)
+    assert response.status_code == 200
+    body = response.json()
+
+    errors = {error["index"]: error["detail"] for error in body["errors"]}
+    assert sorted(errors) == [1, 3, 4, 5]
+    assert errors[1].startswith("Invalid input: ") and "cp" in errors[1]
+    assert errors[4].startswith("NaN or infinite")
+    assert "age" in errors[5]
+    assert (body["scored"], body["failed"]) == (3, 4)
+    scored = [i for i, result in enumerate(body["results"]) if result is not None]
+    assert scored == [0, 2, 6]
+    assert len({body["results"][i]["patient_id"] for i in scored}) == 3
+
+    # A batch row scores exactly as the same patient through /predict
+    single = client.post("/predict", json=patient(2)).json()
+    assert single["risk_score"] == body["results"][2]["risk_score"]
+    assert single["risk_level"] == body["results"][2]["risk_level"]
+
+
+def test_empty_and_oversized_batches_are_rejected(client, monkeypatch):
+    from backend import main
+
+    assert client.post("/predict/batch", json=[]).status_code == 400
+    monkeypatch.setattr(main, "MAX_BATCH_SIZE", 3)
+    assert client.post("/predict/batch", json=[patient(i) for i in range(4)]).status_code == 413
+
+
+def test_vectorized_risk_classification_matches_classify_risk():
+    edges = [RISK_THRESHOLDS["medium"], RISK_THRESHOLDS["high"]]
+    probabilities = np.concatenate([
+        [0.0, 1.0, *edges],
+        np.nextafter(edges, 0.0), np.nextafter(edges, 1.0),
+        np.linspace(0, 1, 1001),
+        np.random.default_rng(0).random(1000),
+    ])
+    assert list(classify_risk_batch(probabilities)) == [classify_risk(float(p)) for p in probabilities]
+    assert list(classify_risk_batch([])) == []
+
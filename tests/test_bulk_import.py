@@ -0,0 +1,85 @@
+"""Streamed CSV / NDJSON import through /predict/import."""
+import json
+
+import pytest
+
+from backend import rollups
+from backend.config import FEATURE_COLUMNS
+from backend.database import db_connection
+
+HEADER = ["name", "doctor_id", "created_at"] + FEATURE_COLUMNS
+
+
+def row(i: int, **overrides) -> dict:
+    values = {"name": f"Import Patient {i}", "doctor_id": 1 + i % 2, "created_at": "", "age": 40 + i, "sex": i % 2,
+              "cp": i % 4, "trestbps": 120 + i, "chol": 210 + i, "fbs": 0, "restecg": 1, "thalach": 160 - i,
+              "exang": i % 2, "oldpeak": 1.5, "slope": 2, "ca": i % 3, "thal": 3}
+    return {**values, **overrides}
+
+
+def import_events(client, token, body: str, content_type: str) -> list:
+    response = client.post("/predict/import", content=body.encode(), headers={
+        "Authorization": f"Bearer {token}", "Content-Type": content_type})
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    from backend import main
+
+    monkeypatch.setattr(main, "IMPORT_CHUNK_SIZE", 4)
+
+
+def test_csv_import_reports_row_errors_across_chunk_boundaries(client, token, small_chunks):
+    rows = [row(i) for i in range(10)]
+    rows[2]["age"] = "old" # Validation error in chunk 1
+    rows[5]["created_at"] = "2024-02-30" # Bad date in chunk 2
+    rows[8]["created_at"] = "2024-01-15T08:30:00" # Backdated
+    lines = [",".join(HEADER)] + [",".join(str(r[column]) for column in HEADER) for r in rows]
+    lines.insert(5, "Broken,1,,42") # Parse error as row 5, right after chunk 1 fills
+    events = import_events(client, token, "\n".join(lines) + "\n", "text/csv")
+
+    errors = {event["row"]: event["detail"] for event in events if event["type"] == "error"}
+    assert sorted(errors) == [3, 5, 7]
+    assert errors[3].startswith("Invalid input: age")
+    assert errors[5].startswith("Could not parse row")
+    assert "created_at" in errors[7]
+    # Chunks of 4 parsed rows: 1-4, 6-9, 10-11 (the unparseable row 5 never enters a chunk)
+    progress = [event for event in events if event["type"] == "progress"]
+    assert [event["rows"] for event in progress] == [4, 9, 11]
+    summary = events[-1]
+    assert (summary["type"], summary["rows"], summary["scored"], summary["failed"], summary["chunks"]) == \
+        ("summary", 11, 8, 3, 3)
+
+    with db_connection() as conn:
+        records = conn.execute("SELECT r.created_at, DATE(r.created_at) = DATE('now') AS today, p.name "
+                               "FROM records r JOIN patients p ON p.id = r.patient_id").fetchall()
+        mismatches = rollups.verify(conn)
+        days = {str(row["day"])[:10]: row["n"] for row in conn.execute(
+            "SELECT day, SUM(assessments) AS n FROM record_daily_stats GROUP BY day").fetchall()}
+    assert len(records) == 8
+    backdated = [r for r in records if r["name"] == "Import Patient 8"]
+    assert str(backdated[0]["created_at"]).startswith("2024-01-15 08:30:00")
+    assert all(r["today"] for r in records if r["name"] != "Import Patient 8") # Filled by the database
+    assert mismatches == []
+    assert days.pop("2024-01-15") == 1
+    assert list(days.values()) == [7]
+
+
+def test_ndjson_import_skips_bad_lines_and_merges_repeat_patients(client, token, small_chunks):
+    lines = [json.dumps(row(i)) for i in range(6)]
+    lines.insert(2, "[1, 2, 3]")
+    lines.insert(4, '{"name": "unterminated"')
+    lines.append(json.dumps(row(0, age=41))) # Same patient again in the last chunk
+    events = import_events(client, token, "\n".join(lines), "application/x-ndjson")
+
+    assert [(event["row"], event["detail"][:20]) for event in events if event["type"] == "error"] == \
+        [(3, "Could not parse row:"), (5, "Could not parse row:")]
+    summary = events[-1]
+    assert (summary["rows"], summary["scored"], summary["failed"]) == (9, 7, 2)
+    with db_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) AS n FROM records").fetchone()["n"] == 7
+        assert conn.execute("SELECT COUNT(*) AS n FROM patients").fetchone()["n"] == 6
+        assert conn.execute("SELECT age FROM patients WHERE name = 'Import Patient 0'").fetchone()["age"] == 41
+        assert rollups.verify(conn) == []
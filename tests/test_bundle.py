@@ -0,0 +1,100 @@
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+from backend.bundle import MANIFEST_FILE, BundleError, BundleSchemaError, load_bundle, verify_bundle, write_bundle
+from backend.config import FEATURE_COLUMNS
+from backend.forest import compile_forest, probe_matrix
+from backend.registry import MODEL_FILE, MODELS_DIR, SCALER_FILE, LoadedModel, ModelRegistry
+
+
+@pytest.fixture(scope="module")
+def shipped():
+    with open(os.path.join(MODELS_DIR, MODEL_FILE), "rb") as f:
+        model = pickle.load(f)
+    with open(os.path.join(MODELS_DIR, SCALER_FILE), "rb") as f:
+        scaler = pickle.load(f)
+    return model, scaler
+
+
+@pytest.fixture
+def bundle_dir(shipped, tmp_path):
+    directory = str(tmp_path / "bundle")
+    write_bundle(directory, compile_forest(*shipped), "v-test")
+    return directory
+
+
+def edit_manifest(directory, **fields):
+    path = os.path.join(directory, MANIFEST_FILE)
+    with open(path) as f:
+        manifest = json.load(f)
+    manifest.update(fields)
+    with open(path, "w") as f:
+        json.dump(manifest, f)
+
+
+def pickle_pair(directory, model, scaler):
+    paths = os.path.join(directory, MODEL_FILE), os.path.join(directory, SCALER_FILE)
+    for path, obj in zip(paths, (model, scaler)):
+        with open(path, "wb") as f:
+            pickle.dump(obj, f)
+    return paths
+
+
+def test_verified_bundle_scores_like_the_engine(shipped, bundle_dir):
+    model, scaler = shipped
+    manifest = verify_bundle(bundle_dir)
+    assert manifest["feature_schema"] == FEATURE_COLUMNS
+    engine, _ = load_bundle(bundle_dir)
+    X = probe_matrix(scaler, model.n_features_in_, n_rows=50)
+    assert np.array_equal(engine.predict_proba(X), compile_forest(model, scaler).predict_proba(X))
+
+
+def test_tampered_array_is_rejected(bundle_dir):
+    path = os.path.join(bundle_dir, "threshold.npy")
+    threshold = np.load(path)
+    threshold[0] += 1.0
+    np.save(path, threshold)
+    with pytest.raises(BundleError, match="threshold.npy"):
+        verify_bundle(bundle_dir)
+
+
+def test_manifest_checksum_mismatch_is_rejected(bundle_dir):
+    edit_manifest(bundle_dir, max_depth=1) # Covered by the checksum: changes how the arrays are walked
+    with pytest.raises(BundleError, match="checksum mismatch"):
+        verify_bundle(bundle_dir)
+
+
+def test_feature_schema_mismatch_is_rejected(bundle_dir):
+    edit_manifest(bundle_dir, feature_schema=FEATURE_COLUMNS[::-1])
+    with pytest.raises(BundleSchemaError):
+        verify_bundle(bundle_dir)
+
+
+def test_pickles_with_another_feature_count_are_rejected(tmp_path):
+    X = np.random.default_rng(0).normal(size=(40, len(FEATURE_COLUMNS) - 1))
+    y = (X[:, 0] > 0).astype(int)
+    scaler = StandardScaler().fit(X)
+    model = RandomForestClassifier(n_estimators=3, random_state=0).fit(scaler.transform(X), y)
+    with pytest.raises(BundleSchemaError, match="12 features"):
+        LoadedModel.from_files("v-short", *pickle_pair(str(tmp_path), model, scaler))
+
+
+def test_pickles_with_other_feature_names_are_rejected(shipped, tmp_path):
+    model, _ = shipped
+    renamed = [f"feature_{i}" for i in range(len(FEATURE_COLUMNS))]
+    scaler = StandardScaler().fit(pd.DataFrame(np.random.default_rng(0).normal(size=(40, len(renamed))), columns=renamed))
+    with pytest.raises(BundleSchemaError, match="feature_0"):
+        LoadedModel.from_files("v-renamed", *pickle_pair(str(tmp_path), model, scaler))
+
+    registry = ModelRegistry(registry_dir=str(tmp_path / "registry"))
+    with pytest.raises(BundleSchemaError):
+        registry.register(*pickle_pair(str(tmp_path), model, scaler), version="v-renamed")
+    assert not os.path.exists(tmp_path / "registry" / "v-renamed")
+    assert "v-renamed" not in registry.read_manifest()["versions"]
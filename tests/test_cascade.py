@@ -0,0 +1,65 @@
+"""Early exits must agree with the full forest away from the risk thresholds; rescoring is not counted as traffic."""
+import os
+
+import numpy as np
+import pytest
+
+from backend.cascade import THRESHOLDS, CascadeForest
+from backend.config import classify_risk_batch
+from backend.forest import probe_matrix
+from backend.metrics import CASCADE_ANSWERS
+from backend.registry import MODEL_FILE, MODELS_DIR, SCALER_FILE, LoadedModel
+from backend.rescore import Rescorer
+
+
+@pytest.fixture(scope="module")
+def loaded():
+    return LoadedModel.from_files("test-cascade", os.path.join(MODELS_DIR, MODEL_FILE),
+                                  os.path.join(MODELS_DIR, SCALER_FILE), cascade={"min_rows": 0})
+
+
+def answers() -> dict:
+    return dict(CASCADE_ANSWERS._values)
+
+
+def test_early_exits_agree_with_the_full_forest_outside_the_margin(loaded):
+    engine, cascade = loaded.engine, loaded.cascade
+    X = np.vstack([probe_matrix(loaded.scaler, loaded.n_features, n_rows=2000, seed=seed) for seed in range(3)])
+    X = np.vstack([X, np.round(X)])
+    _, full, _ = engine.explain(X)
+    _, tiered, _, early = cascade.explain(X)
+
+    assert 0.1 < early.mean() < 0.9
+    # Rows that walked every tree are the full forest, bit for bit
+    assert np.array_equal(tiered[~early], full[~early])
+    # Rows answered early were clear of every threshold by more than the margin...
+    assert (np.abs(tiered[early, 1][:, None] - THRESHOLDS) > cascade.margin).all()
+    # ...and land in the full forest's risk level, except (rarely) where the full forest itself is near a threshold
+    agree = classify_risk_batch(tiered[early, 1]) == classify_risk_batch(full[early, 1])
+    clear = (np.abs(full[early, 1][:, None] - THRESHOLDS) > cascade.margin).all(axis=1)
+    assert agree[clear].mean() >= 0.999
+    assert agree.mean() >= 0.998 # Synthetic probes spread wider than real patients (99.995% on stored records)
+
+
+def test_small_batches_skip_the_cascade(loaded):
+    X = probe_matrix(loaded.scaler, loaded.n_features, n_rows=8)
+    cascade = CascadeForest(loaded.engine, min_rows=256)
+    _, probabilities, _, early = cascade.explain(X)
+    assert not early.any()
+    assert np.array_equal(probabilities, loaded.engine.explain(X)[1])
+
+
+def test_served_rows_count_tiers_but_rescoring_does_not(client, loaded, tmp_path):
+    X = probe_matrix(loaded.scaler, loaded.n_features, n_rows=300)
+    before = answers()
+    loaded.explain(X)
+    served = answers()
+    assert sum(served.values()) - sum(before.values()) == 300
+
+    client.post("/predict/batch", json=[{
+        "name": f"Cascade Patient {i}", "age": 40 + i, "sex": i % 2, "doctor_id": 1, "cp": i % 4, "trestbps": 130,
+        "chol": 240, "fbs": 0, "restecg": 1, "thalach": 150 - i, "exang": 0, "oldpeak": 1.0, "slope": 2,
+        "ca": 0, "thal": 3} for i in range(20)])
+    state = Rescorer(loaded, chunk_size=10, max_duty=1.0, checkpoint_path=str(tmp_path / "checkpoint.json")).run()
+    assert state["updated"] == 20
+    assert answers() == served
@@ -0,0 +1,54 @@
+"""The compiled engine must reproduce sklearn on the shipped model, split boundaries included."""
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from backend.forest import compile_forest, fold_thresholds, probe_matrix, verification_matrix
+from backend.registry import MODEL_FILE, MODELS_DIR, SCALER_FILE
+
+
+@pytest.fixture(scope="module")
+def shipped():
+    with open(os.path.join(MODELS_DIR, MODEL_FILE), "rb") as f:
+        model = pickle.load(f)
+    with open(os.path.join(MODELS_DIR, SCALER_FILE), "rb") as f:
+        scaler = pickle.load(f)
+    return model, scaler, compile_forest(model, scaler)
+
+
+def sklearn_proba(model, scaler, X):
+    return model.predict_proba(scaler.transform(X))
+
+
+def test_predict_matches_sklearn_on_grid_and_boundary_rows(shipped):
+    model, scaler, engine = shipped
+    X = verification_matrix(engine, scaler, model.n_features_in_)
+    classes, probabilities = engine.predict(X)
+
+    assert np.array_equal(probabilities, sklearn_proba(model, scaler, X))
+    assert np.array_equal(classes, model.classes_[probabilities.argmax(axis=1)])
+
+
+def test_explain_matches_sklearn_and_attributions_sum_to_probability(shipped):
+    model, scaler, engine = shipped
+    X = np.vstack([probe_matrix(scaler, model.n_features_in_, n_rows=200, seed=3),
+                   np.round(probe_matrix(scaler, model.n_features_in_, n_rows=200, seed=4))])
+    for rows in (X[:10], X): # Both contribution paths: single gather below 64 rows, per feature above
+        _, probabilities, contributions = engine.explain(rows)
+        assert np.allclose(probabilities, sklearn_proba(model, scaler, rows), atol=1e-12)
+        assert contributions.shape == rows.shape
+        assert np.allclose(contributions.sum(axis=1), probabilities[:, 1] - engine.bias[1], atol=1e-9)
+
+
+def test_folded_thresholds_are_the_exact_float32_boundary():
+    threshold = np.array([-1.5, -0.25, 0.0, 0.5, 2.25])
+    mean, scale = np.float64(54.6), np.float64(8.96)
+    folded = fold_thresholds(threshold, mean, scale)
+
+    def goes_left(x):
+        return ((x - mean) / scale).astype(np.float32) <= threshold
+
+    assert goes_left(folded).all()
+    assert not goes_left(np.nextafter(folded, np.inf)).any()
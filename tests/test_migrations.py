@@ -0,0 +1,83 @@
+import threading
+
+from backend import migrations
+from backend.database import open_connection
+
+
+def test_fresh_database_gets_every_migration_once(db_path):
+    conn = open_connection()
+    try:
+        applied = migrations.migrate(conn)
+        assert [version for version, _ in applied] == [version for version, _, _ in migrations.MIGRATIONS]
+        assert migrations.applied_versions(conn) == {version for version, _, _ in migrations.MIGRATIONS}
+        assert max(migrations.applied_versions(conn)) == migrations.LATEST_VERSION
+    finally:
+        conn.close()
+
+
+def test_migrate_is_idempotent(db_path):
+    conn = open_connection()
+    try:
+        migrations.migrate(conn)
+        tables = conn.execute("SELECT name, sql FROM sqlite_master ORDER BY name").fetchall()
+        doctors = conn.execute("SELECT COUNT(*) AS n FROM doctors").fetchone()["n"]
+
+        assert migrations.migrate(conn) == []
+        assert migrations.migrate(conn) == []
+        assert conn.execute("SELECT name, sql FROM sqlite_master ORDER BY name").fetchall() == tables
+        assert conn.execute("SELECT COUNT(*) AS n FROM doctors").fetchone()["n"] == doctors
+        assert conn.execute("SELECT COUNT(*) AS n FROM schema_migrations").fetchone()["n"] == len(migrations.MIGRATIONS)
+    finally:
+        conn.close()
+
+
+def test_concurrent_migrations_apply_once(db_path):
+    results, errors = [], []
+    barrier = threading.Barrier(4)
+
+    def run():
+        conn = open_connection()
+        try:
+            barrier.wait()
+            results.append(migrations.migrate(conn))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sum(1 for applied in results if applied) == 1
+    conn = open_connection()
+    try:
+        assert conn.execute("SELECT COUNT(*) AS n FROM schema_migrations").fetchone()["n"] == len(migrations.MIGRATIONS)
+    finally:
+        conn.close()
+
+
+def test_migration_invalidates_the_analytics_cache(db_path, cache):
+    generation = cache.store.generation()
+    conn = open_connection()
+    try:
+        migrations.migrate(conn)
+        assert cache.store.generation() == generation + 1
+        migrations.migrate(conn) # Nothing applied: nothing to invalidate
+        assert cache.store.generation() == generation + 1
+    finally:
+        conn.close()
+
+
+def test_patients_are_not_indexed_by_name(db_path):
+    conn = open_connection()
+    try:
+        migrations.migrate(conn)
+        indexes = {row["name"] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()}
+        assert "idx_patients_identity_key" in indexes
+        assert "idx_patients_name" not in indexes
+    finally:
+        conn.close()
@@ -0,0 +1,70 @@
+"""Patients are found or created by identity key: normalized name + contact."""
+from backend import migrations
+from backend.database import db_connection, open_connection
+from backend.utils import patient_identity_key
+
+PATIENT = {
+    "name": "Amélie Durand", "age": 58, "sex": 0, "doctor_id": 1, "cp": 2, "trestbps": 140, "chol": 250,
+    "fbs": 0, "restecg": 1, "thalach": 140, "exang": 0, "oldpeak": 1.2, "slope": 2, "ca": 0, "thal": 3,
+}
+
+
+def test_identity_key_ignores_case_spacing_and_unicode_form():
+    key = patient_identity_key("Amélie Durand")
+    assert patient_identity_key("  AMÉLIE   durand ") == key
+    assert patient_identity_key("Amélie Durand") == key # Combining accent (NFD) vs precomposed
+    assert patient_identity_key("Ａmélie Durand") == key # Fullwidth letter (NFKC)
+    assert patient_identity_key("Straße") == patient_identity_key("STRASSE") # casefold, not lower
+
+
+def test_identity_key_keeps_only_phone_digits():
+    key = patient_identity_key("Jo", "+33 (0)6 12-34.56/78")
+    assert key == "jo|+330612345678"
+    assert patient_identity_key("Jo", "+33 0612345678") == key
+    assert patient_identity_key("Jo", "0612345678") != key # A leading + is significant
+    assert patient_identity_key("Jo", "Jo@Example.com") == "jo|jo@example.com" # Not a phone: kept as text
+
+
+def test_patients_sharing_a_name_but_not_a_contact_stay_apart():
+    assert patient_identity_key("Jo", "0611111111") != patient_identity_key("Jo", "0622222222")
+    assert patient_identity_key("Jo") != patient_identity_key("Jo", "0611111111")
+
+
+def test_upsert_returns_the_existing_patient(client):
+    first = client.post("/patients", json={"name": "Amélie Durand", "age": 57, "sex": 0}).json()["id"]
+    again = client.post("/patients", json={"name": "  amélie  DURAND", "age": 58, "sex": 0}).json()["id"]
+    other = client.post("/patients", json={"name": "Amélie Durand", "age": 30, "sex": 0, "contact": "0611"}).json()["id"]
+    predicted = client.post("/predict", json={**PATIENT, "name": "AMÉLIE DURAND"}).json()["patient_id"]
+
+    assert again == first == predicted
+    assert other != first
+    with db_connection() as conn:
+        row = conn.execute("SELECT age, risk_level FROM patients WHERE id = ?", (first,)).fetchone()
+        assert conn.execute("SELECT COUNT(*) AS n FROM patients").fetchone()["n"] == 2
+    assert row["age"] == 58 # Refreshed by the later upserts
+    assert row["risk_level"] != "Unknown"
+
+
+def test_migration_merges_patients_sharing_a_key(db_path, monkeypatch):
+    conn = open_connection()
+    try:
+        monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS[:-1])
+        migrations.migrate(conn) # A database from before the identity key
+        for name, contact, updated in [("Jo Smith", None, "2024-01-01"), ("JO  SMITH", None, "2024-03-01"),
+                                       ("Jo Smith", "0611", "2024-02-01"), ("jo smith", None, "2024-02-01")]:
+            conn.execute("INSERT INTO patients (name, contact, last_updated) VALUES (?, ?, ?)", (name, contact, updated))
+        for patient_id in (1, 2, 2, 3, 4):
+            conn.execute("INSERT INTO records (patient_id, risk_level, doctor_id) VALUES (?, 'Low', 1)", (patient_id,))
+        conn.execute("INSERT INTO feedbacks (patient_id, name, rating) VALUES (4, 'jo smith', 5)")
+        conn.commit()
+        monkeypatch.undo()
+
+        assert [version for version, _ in migrations.migrate(conn)] == [6]
+        patients = conn.execute("SELECT id, identity_key, last_updated FROM patients ORDER BY id").fetchall()
+        assert [(row["id"], row["identity_key"]) for row in patients] == [(1, "jo smith|"), (3, "jo smith|0611")]
+        assert str(patients[0]["last_updated"]).startswith("2024-03-01")
+        records = conn.execute("SELECT patient_id, COUNT(*) AS n FROM records GROUP BY patient_id ORDER BY patient_id")
+        assert [(row["patient_id"], row["n"]) for row in records.fetchall()] == [(1, 4), (3, 1)]
+        assert conn.execute("SELECT patient_id FROM feedbacks").fetchone()["patient_id"] == 1
+    finally:
+        conn.close()
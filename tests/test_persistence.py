@@ -0,0 +1,184 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from backend.database import open_connection
+from backend.persistence import DatabaseBusyError, GroupCommitWriter, write_with_retry
+
+
+@pytest.fixture
+def writer(db_path):
+    conn = open_connection()
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)")
+    conn.commit()
+    conn.close()
+    writer = GroupCommitWriter(open_connection, max_group_size=16, max_delay_ms=50)
+    yield writer
+    writer.stop()
+
+
+def insert(name):
+    def write(c):
+        c.execute("INSERT INTO items (name) VALUES (?)", (name,))
+        return c.lastrowid
+    return write
+
+
+def insert_then_fail(name):
+    def write(c):
+        c.execute("INSERT INTO items (name) VALUES (?)", (name,))
+        raise ValueError("job failed after writing")
+    return write
+
+
+def block_until(started, release):
+    def write(c):
+        started.set()
+        release.wait(5)
+        c.execute("INSERT INTO items (name) VALUES ('blocker')")
+    return write
+
+
+def names():
+    conn = open_connection()
+    try:
+        return sorted(row["name"] for row in conn.execute("SELECT name FROM items").fetchall())
+    finally:
+        conn.close()
+
+
+def test_failing_job_is_rolled_back_alone(writer):
+    # Queued before start(), so the writer commits all of them as one group
+    futures = [writer.submit(insert("a")), writer.submit(insert_then_fail("b")), writer.submit(insert("c"))]
+    writer.start()
+
+    assert isinstance(futures[0].result(5), int)
+    with pytest.raises(ValueError):
+        futures[1].result(5)
+    assert isinstance(futures[2].result(5), int)
+    assert names() == ["a", "c"]
+    stats = writer.stats()
+    assert stats["groups"] == 1
+    assert stats["jobs"] == 3
+    assert stats["failed_jobs"] == 1
+
+
+def test_constraint_violation_does_not_undo_earlier_jobs(writer):
+    futures = [writer.submit(insert("x")), writer.submit(insert("x")), writer.submit(insert("y"))]
+    writer.start()
+
+    futures[0].result(5)
+    with pytest.raises(sqlite3.IntegrityError):
+        futures[1].result(5)
+    futures[2].result(5)
+    assert names() == ["x", "y"]
+    assert writer.stats()["groups"] == 1
+
+
+def test_stop_flushes_queued_jobs(writer):
+    writer.start()
+    futures = [writer.submit(insert(f"n{i}")) for i in range(10)]
+    writer.stop()
+
+    assert all(future.done() for future in futures)
+    assert names() == sorted(f"n{i}" for i in range(10))
+
+
+def test_one_group_commit_bumps_the_analytics_generation_once(db_path, cache):
+    conn = open_connection()
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)")
+    conn.commit()
+    conn.close()
+    writer = GroupCommitWriter(open_connection, max_group_size=16, max_delay_ms=50, on_commit=cache.invalidate)
+    generation = cache.store.generation()
+    futures = [writer.submit(insert(f"g{i}")) for i in range(8)]
+    writer.start()
+    try:
+        for future in futures:
+            future.result(5)
+        assert writer.stats()["groups"] == 1
+        assert cache.store.generation() == generation + 1
+        assert cache.stats()["invalidations"] == 1
+
+        # A group in which every job failed changed nothing: no bump
+        with pytest.raises(sqlite3.IntegrityError):
+            writer.write(insert("g0"))
+        assert cache.store.generation() == generation + 1
+    finally:
+        writer.stop()
+
+
+def test_write_submitted_while_stopping_is_committed_inline(writer):
+    started, release = threading.Event(), threading.Event()
+    writer.start()
+    blocker = writer.submit(block_until(started, release))
+    assert started.wait(5)
+    stopper = threading.Thread(target=writer.stop)
+    stopper.start()
+    while not writer._stopping:
+        time.sleep(0.001)
+
+    threading.Timer(0.1, release.set).start()
+    late = writer.submit(insert("late"))
+    # Not stranded behind the stop marker: committed before submit() returned
+    assert late.done()
+    assert isinstance(late.result(), int)
+    stopper.join(5)
+    assert blocker.done() and blocker.exception() is None
+    assert names() == ["blocker", "late"]
+
+
+def test_write_after_stop_commits_inline(writer):
+    writer.start()
+    writer.stop()
+    assert isinstance(writer.write(insert("after"), timeout=1), int)
+    assert names() == ["after"]
+
+
+def test_write_timeout_raises_database_busy(writer):
+    # Never started, so the job waits in the queue past the timeout
+    with pytest.raises(DatabaseBusyError):
+        writer.write(insert("slow"), timeout=0.05)
+    writer.stop() # Leftovers are committed inline
+    assert names() == ["slow"]
+
+
+def test_predict_maps_a_write_timeout_to_503(client, monkeypatch):
+    from backend import main
+
+    started, release = threading.Event(), threading.Event()
+
+    def hold_the_writer(c):
+        started.set()
+        release.wait(5)
+
+    main.writer.submit(hold_the_writer)
+    assert started.wait(5)
+    monkeypatch.setattr(main, "WRITE_TIMEOUT_S", 0.1)
+    try:
+        response = client.post("/predict", json={
+            "name": "Slow Write", "age": 50, "sex": 1, "doctor_id": 1, "cp": 2, "trestbps": 130, "chol": 240,
+            "fbs": 0, "restecg": 1, "thalach": 150, "exang": 0, "oldpeak": 1.0, "slope": 2, "ca": 0, "thal": 3})
+    finally:
+        release.set()
+    assert response.status_code == 503
+    assert response.json()["detail"] == "Database busy. Please try again."
+
+
+def test_write_with_retry_backs_off_then_reports_busy(writer, db_path):
+    def connect():
+        return sqlite3.connect(db_path, timeout=0.01)
+
+    holder = sqlite3.connect(db_path, check_same_thread=False) # Released from a timer thread
+    holder.execute("BEGIN IMMEDIATE")
+    try:
+        with pytest.raises(DatabaseBusyError):
+            write_with_retry(insert("locked-out"), connect, max_retries=3, retry_delay=0.01)
+        threading.Timer(0.05, holder.rollback).start()
+        assert isinstance(write_with_retry(insert("after-wait"), connect, max_retries=8, retry_delay=0.01), int)
+    finally:
+        time.sleep(0.06)
+        holder.close()
+    assert names() == ["after-wait"]
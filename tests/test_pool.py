@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+
+from backend.database import open_connection
+from backend.pool import ConnectionPool, PoolTimeoutError
+
+
+@pytest.fixture
+def pool(db_path):
+    conn = open_connection()
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.commit()
+    conn.close()
+    pool = ConnectionPool(open_connection, min_size=0, max_size=1, timeout=5.0)
+    yield pool
+    pool.close()
+
+
+def test_acquire_times_out_when_every_connection_is_borrowed(pool):
+    held = pool.acquire()
+    started = time.monotonic()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire(timeout=0.1)
+    assert time.monotonic() - started >= 0.1
+    assert pool.stats()["timeouts"] == 1
+    held.close()
+
+    # The slot is free again
+    with pool.connection(timeout=0.1) as conn:
+        assert conn.execute("SELECT 1 AS one").fetchone()["one"] == 1
+
+
+def test_waiter_gets_the_connection_when_it_is_returned(pool):
+    held = pool.acquire()
+    threading.Timer(0.1, held.close).start()
+    with pool.connection(timeout=2.0) as conn:
+        assert conn.execute("SELECT 1 AS one").fetchone()["one"] == 1
+    assert pool.stats()["timeouts"] == 0
+
+
+def test_release_rolls_back_uncommitted_work(pool):
+    conn = pool.acquire()
+    raw = conn.raw
+    conn.execute("INSERT INTO items (name) VALUES ('uncommitted')")
+    assert raw.in_transaction
+    conn.close()
+
+    assert not raw.in_transaction
+    with pool.connection() as conn:
+        assert conn.raw is raw # Same connection reused, without the abandoned transaction
+        assert conn.execute("SELECT COUNT(*) AS n FROM items").fetchone()["n"] == 0
+
+
+def test_close_twice_returns_the_connection_once(pool):
+    conn = pool.acquire()
+    conn.close()
+    conn.close()
+    assert pool.stats()["idle"] == 1
+    with pytest.raises(RuntimeError):
+        conn.execute("SELECT 1")
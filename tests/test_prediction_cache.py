@@ -0,0 +1,67 @@
+import time
+
+from backend.cache import PredictionCache, canonical_features
+
+FEATURES = [63, 1, 3, 145, 233, 1, 0, 150, 0, 2.3, 0, 0, 1]
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = PredictionCache(max_size=2)
+    a, b, c = (cache.key("v1", [i] + FEATURES[1:]) for i in range(3))
+    cache.put(a, "a")
+    cache.put(b, "b")
+    assert cache.get(a) == "a" # a is now the most recently used
+    cache.put(c, "c")
+
+    assert cache.get(b) is None
+    assert (cache.get(a), cache.get(c)) == ("a", "c")
+    stats = cache.stats()
+    assert (stats["size"], stats["evictions"], stats["hits"], stats["misses"]) == (2, 1, 3, 1)
+
+
+def test_entries_expire_after_the_ttl():
+    cache = PredictionCache(max_size=8, ttl_seconds=0.05)
+    key = cache.key("v1", FEATURES)
+    cache.put(key, "fresh")
+    assert cache.get(key) == "fresh"
+    time.sleep(0.08)
+    assert cache.get(key) is None
+    assert cache.stats()["size"] == 0 # The expired entry is dropped on lookup
+
+
+def test_keys_are_rounded_to_six_decimals():
+    cache = PredictionCache()
+    assert cache.key("v1", [2.3000000001] + FEATURES[1:]) == cache.key("v1", [2.3] + FEATURES[1:])
+    assert cache.key("v1", [2.300001] + FEATURES[1:]) != cache.key("v1", [2.3] + FEATURES[1:])
+    assert canonical_features([-0.0, -1e-9]) == (0.0, 0.0)
+    assert str(canonical_features([-1e-9])[0]) == "0.0" # -0.0 folded, so it hashes like 0.0
+    assert cache.key("v1", FEATURES) != cache.key("v2", FEATURES)
+
+
+def test_changing_the_model_version_clears_the_cache():
+    cache = PredictionCache()
+    cache.set_model_version("v1")
+    old = cache.key("v1", FEATURES)
+    cache.put(old, "from v1")
+    assert cache.get(old) == "from v1"
+
+    cache.set_model_version("v2")
+    assert cache.get(old) is None
+    assert cache.stats()["invalidations"] == 1
+    cache.put(old, "late v1 result") # Scored by the previous model while the swap happened
+    assert cache.get(old) is None
+    new = cache.key("v2", FEATURES)
+    cache.put(new, "from v2")
+    assert cache.get(new) == "from v2"
+
+    cache.set_model_version("v2") # Same version: nothing to drop
+    assert cache.get(new) == "from v2"
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_size_zero_disables_the_cache():
+    cache = PredictionCache(max_size=0)
+    key = cache.key("v1", FEATURES)
+    cache.put(key, "value")
+    assert cache.get(key) is None
+    assert cache.stats()["misses"] == 0
@@ -0,0 +1,100 @@
+import os
+
+import pytest
+
+from backend.registry import MODEL_FILE, MODELS_DIR, SCALER_FILE, ModelRegistry
+
+LEGACY_MODEL = os.path.join(MODELS_DIR, MODEL_FILE)
+LEGACY_SCALER = os.path.join(MODELS_DIR, SCALER_FILE)
+ADMIN_PASSWORD = "test-admin-password"
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = ModelRegistry(registry_dir=str(tmp_path / "registry"))
+    yield registry
+    registry.stop_watcher()
+
+
+def test_manifest_round_trip(registry):
+    version = registry.register(LEGACY_MODEL, LEGACY_SCALER, metadata={"trained_by": "test", "cv_best_score": 0.9})
+    assert version == "v1"
+    assert registry.register(LEGACY_MODEL, LEGACY_SCALER) == "v2"
+
+    reopened = ModelRegistry(registry_dir=registry.registry_dir)
+    manifest = reopened.read_manifest()
+    assert sorted(manifest["versions"]) == ["v1", "v2"]
+    entry = manifest["versions"]["v1"]
+    assert (entry["trained_by"], entry["cv_best_score"]) == ("test", 0.9)
+    assert entry["checksum"] == registry.legacy_version()[len("legacy-"):] # Same pickles, same content hash
+    assert entry["bundle_checksum"]
+
+    manifest["active"] = "v2"
+    reopened.write_manifest(manifest)
+    assert registry.read_manifest() == manifest
+    assert not [name for name in os.listdir(registry.registry_dir) if ".tmp-" in name] # Written atomically
+    with pytest.raises(ValueError):
+        registry.register(LEGACY_MODEL, LEGACY_SCALER, version="v1")
+
+
+def test_unknown_versions_are_rejected(registry):
+    registry.register(LEGACY_MODEL, LEGACY_SCALER)
+    assert registry.has_version("v1")
+    assert registry.has_version(registry.legacy_version())
+    for version in ("v9", "legacy-0123456789ab", "../registry", ".", ""):
+        assert not registry.has_version(version)
+
+    with pytest.raises(FileNotFoundError):
+        registry.activate("v9")
+    assert registry.last_activation["state"] == "failed"
+    assert registry.read_manifest()["active"] is None
+
+
+def test_rollback_returns_to_the_previous_version(registry):
+    legacy = registry.legacy_version()
+    assert registry.load_active().version == legacy # Nothing registered yet: the legacy pair serves
+    with pytest.raises(ValueError):
+        registry.rollback()
+
+    registry.register(LEGACY_MODEL, LEGACY_SCALER)
+    registry.activate("v1")
+    assert registry.current.version == "v1"
+    assert (registry.read_manifest()["active"], registry.read_manifest()["previous"]) == ("v1", legacy)
+
+    assert registry.rollback().version == legacy
+    assert registry.current.version == legacy
+    assert (registry.read_manifest()["active"], registry.read_manifest()["previous"]) == (legacy, "v1")
+    assert registry.rollback().version == "v1" # And forward again, still in memory
+
+
+@pytest.fixture
+def admin_env(monkeypatch):
+    monkeypatch.setenv("ADMIN_PASSWORD", ADMIN_PASSWORD)
+
+
+@pytest.mark.parametrize("method, path", [
+    ("get", "/admin/models"),
+    ("post", "/admin/models/v1/activate"),
+    ("post", "/admin/models/rollback"),
+    ("get", "/admin/rescore"),
+    ("post", "/admin/rescore"),
+    ("post", "/admin/rescore/stop"),
+])
+def test_admin_routes_require_the_admin_password(client, token, admin_env, method, path):
+    bearer = {"Authorization": f"Bearer {token}"}
+    assert getattr(client, method)(path).status_code == 401 # Not signed in
+    assert getattr(client, method)(path, headers=bearer).status_code == 403
+    assert getattr(client, method)(path, headers={**bearer, "X-Admin-Password": "wrong"}).status_code == 403
+
+
+def test_admin_password_unlocks_model_administration(client, token, admin_env, registry, monkeypatch):
+    from backend import main
+
+    registry.load_active()
+    monkeypatch.setattr(main, "registry", registry) # Keep the rollback below out of the real manifest
+    headers = {"Authorization": f"Bearer {token}", "X-Admin-Password": ADMIN_PASSWORD}
+    listing = client.get("/admin/models", headers=headers)
+    assert listing.status_code == 200
+    assert listing.json()["serving"]["version"]
+    assert client.post("/admin/models/v9/activate", headers=headers).status_code == 404
+    assert client.post("/admin/models/rollback", headers=headers).status_code == 409 # Nothing to roll back to
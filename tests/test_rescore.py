@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+from backend.database import db_connection
+from backend.rescore import Rescorer, commit_chunk
+
+
+def patients(n: int) -> list:
+    return [{"name": f"Rescore Patient {i}", "age": 30 + i, "sex": i % 2, "doctor_id": 1 + i % 2, "cp": i % 4,
+             "trestbps": 120 + i, "chol": 200 + 3 * i, "fbs": 0, "restecg": 1, "thalach": 170 - i, "exang": i % 2,
+             "oldpeak": round(0.1 * i, 1), "slope": 1 + i % 2, "ca": i % 3, "thal": 3} for i in range(n)]
+
+
+class RecordingRescorer(Rescorer):
+    """Remembers every record id it scored, and optionally how long each chunk should take."""
+
+    def __init__(self, *args, chunk_seconds: float = 0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scored = []
+        self.chunk_seconds = chunk_seconds
+
+    def rescore_chunk(self, rows):
+        self.scored.extend(row["id"] for row in rows)
+        time.sleep(self.chunk_seconds)
+        return super().rescore_chunk(rows)
+
+
+class RecordingEvent(threading.Event):
+    """A stop event whose waits return immediately and are recorded; optionally set after some waits."""
+
+    def __init__(self, set_after: int = None):
+        super().__init__()
+        self.waits = []
+        self.set_after = set_after
+
+    def wait(self, timeout=None):
+        self.waits.append(timeout)
+        if self.set_after is not None and len(self.waits) >= self.set_after:
+            self.set()
+        return self.is_set()
+
+
+@pytest.fixture
+def records(client):
+    assert client.post("/predict/batch", json=patients(23)).json()["scored"] == 23
+    with db_connection() as conn:
+        return [row["id"] for row in conn.execute("SELECT id FROM records ORDER BY id").fetchall()]
+
+
+@pytest.fixture
+def model():
+    from backend.main import registry
+
+    return registry.current
+
+
+def test_interrupted_run_resumes_without_rescoring_twice(records, model, tmp_path):
+    checkpoint = str(tmp_path / "checkpoint.json")
+    chunks = 0
+
+    def crash_on_third_chunk(write):
+        nonlocal chunks
+        chunks += 1
+        if chunks == 3:
+            raise RuntimeError("killed mid-run")
+        return commit_chunk(write)
+
+    # only_stale=False: the checkpoint alone has to prevent repeated work
+    first = RecordingRescorer(model, crash_on_third_chunk, chunk_size=5, max_duty=1.0, checkpoint_path=checkpoint,
+                              only_stale=False)
+    with pytest.raises(RuntimeError):
+        first.run()
+    assert first.state["state"] == "failed"
+    assert first.state["last_id"] == records[9]
+
+    second = RecordingRescorer(model, chunk_size=5, max_duty=1.0, checkpoint_path=checkpoint, only_stale=False)
+    state = second.run()
+    assert state["state"] == "finished"
+    assert state["processed"] == state["updated"] == len(records)
+    assert second.scored == records[10:] # The failed chunk is retried, nothing committed is redone
+    assert first.scored[:10] + second.scored == records
+
+
+def test_stopped_run_resumes_after_the_last_chunk(records, model, tmp_path):
+    checkpoint = str(tmp_path / "checkpoint.json")
+    first = RecordingRescorer(model, chunk_size=5, max_duty=1.0, checkpoint_path=checkpoint, only_stale=False)
+    first.stop_event = RecordingEvent(set_after=2) # stop() while idling after the second chunk
+    assert first.run()["state"] == "stopped"
+    assert first.scored == records[:10]
+
+    second = RecordingRescorer(model, chunk_size=5, max_duty=1.0, checkpoint_path=checkpoint, only_stale=False)
+    assert second.run()["processed"] == len(records)
+    assert first.scored + second.scored == records
+
+
+def test_duty_cycle_throttle_idles_between_chunks(records, model, tmp_path):
+    throttled = RecordingRescorer(model, chunk_size=5, max_duty=0.25, checkpoint_path=str(tmp_path / "a.json"),
+                                  only_stale=False, chunk_seconds=0.02)
+    throttled.stop_event = RecordingEvent()
+    throttled.run()
+    # Busy at most 25% of the time: at least 3x each chunk's work is spent idle
+    assert len(throttled.stop_event.waits) == 5
+    assert all(wait >= 3 * 0.02 for wait in throttled.stop_event.waits)
+
+    full_speed = RecordingRescorer(model, chunk_size=5, max_duty=1.0, checkpoint_path=str(tmp_path / "b.json"),
+                                   only_stale=False)
+    full_speed.stop_event = RecordingEvent()
+    full_speed.run()
+    assert full_speed.stop_event.waits == [0.0] * 5
@@ -0,0 +1,92 @@
+"""The daily rollup must match a fresh aggregation of records after every write path."""
+import json
+
+from backend import rollups
+from backend.database import db_connection
+from backend.rescore import Rescorer
+
+PATIENT = {
+    "name": "Rollup Patient", "age": 60, "sex": 1, "doctor_id": 1, "cp": 3, "trestbps": 150, "chol": 260,
+    "fbs": 0, "restecg": 1, "thalach": 120, "exang": 1, "oldpeak": 2.5, "slope": 2, "ca": 2, "thal": 7,
+}
+
+
+def patient(i: int, **overrides) -> dict:
+    return {**PATIENT, "name": f"Rollup Patient {i}", "age": 35 + i % 40, "thalach": 100 + (7 * i) % 90,
+            "doctor_id": 1 + i % 2, **overrides}
+
+
+def rollup_mismatches() -> list:
+    with db_connection() as conn:
+        return rollups.verify(conn)
+
+
+def record_count() -> int:
+    with db_connection() as conn:
+        return conn.execute("SELECT COUNT(*) AS n FROM records").fetchone()["n"]
+
+
+class InvertedModel:
+    """A model version that flips every probability, so rescoring moves records between risk levels."""
+
+    version = "test-inverted"
+
+    def __init__(self, loaded):
+        self.loaded = loaded
+
+    def explain(self, matrix, count_tiers=True):
+        _, probabilities, contributions = self.loaded.explain(matrix, count_tiers)
+        probabilities = probabilities[:, ::-1].copy()
+        return probabilities.argmax(axis=1), probabilities, contributions
+
+
+def test_rollup_matches_after_predict(client):
+    for i in range(5):
+        assert client.post("/predict", json=patient(i)).status_code == 200
+    assert record_count() == 5
+    assert rollup_mismatches() == []
+
+
+def test_rollup_matches_after_batch_predict(client):
+    response = client.post("/predict/batch", json=[patient(i) for i in range(8)] + [{"name": "incomplete"}])
+    assert response.status_code == 200
+    assert record_count() == 8
+    assert rollup_mismatches() == []
+
+
+def test_rollup_matches_after_bulk_import(client, token):
+    body = "\n".join(json.dumps(patient(i)) for i in range(25))
+    response = client.post("/predict/import", content=body, headers={
+        "Authorization": f"Bearer {token}", "Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    summary = [json.loads(line) for line in response.text.splitlines()][-1]
+    assert (summary["type"], summary["scored"], summary["failed"]) == ("summary", 25, 0)
+    assert record_count() == 25
+    assert rollup_mismatches() == []
+
+
+def test_rollup_matches_after_rescore(client, tmp_path):
+    from backend.main import registry
+
+    client.post("/predict/batch", json=[patient(i) for i in range(12)])
+    with db_connection() as conn:
+        before = conn.execute("SELECT id, risk_level FROM records ORDER BY id").fetchall()
+
+    model = InvertedModel(registry.current)
+    state = Rescorer(model, chunk_size=5, max_duty=1.0, checkpoint_path=str(tmp_path / "checkpoint.json")).run()
+
+    assert state["state"] == "finished"
+    assert state["updated"] == 12
+    with db_connection() as conn:
+        after = conn.execute("SELECT id, risk_level, model_version FROM records ORDER BY id").fetchall()
+    assert all(row["model_version"] == model.version for row in after)
+    assert [row["risk_level"] for row in after] != [row["risk_level"] for row in before]
+    assert rollup_mismatches() == []
+
+
+def test_verify_reports_drift(client):
+    client.post("/predict", json=patient(1))
+    with db_connection() as conn:
+        conn.execute("UPDATE records SET model_probability = model_probability / 2")
+        conn.commit()
+    assert rollup_mismatches() != []
@@ -0,0 +1,43 @@
+"""
+Trains from tests/fixtures/cleveland-synthetic.data: 59 generated rows in the
+UCI processed.cleveland.data format (two with '?'), not patient data.
+"""
+import json
+import os
+
+import numpy as np
+import pytest
+
+from backend import train_model
+from backend.config import FEATURE_COLUMNS
+from backend.registry import MODEL_FILE, SCALER_FILE, LoadedModel
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "cleveland-synthetic.data")
+
+
+def test_load_dataset_drops_missing_rows_and_binarizes_the_target():
+    X, y = train_model.load_dataset(FIXTURE)
+    assert X.shape == (57, len(FEATURE_COLUMNS))
+    assert set(np.unique(y)) == {0, 1}
+
+
+def test_missing_dataset_points_at_download(tmp_path):
+    with pytest.raises(FileNotFoundError, match="--download"):
+        train_model.load_dataset(str(tmp_path / "processed.cleveland.data"))
+
+
+def test_train_from_fixture_writes_loadable_artifacts(tmp_path):
+    output = tmp_path / "models"
+    assert train_model.main(["--data", FIXTURE, "--param-grid", '{"n_estimators": [10], "max_depth": [3]}',
+                             "--cv", "2", "--jobs", "1", "--output", str(output)]) == 0
+
+    metrics = json.loads((output / train_model.METRICS_FILE).read_text())
+    assert metrics["dataset"]["rows"] == 57
+    assert metrics["dataset"]["checksum"] == train_model.dataset_checksum(FIXTURE)
+    assert metrics["params"] == {"n_estimators": 10, "max_depth": 3}
+
+    loaded = LoadedModel.from_files("test", str(output / MODEL_FILE), str(output / SCALER_FILE))
+    X, _ = train_model.load_dataset(FIXTURE)
+    probabilities = loaded.predict(X[:5])[1]
+    assert probabilities.shape == (5, 2)
+    assert np.allclose(probabilities.sum(axis=1), 1.0)